@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Produit K vidéos en un seul job.
+
+- mise en route partagée, une seule fois: la banque d'histoires est complétée d'un coup
+  (generate_story --batch, requêtes concurrentes sur une même session) pendant que les
+  clips probables pour les K vidéos sont sondés, téléchargés et normalisés
+  (select_and_merge --prefetch);
+- chaque vidéo a son répertoire runs/<lot>/<NN>/ (story/, audio/, subs/, selected_media/,
+  final/) et son log; les scripts y sont lancés avec leurs options de chemins;
+- voix, sous-titres, merge et préparation des clips tournent dans le processus du batch
+  (pas de démarrage d'interpréteur ni d'imports par vidéo): une seule session HTTP
+  keep-alive et un seul index de sondes media_probe pour tout le lot; les sous-titres
+  sont construits directement par build_ass.build_ass. Leurs messages vont dans le log de
+  la vidéo, y compris ceux des pools de threads et des ffmpeg qu'elles lancent
+  (log_context). Histoire, rendu et upload restent des processus;
+- deux pools bornés: étapes réseau (histoire depuis la banque, voix, upload) et étapes
+  ffmpeg (merge, rendu). Une vidéo passe au pool CPU dès que sa voix est prête,
+  pendant que les suivantes attendent encore l'API;
+- caches disque communs à toutes les vidéos: téléchargements, mezzanine, index des
+  sondes, TTS, historique des clips. Les merges passent toujours un par un: chaque
+  vidéo voit l'historique mis à jour par la précédente et pioche d'autres clips.
+  --cpu-workers > 1 ne fait que chevaucher les rendus entre eux et avec le merge
+  suivant (les caches partagés sont protégés par verrous, cf. disk_cache).
+
+Le débit est affiché en vidéos/heure.
+"""
+import argparse, contextlib, pathlib, subprocess, sys, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import build_ass
+import downloader
+import log_context
+import media_probe
+import select_and_merge
+import story_bank
+import voice_elevenlabs
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+
+# (étape, pool, script); pool None: calcul local, sans créneau
+STAGES = [
+    ("story",    "net", "generate_story.py"),
+    ("voice",    "net", "voice_elevenlabs.py"),
+    ("captions", None,  "build_ass.py"),
+    ("merge",    "cpu", "select_and_merge.py"),
+    ("render",   "cpu", "render_final.py"),
+    ("upload",   "net", "dropbox_upload.py"),
+]
+
+def stage_args(stage: str, d: pathlib.Path, name: str, args) -> list:
+    st, au = d / "story", d / "audio"
+    return {
+        "story": ["--from-bank", "--title-out", st / "title.txt", "--story-out", st / "story.txt",
+                  "--cta-out", st / "cta.txt"] + (["--bank", args.bank] if args.bank else []),
+        "voice": ["--title-file", st / "title.txt", "--story-file", st / "story.txt", "--cta-file", st / "cta.txt",
+                  "--gap-title", "1.0", "--gap-cta", "1.0", "--out", au / "voice.wav", "--list-file", au / "voice.txt"],
+        "merge": ["--manifest", args.manifest, "--audio", au / "voice.wav", "--out", d / "selected_media" / "merged.mp4",
+                  "--work-dir", d / "selected_media"],
+        "render": ["--video", d / "selected_media" / "merged.mp4", "--audio", au / "voice.wav",
+                   "--subs", d / "subs" / "captions.ass", "--output", d / "final" / name],
+        "upload": ["--file", d / "final" / name, "--remote-dir", args.remote_dir, "--out-link", d / "final" / "dropbox_link.txt"],
+    }[stage]
+
+def run_script(script: str, argv, log: pathlib.Path) -> int:
+    with log.open("a", encoding="utf-8") as f:
+        f.write(f"\n=== {script} {' '.join(map(str, argv))}\n")
+        f.flush()
+        return subprocess.run([sys.executable, str(SCRIPTS / script)] + [str(a) for a in argv],
+                              cwd=ROOT, stdout=f, stderr=subprocess.STDOUT).returncode
+
+class ThreadStreams:
+    """Remplace sys.stdout/sys.stderr: écrit dans le log courant (log_context) s'il y en a un."""
+    def __init__(self, default):
+        self.default = default
+
+    def _target(self):
+        return log_context.current.get() or self.default
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+def run_call(fn, label: str, log: pathlib.Path) -> int:
+    """Appelle fn() dans ce processus, sorties (pools et ffmpeg compris) dans log; renvoie un code de sortie."""
+    with log.open("a", encoding="utf-8") as f, log_context.redirect(f):
+        f.write(f"\n=== {label}\n")
+        try:
+            fn()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                return e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+    return 0
+
+def build_captions(d: pathlib.Path):
+    """Sous-titres de la vidéo d par build_ass.build_ass (mêmes entrées que la CLI build_ass)."""
+    st, au = d / "story", d / "audio"
+    story = (st / "story.txt").read_text(encoding="utf-8", errors="ignore")
+    title, cta = ((st / n).read_text(encoding="utf-8", errors="ignore") if (st / n).exists() else ""
+                  for n in ("title.txt", "cta.txt"))
+    voice = au / "voice.wav"
+    doc = build_ass.build_ass(title, story, cta, build_ass.load_timeline(au / "timeline.json"), None,
+                              media_probe.duration(voice), build_ass.detect_pauses(voice))
+    n = build_ass.count_events(doc)
+    if n == 0:
+        print("[build_ass] Aucun dialogue généré.", file=sys.stderr); sys.exit(2)
+    out = d / "subs" / "captions.ass"
+    out.write_text(doc, encoding="utf-8")
+    print(f"[build_ass] OK -> {out} (events: {n})")
+
+def tail(path: pathlib.Path, n: int = 8) -> str:
+    try:
+        return "\n".join(path.read_text(encoding="utf-8", errors="ignore").splitlines()[-n:])
+    except OSError:
+        return ""
+
+class Batch:
+    def __init__(self, args, lot_dir: pathlib.Path, prefetched: threading.Event, t0: float, session):
+        self.args = args
+        self.session = session  # session HTTP du lot (voix, merge)
+        self.lot_dir = lot_dir
+        self.prefetched = prefetched
+        self.slots = {"net": threading.BoundedSemaphore(args.net_workers),
+                      "cpu": threading.BoundedSemaphore(args.cpu_workers)}
+        self.merge_lock = threading.Lock()  # un merge à la fois (historique des clips)
+        self.busy = {"net": 0.0, "cpu": 0.0, None: 0.0}
+        self.lock = threading.Lock()
+        self.t0 = t0
+
+    def video(self, i: int):
+        """Enchaîne les étapes d'une vidéo; renvoie (chemin final, None) ou (None, étape en échec)."""
+        d = self.lot_dir / f"{i:02d}"
+        for sub in ("story", "audio", "subs", "selected_media", "final"):
+            (d / sub).mkdir(parents=True, exist_ok=True)
+        name = f"{self.lot_dir.name}_{i:02d}.mp4"
+        log = d / "log.txt"
+        for stage, pool, script in STAGES:
+            if stage == "upload" and not self.args.upload:
+                continue
+            if stage == "merge":
+                self.prefetched.wait()
+            with (self.merge_lock if stage == "merge" else contextlib.nullcontext()), \
+                    self.slots.get(pool, contextlib.nullcontext()):
+                t = time.perf_counter()
+                code = self.run_stage(stage, script, d, name, log)
+                dt = time.perf_counter() - t
+            with self.lock:
+                self.busy[pool] += dt
+            at = time.perf_counter() - self.t0
+            if code != 0:
+                print(f"[batch] {i:02d} {stage}: ÉCHEC (code {code}) à {at:.1f}s — {log}\n{tail(log)}", file=sys.stderr)
+                return None, stage
+            print(f"[batch] {i:02d} {stage}: {dt:.1f}s (à {at:.1f}s)")
+        return d / "final" / name, None
+
+    def run_stage(self, stage: str, script: str, d: pathlib.Path, name: str, log: pathlib.Path) -> int:
+        if stage == "captions":
+            return run_call(lambda: build_captions(d), "build_ass.build_ass", log)
+        argv = [str(a) for a in stage_args(stage, d, name, self.args)]
+        main = {"voice": voice_elevenlabs.main, "merge": select_and_merge.main}.get(stage)
+        if main is None:
+            return run_script(script, argv, log)
+        return run_call(lambda: main(argv, self.session), f"{script} {' '.join(argv)}", log)
+
+def start_setup(args, k: int, prefetched: threading.Event, lot_dir: pathlib.Path, session):
+    """Lance la mise en route partagée; renvoie le code de la génération d'histoires (0 si rien à générer)."""
+    def _prefetch():
+        argv = ["--manifest", args.manifest, "--audio", "audio/voice.wav", "--out", "selected_media/merged.mp4",
+                "--prefetch", str(args.expect_dur * k)]
+        code = run_call(lambda: select_and_merge.main(argv, session), "select_and_merge.py --prefetch",
+                        lot_dir / "setup_clips.log")
+        if code != 0:
+            print(f"[batch] préparation des clips en échec (code {code}): chaque merge prépare les siens", file=sys.stderr)
+        prefetched.set()
+    threading.Thread(target=_prefetch, daemon=True).start()
+
+    db = story_bank.connect(args.bank)
+    unused = story_bank.counts(db)["unused"]
+    db.close()
+    need = max(0, k - unused)
+    print(f"[batch] banque: {unused} histoires disponibles, {need} à générer")
+    if need == 0:
+        return 0
+    argv = ["--batch", need, "--concurrency", args.net_workers] + (["--bank", args.bank] if args.bank else [])
+    return run_script("generate_story.py", argv, lot_dir / "setup_stories.log")
+
+def main():
+    ap = argparse.ArgumentParser(description="Produit K vidéos en un job (caches, banque et pools partagés).")
+    ap.add_argument("-k", "--count", type=int, required=True, help="Nombre de vidéos")
+    ap.add_argument("--manifest", default="manifests/horreur.txt")
+    ap.add_argument("--runs-dir", default="runs", help="Un sous-répertoire par lot, puis par vidéo")
+    ap.add_argument("--net-workers", type=int, default=4, help="Étapes réseau simultanées (API, TTS, upload)")
+    ap.add_argument("--cpu-workers", type=int, default=1,
+                    help="Étapes ffmpeg simultanées (chaque ffmpeg utilise déjà tous les cœurs); "
+                         "les merges restent un par un, seuls les rendus se chevauchent")
+    ap.add_argument("--expect-dur", type=float, default=80.0, help="Durée de voix estimée par vidéo (s)")
+    ap.add_argument("--bank", default=None, help="Banque d'histoires (défaut: story_bank.BANK_PATH)")
+    ap.add_argument("--upload", action="store_true", help="Publie chaque vidéo sur Dropbox")
+    ap.add_argument("--remote-dir", default="/horror")
+    args = ap.parse_args()
+    k = max(1, args.count)
+
+    lot_dir = (ROOT / args.runs_dir / time.strftime("%Y%m%d_%H%M%S")).resolve()
+    lot_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    sys.stdout, sys.stderr = ThreadStreams(sys.stdout), ThreadStreams(sys.stderr)
+    # voix (plusieurs requêtes par vidéo) + téléchargements: connexions réutilisées par tout le lot
+    session = downloader.make_session(4 * max(1, args.net_workers))
+    prefetched = threading.Event()
+    if start_setup(args, k, prefetched, lot_dir, session) != 0:
+        print(f"[batch] génération des histoires incomplète — {lot_dir / 'setup_stories.log'}", file=sys.stderr)
+    print(f"[batch] mise en route: histoires prêtes à {time.perf_counter() - t0:.1f}s")
+
+    batch = Batch(args, lot_dir, prefetched, t0, session)
+    with ThreadPoolExecutor(max_workers=k) as ex:
+        results = list(ex.map(batch.video, range(1, k + 1)))
+    media_probe.save_index()
+    wall = time.perf_counter() - t0
+
+    ok = [p for p, err in results if p is not None]
+    failed = {}
+    for _, err in results:
+        if err:
+            failed[err] = failed.get(err, 0) + 1
+    cpu_use = batch.busy["cpu"] / max(wall * args.cpu_workers, 1e-6)
+    print(f"[batch] {len(ok)}/{k} vidéos en {wall:.1f}s -> {3600 * len(ok) / max(wall, 1e-6):.1f} vidéos/heure "
+          f"(pool ffmpeg occupé {100 * cpu_use:.0f} %)"
+          + (f" — échecs: {', '.join(f'{s} x{n}' for s, n in failed.items())}" if failed else ""))
+    for p in ok:
+        print(f"[batch] -> {p}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
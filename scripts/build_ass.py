@@ -1,20 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys, argparse, pathlib, json, re, subprocess
+import sys, argparse, pathlib, json, time
 
-# ---------- Utils ----------
-def ffprobe_duration(path: pathlib.Path) -> float:
-    try:
-        out = subprocess.check_output([
-            "ffprobe","-v","error",
-            "-show_entries","format=duration",
-            "-of","default=nk=1:nw=1",
-            str(path)
-        ], stderr=subprocess.DEVNULL).decode("utf-8","ignore").strip()
-        return max(0.0, float(out))
-    except Exception:
-        return 0.0
+import media_probe
+from text_utils import clean_text, split_sentences
 
+# ---------- Utils ----------
 def ass_ts(sec: float) -> str:
     if sec < 0: sec = 0.0
     h = int(sec // 3600)
@@ -23,19 +14,6 @@ def ass_ts(sec: float) -> str:
     cs = int(round((sec - int(sec)) * 100))
     return f"{h:d}:{m:02d}:{s:02d}.{cs:02d}"
 
-def clean_text(t: str) -> str:
-    t = re.sub(r"\[[^\]]+\]", " ", t)
-    t = re.sub(r"\([^)]+\)", " ", t)
-    t = re.sub(r"(?i)\b(voix\s*\d+|narrateur|narratrice)\s*:\s*", " ", t)
-    t = t.replace("{","(").replace("}",")")
-    t = re.sub(r"\s+"," ", t).strip()
-    return t
-
-def split_sentences(text: str):
-    txt = clean_text(text)
-    parts = re.split(r'(?<=[\.\!\?…])\s+', txt)
-    return [p.strip() for p in parts if p.strip()]
-
 def wrap_words(words, max_words=4, max_lines=3):
     """
     Retourne jusqu'à max_lines, avec max_words par ligne.
@@ -68,164 +46,255 @@ def normalize_blocks(durations, total_window):
         out[-1] += delta
     return out
 
-# ---------- Args ----------
-ap = argparse.ArgumentParser(description="Build ASS subtitles (Title/Story/CTA) aligned to voice.")
-ap.add_argument("--transcript", required=True, help="story/story.txt")
-ap.add_argument("--audio",      required=True, help="audio/voice.wav (fallback duration)")
-ap.add_argument("--out",        default="subs/captions.ass")
-
-ap.add_argument("--title-file", default="story/title.txt")
-ap.add_argument("--cta-file",   default="story/cta.txt")
-ap.add_argument("--timeline",   default="audio/timeline.json")  # produit par voice_elevenlabs.py
-
-# Style
-ap.add_argument("--font",   default="Arial")
-ap.add_argument("--size",   type=int, default=80)
-ap.add_argument("--colour", default="&H00FFFF00")          # JAUNE
-ap.add_argument("--outline-colour", default="&H00000000")  # contour noir
-ap.add_argument("--back-colour",    default="&H64000000")  # fond semi-transparent
-ap.add_argument("--outline", type=int, default=3)
-ap.add_argument("--shadow",  type=int, default=2)
-ap.add_argument("--align",   type=int, default=5)          # centre
-ap.add_argument("--marginv", type=int, default=200)
-
-# Tempo / découpage
-ap.add_argument("--max-words", type=int, default=3)
-ap.add_argument("--max-lines", type=int, default=5)
-ap.add_argument("--lead",  type=float, default=0, help="retire n secondes à la fin de chaque event")
-ap.add_argument("--speed", type=float, default=1, help=">1.0 = affiche moins longtemps (plus 'speed')")
-
-# Clamps
-ap.add_argument("--min-sent", type=float, default=0.80, help="durée min. par phrase")
-ap.add_argument("--min-line", type=float, default=0.35, help="durée min. si on divisait (sécurité)")
-
-args = ap.parse_args()
-
-# ---------- Inputs ----------
-t_story = pathlib.Path(args.transcript)
-t_title = pathlib.Path(args.title_file)
-t_cta   = pathlib.Path(args.cta_file)
-audio   = pathlib.Path(args.audio)
-ass_out = pathlib.Path(args.out)
-ass_out.parent.mkdir(parents=True, exist_ok=True)
-
-if not t_story.exists() or t_story.stat().st_size == 0:
-    print("Transcript histoire manquant/vide", file=sys.stderr); sys.exit(1)
-if not audio.exists() or audio.stat().st_size == 0:
-    print("Audio manquant/vide", file=sys.stderr); sys.exit(1)
-
-story_txt = t_story.read_text(encoding="utf-8", errors="ignore")
-title_txt = t_title.read_text(encoding="utf-8", errors="ignore") if t_title.exists() else ""
-cta_txt   = t_cta.read_text(encoding="utf-8", errors="ignore") if t_cta.exists() else ""
-
-audio_dur = ffprobe_duration(audio)
-
-# ---------- Timeline ----------
-tl = None
-tline = pathlib.Path(args.timeline)
-if tline.exists() and tline.stat().st_size:
+# ---------- Moteur ----------
+# Style et tempo par défaut (mêmes valeurs que la CLI)
+DEFAULT_STYLE = {
+    "font": "Arial",
+    "size": 80,
+    "colour": "&H00FFFF00",          # JAUNE
+    "outline_colour": "&H00000000",  # contour noir
+    "back_colour": "&H64000000",     # fond semi-transparent
+    "outline": 3,
+    "shadow": 2,
+    "align": 5,                      # centre
+    "marginv": 200,
+    "max_words": 3,
+    "max_lines": 5,
+    "lead": 0.0,                     # retire n secondes à la fin de chaque event
+    "speed": 1.0,                    # >1.0 = affiche moins longtemps
+    "min_sent": 0.80,                # durée min. par phrase
+    "min_line": 0.35,
+}
+
+def ass_header(st: dict) -> str:
+    return (
+        "[Script Info]\n"
+        "ScriptType: v4.00+\n"
+        "PlayResX: 1080\n"
+        "PlayResY: 1920\n"
+        "WrapStyle: 2\n"
+        "ScaledBorderAndShadow: yes\n"
+        "YCbCr Matrix: TV.709\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding\n"
+        f"Style: TikTok,{st['font']},{st['size']},{st['colour']},&H00000000,{st['outline_colour']},"
+        f"{st['back_colour']},0,0,0,0,100,100,0,0,1,{st['outline']},{st['shadow']},{st['align']},40,40,{st['marginv']},1\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+
+def segments(title: str, cta: str, tl, audio_dur: float):
+    """(titre, histoire, CTA) en (début, fin) s, depuis timeline.json ou par défaut."""
+    def seg_of(name, fallback_start, fallback_end):
+        if tl and isinstance(tl, dict) and name in tl and isinstance(tl[name], dict):
+            st = tl[name].get("start", fallback_start)
+            en = tl[name].get("end",   fallback_end)
+            if isinstance(st, (int,float)) and isinstance(en, (int,float)) and en > st:
+                return float(st), float(en)
+        return fallback_start, fallback_end
+
+    # Sans timeline: titre dès 0.00, histoire ensuite, CTA à la fin
+    if not tl:
+        title_len = 2.0 if title.strip() else 0.0
+        cta_len   = 2.0 if cta.strip()   else 0.0
+        title_seg = (0.00, title_len)
+        story_seg = (title_len, max(title_len, audio_dur - cta_len))
+        cta_seg   = (story_seg[1], audio_dur) if cta_len > 0 else (0.0, 0.0)
+    else:
+        title_seg = seg_of("title", 0.00, 0.00)
+        story_seg = seg_of("story", 0.00, audio_dur)
+        cta_seg   = seg_of("cta",   0.00, 0.00)
+
+    # Petite sécurité: si le titre commence très près de 0, on le cloue à 0.00
+    if title_seg[0] < 0.25:
+        title_seg = (0.00, title_seg[1])
+    return title_seg, story_seg, cta_seg
+
+def sentence_bounds(sentences, story_seg, tl):
+    """Frontières de phrases en temps audio, réparties au prorata des mots entre des ancres.
+
+    Ancres: début et fin de l'histoire, plus les débuts exacts de timeline.json (voice_elevenlabs,
+    assemblage pcm: frontières de morceaux) si les phrases correspondent au texte. Les débuts
+    marqués "estimate" (prorata des caractères dans un morceau) ne sont pas repris.
+    """
+    W = [len(clean_text(s).split()) for s in sentences]
+    anchors = {0: story_seg[0], len(sentences): story_seg[1]}
+    sent_tl = tl.get("story", {}).get("sentences") if isinstance(tl, dict) and isinstance(tl.get("story"), dict) else None
+    if sent_tl and [x.get("text") for x in sent_tl] == sentences:
+        anchors.update({i: float(x["start"]) for i, x in enumerate(sent_tl) if i and not x.get("estimate")})
+    bounds = [story_seg[0]]
+    keys = sorted(anchors)
+    for a, b in zip(keys, keys[1:]):
+        seg = W[a:b] if sum(W[a:b]) > 0 else [1] * (b - a)
+        for w in seg:
+            bounds.append(bounds[-1] + (w / sum(seg)) * (anchors[b] - anchors[a]))
+        bounds[-1] = anchors[b]
+    return bounds
+
+def build_ass(title: str, story: str, cta: str, timeline=None, style: dict = None,
+              audio_dur: float = 0.0, pauses=None) -> str:
+    """Document ASS complet pour un texte et sa timeline. Fonction pure (aucune E/S).
+
+    timeline: dict de timeline.json (ou None); audio_dur: durée de la voix (sans timeline);
+    pauses: [(début, fin)] de speech_align pour recaler les phrases (None = pas de recalage).
+    """
+    st = dict(DEFAULT_STYLE, **(style or {}))
+    speed = max(st["speed"], 0.01)
+    title_seg, story_seg, cta_seg = segments(title, cta, timeline, audio_dur)
+    events = []
+
+    def push_event(start, end, text_lines):
+        end_eff = max(start, min(end - st["lead"], end))
+        if end_eff <= start:
+            end_eff = min(end, start + 0.15)
+        # IMPORTANT: forcer les sauts de ligne simultanés
+        txt = "\\N".join([ln.strip() for ln in text_lines if ln.strip()])
+        if not txt:
+            return
+        events.append(f"Dialogue: 0,{ass_ts(start)},{ass_ts(end_eff)},TikTok,,0,0,0,,{txt}")
+
+    def lines_of(text):
+        return wrap_words(clean_text(text).split(), max_words=st["max_words"], max_lines=st["max_lines"])
+
+    # 1) Titre (multi-lignes d'un coup)
+    if title.strip() and title_seg[1] > title_seg[0]:
+        s0, e0 = title_seg
+        push_event(s0, s0 + max(0.8, (e0 - s0) / speed), lines_of(title))
+
+    # 2) Histoire: phrase par phrase, chaque phrase en une event multi-lignes.
+    # Fenêtre comprimée à window/speed, min_sent par phrase, curseur avancé des durées
+    # obtenues; les frontières (timeline, pauses) ne fixent que la part de chaque phrase.
+    sentences = split_sentences(story)
+    if sentences and story_seg[1] > story_seg[0]:
+        bounds = sentence_bounds(sentences, story_seg, timeline)
+        if pauses and len(bounds) > 2:
+            import speech_align
+            bounds = speech_align.snap_boundaries(bounds, pauses)
+        window = max(0.1, (story_seg[1] - story_seg[0]) / speed)
+        raw = [max(st["min_sent"], (e0 - s0) / speed) for s0, e0 in zip(bounds, bounds[1:])]
+        t_cursor = story_seg[0]
+        for s, d in zip(sentences, normalize_blocks(raw, window)):
+            push_event(t_cursor, t_cursor + d, lines_of(s))
+            t_cursor += d
+
+    # 3) CTA (multi-lignes d'un coup)
+    if cta.strip() and cta_seg[1] > cta_seg[0]:
+        s0, e0 = cta_seg
+        push_event(s0, s0 + max(0.8, (e0 - s0) / speed), lines_of(cta))
+
+    return ass_header(st) + "".join(ev + "\n" for ev in events)
+
+def count_events(doc: str) -> int:
+    return sum(1 for ln in doc.splitlines() if ln.startswith("Dialogue:"))
+
+def build_many(items, style: dict = None):
+    """Construit les sous-titres de nombreuses histoires dans le même processus.
+
+    items: itérable de dicts {title, story, cta, timeline, audio_dur, pauses}; renvoie [document ASS].
+    """
+    return [build_ass(it.get("title", ""), it.get("story", ""), it.get("cta", ""), it.get("timeline"),
+                      dict(style or {}, **it.get("style", {})), it.get("audio_dur", 0.0), it.get("pauses"))
+            for it in items]
+
+def load_timeline(path: pathlib.Path):
+    if path.exists() and path.stat().st_size:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            pass
+    return None
+
+def detect_pauses(audio: pathlib.Path):
+    """Pauses de la voix (speech_align), ou None si l'analyse est impossible."""
     try:
-        tl = json.loads(tline.read_text(encoding="utf-8"))
-    except Exception:
-        tl = None
-
-def seg_of(name, fallback_start, fallback_end):
-    if tl and isinstance(tl, dict) and name in tl and isinstance(tl[name], dict):
-        st = tl[name].get("start", fallback_start)
-        en = tl[name].get("end",   fallback_end)
-        if isinstance(st, (int,float)) and isinstance(en, (int,float)) and en > st:
-            return float(st), float(en)
-    return fallback_start, fallback_end
-
-# Sans timeline: titre dès 0.00, histoire ensuite, CTA à la fin
-if not tl:
-    title_len = 2.0 if title_txt.strip() else 0.0
-    cta_len   = 2.0 if cta_txt.strip()   else 0.0
-    title_seg = (0.00, title_len)
-    story_seg = (title_len, max(title_len, audio_dur - cta_len))
-    cta_seg   = (story_seg[1], audio_dur) if cta_len > 0 else (0.0, 0.0)
-else:
-    title_seg = seg_of("title", 0.00, 0.00)
-    story_seg = seg_of("story", 0.00, audio_dur)
-    cta_seg   = seg_of("cta",   0.00, 0.00)
-
-# Petitse sécurité: si le titre commence très près de 0, on le cloue à 0.00
-if title_seg[0] < 0.25:
-    title_seg = (0.00, title_seg[1])
-
-# ---------- Header ASS ----------
-hdr = (
-    "[Script Info]\n"
-    "ScriptType: v4.00+\n"
-    "PlayResX: 1080\n"
-    "PlayResY: 1920\n"
-    "WrapStyle: 2\n"
-    "ScaledBorderAndShadow: yes\n"
-    "YCbCr Matrix: TV.709\n\n"
-    "[V4+ Styles]\n"
-    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
-    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
-    "Alignment, MarginL, MarginR, MarginV, Encoding\n"
-    f"Style: TikTok,{args.font},{args.size},{args.colour},&H00000000,{args.outline_colour},"
-    f"{args.back_colour},0,0,0,0,100,100,0,0,1,{args.outline},{args.shadow},{args.align},40,40,{args.marginv},1\n\n"
-    "[Events]\n"
-    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
-)
-
-events = []
-
-def push_event(start, end, text_lines):
-    end_eff = max(start, min(end - args.lead, end))
-    if end_eff <= start:
-        end_eff = min(end, start + 0.15)
-    # IMPORTANT: forcer les sauts de ligne simultanés
-    txt = "\\N".join([ln.strip() for ln in text_lines if ln.strip()])
-    if not txt:
-        return
-    events.append(f"Dialogue: 0,{ass_ts(start)},{ass_ts(end_eff)},TikTok,,0,0,0,,{txt}")
-
-# ---------- 1) Title (multi-lignes d'un coup) ----------
-if title_txt.strip() and title_seg[1] > title_seg[0]:
-    st, en = title_seg
-    dur = max(0.8, (en - st) / max(args.speed, 0.01))
-    words = clean_text(title_txt).split()
-    lines = wrap_words(words, max_words=args.max_words, max_lines=args.max_lines)
-    push_event(st, st + dur, lines)
-
-# ---------- 2) Story : phrase par phrase, chaque phrase en multi-lignes ----------
-story_sentences = split_sentences(story_txt)
-if story_sentences and story_seg[1] > story_seg[0]:
-    W = [len(clean_text(s).split()) for s in story_sentences]
-    total_w = sum(W) if sum(W) > 0 else len(story_sentences)
-    window  = max(0.1, (story_seg[1] - story_seg[0]) / max(args.speed, 0.01))
-
-    raw = [max(args.min_sent, (w / total_w) * window) for w in W]
-    dur_sent = normalize_blocks(raw, window)
-
-    t_cursor = story_seg[0]
-    for s, d in zip(story_sentences, dur_sent):
-        words = clean_text(s).split()
-        lines = wrap_words(words, max_words=args.max_words, max_lines=args.max_lines)
-        # >>> CORRIGÉ : une seule event multi-lignes pour la phrase
-        push_event(t_cursor, t_cursor + d, lines)
-        t_cursor += d
-
-# ---------- 3) CTA (multi-lignes d'un coup) ----------
-if cta_txt.strip() and cta_seg[1] > cta_seg[0]:
-    st, en = cta_seg
-    dur = max(0.8, (en - st) / max(args.speed, 0.01))
-    words = clean_text(cta_txt).split()
-    lines = wrap_words(words, max_words=args.max_words, max_lines=args.max_lines)
-    push_event(st, st + dur, lines)
-
-# ---------- Écriture ----------
-with open(ass_out, "w", encoding="utf-8") as f:
-    f.write(hdr)
-    for ev in events:
-        f.write(ev + "\n")
-
-if not any("Dialogue:" in ev for ev in events):
-    print("[build_ass] Aucun dialogue généré — vérifie title.txt/story.txt/cta.txt et timeline.json.", file=sys.stderr)
-    sys.exit(2)
-
-print(f"[build_ass] OK -> {ass_out} (events: {len(events)})")
+        import speech_align
+        t0 = time.perf_counter()
+        pcm, rate = speech_align.load_pcm(audio)
+        pauses = speech_align.find_pauses(speech_align.rms_envelope(pcm, rate))
+        print(f"[build_ass] alignement: {len(pauses)} pauses ({1000 * (time.perf_counter() - t0):.1f} ms)")
+        return pauses
+    except (ImportError, ValueError, OSError) as e:
+        print(f"[build_ass] alignement ignoré: {e}", file=sys.stderr)
+        return None
+
+# ---------- CLI ----------
+def main():
+    ap = argparse.ArgumentParser(description="Build ASS subtitles (Title/Story/CTA) aligned to voice.")
+    ap.add_argument("--transcript", required=True, help="story/story.txt")
+    ap.add_argument("--audio",      required=True, help="audio/voice.wav (fallback duration)")
+    ap.add_argument("--out",        default="subs/captions.ass")
+
+    ap.add_argument("--title-file", default="story/title.txt")
+    ap.add_argument("--cta-file",   default="story/cta.txt")
+    ap.add_argument("--timeline",   default="audio/timeline.json")  # produit par voice_elevenlabs.py
+
+    # Style
+    d = DEFAULT_STYLE
+    ap.add_argument("--font",   default=d["font"])
+    ap.add_argument("--size",   type=int, default=d["size"])
+    ap.add_argument("--colour", default=d["colour"])
+    ap.add_argument("--outline-colour", default=d["outline_colour"])
+    ap.add_argument("--back-colour",    default=d["back_colour"])
+    ap.add_argument("--outline", type=int, default=d["outline"])
+    ap.add_argument("--shadow",  type=int, default=d["shadow"])
+    ap.add_argument("--align",   type=int, default=d["align"])
+    ap.add_argument("--marginv", type=int, default=d["marginv"])
+
+    # Tempo / découpage
+    ap.add_argument("--max-words", type=int, default=d["max_words"])
+    ap.add_argument("--max-lines", type=int, default=d["max_lines"])
+    ap.add_argument("--lead",  type=float, default=d["lead"], help="retire n secondes à la fin de chaque event")
+    ap.add_argument("--speed", type=float, default=d["speed"], help=">1.0 = affiche moins longtemps (plus 'speed')")
+
+    # Clamps
+    ap.add_argument("--min-sent", type=float, default=d["min_sent"], help="durée min. par phrase")
+    ap.add_argument("--min-line", type=float, default=d["min_line"], help="durée min. si on divisait (sécurité)")
+    ap.add_argument("--no-align", action="store_true", help="ne pas recaler les phrases sur les pauses de la voix")
+    ap.add_argument("--bench", type=int, default=0,
+                    help="Micro-benchmark: construit N fois les sous-titres en mémoire et affiche histoires/s")
+
+    args = ap.parse_args()
+    style = {k: getattr(args, k) for k in DEFAULT_STYLE}
+
+    t_story = pathlib.Path(args.transcript)
+    t_title = pathlib.Path(args.title_file)
+    t_cta   = pathlib.Path(args.cta_file)
+    audio   = pathlib.Path(args.audio)
+    ass_out = pathlib.Path(args.out)
+    ass_out.parent.mkdir(parents=True, exist_ok=True)
+
+    if not t_story.exists() or t_story.stat().st_size == 0:
+        print("Transcript histoire manquant/vide", file=sys.stderr); sys.exit(1)
+    if not audio.exists() or audio.stat().st_size == 0:
+        print("Audio manquant/vide", file=sys.stderr); sys.exit(1)
+
+    item = {
+        "story": t_story.read_text(encoding="utf-8", errors="ignore"),
+        "title": t_title.read_text(encoding="utf-8", errors="ignore") if t_title.exists() else "",
+        "cta":   t_cta.read_text(encoding="utf-8", errors="ignore") if t_cta.exists() else "",
+        "timeline": load_timeline(pathlib.Path(args.timeline)),
+        "audio_dur": media_probe.duration(audio),
+        "pauses": None if args.no_align else detect_pauses(audio),
+    }
+    doc = build_many([item], style)[0]
+
+    if args.bench > 0:
+        t0 = time.perf_counter()
+        build_many([item] * args.bench, style)
+        dt = time.perf_counter() - t0
+        print(f"[build_ass] bench: {args.bench} histoires en {dt * 1000:.1f} ms "
+              f"({args.bench / max(dt, 1e-9):.0f} histoires/s, sans démarrage d'interpréteur)")
+
+    ass_out.write_text(doc, encoding="utf-8")
+
+    n = count_events(doc)
+    if n == 0:
+        print("[build_ass] Aucun dialogue généré — vérifie title.txt/story.txt/cta.txt et timeline.json.", file=sys.stderr)
+        sys.exit(2)
+
+    print(f"[build_ass] OK -> {ass_out} (events: {n})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Planificateur de sélection des clips de fond.
+
+À partir des durées connues (index media_probe) et de la durée cible (voix), choisit
+un ensemble de clips et de sous-plages qui couvre exactement la cible:
+
+- coût d'un clip = préparation (durée à télécharger/normaliser s'il n'a jamais servi)
+  + pénalité de récence (historique d'usage persistant, décroissance exponentielle);
+- les clips sont pris en entier par coût/seconde croissant, puis le reste est comblé
+  par le clip qui coûte/gaspille le moins (best fit);
+- chaque morceau dure au moins min_keep (un reste trop court est pris sur les clips
+  précédents, ou couvert avec le dernier par un clip plus long);
+- un clip utilisé partiellement démarre à un décalage qui varie d'un run à l'autre.
+
+O(n log n): quelques millisecondes pour des milliers de clips.
+"""
+import json, os, pathlib, random
+
+import disk_cache
+
+RECENCY_WEIGHT = 30.0   # pénalité (s équivalentes) d'un clip utilisé au run précédent
+RECENCY_HALF_LIFE = 3.0 # en runs
+GOLDEN = 0.6180339887
+
+def load_history(path: pathlib.Path) -> dict:
+    try:
+        h = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(h, dict) and isinstance(h.get("clips"), dict):
+            return h
+    except Exception:
+        pass
+    return {"run": 0, "clips": {}}
+
+def record_usage(path: pathlib.Path, history: dict, keys):
+    """Incrémente le compteur de runs et marque les clips utilisés; écriture atomique.
+
+    Sous verrou, à partir de la version disque: les runs écrits entre-temps par d'autres
+    processus ne sont pas perdus (history est mis à jour en conséquence).
+    """
+    with disk_cache.locked(path):
+        current = load_history(path)
+        history.clear()
+        history.update(current)
+        history["run"] = int(history.get("run", 0)) + 1
+        for k in keys:
+            e = history["clips"].setdefault(k, {"last_run": 0, "count": 0})
+            e["last_run"] = history["run"]
+            e["count"] = int(e.get("count", 0)) + 1
+        tmp = disk_cache.part_path(path)
+        tmp.write_text(json.dumps(history), encoding="utf-8")
+        os.replace(tmp, path)
+
+def clip_cost(key: str, dur: float, history: dict) -> float:
+    e = history["clips"].get(key)
+    if not e:
+        return dur  # jamais préparé: tout le clip sera téléchargé/normalisé
+    age = max(1, int(history.get("run", 0)) + 1 - int(e.get("last_run", 0)))
+    return RECENCY_WEIGHT * 0.5 ** ((age - 1) / RECENCY_HALF_LIFE)
+
+def start_offset(key: str, dur: float, use: float, history: dict) -> float:
+    """Décalage de la sous-plage: suite à faible discrépance sur le nombre d'usages."""
+    slack = dur - use
+    if slack <= 0.05:
+        return 0.0
+    n = int(history["clips"].get(key, {}).get("count", 0))
+    return round(slack * ((n * GOLDEN) % 1.0), 3)
+
+def plan(clips, target: float, min_keep: float = 1.0, history: dict = None,
+         max_use: float = 0.0, seed=None):
+    """clips: [(clé, durée)]. Renvoie [(clé, début, durée)] couvrant target (ou tout le disponible)."""
+    history = history or {"run": 0, "clips": {}}
+    rng = random.Random(history.get("run", 0) if seed is None else seed)
+    cand = []
+    for key, dur in clips:
+        use = min(dur, max_use) if max_use > 0 else dur
+        if use < min_keep:
+            continue
+        cost = clip_cost(key, dur, history)
+        cand.append((cost / use, rng.random(), key, dur, use, cost))
+    cand.sort()
+
+    picked, covered = [], 0.0
+    rest = []
+    for item in cand:
+        _, _, key, dur, use, _ = item
+        if covered + use <= target + 1e-6:
+            picked.append([key, dur, use])
+            covered += use
+            if covered >= target - 0.05:
+                break
+        else:
+            rest.append(item)
+
+    remain = target - covered
+    if remain > 0.05:
+        if remain < min_keep and picked:
+            need = min_keep - remain
+            spare = sum(p[2] - min_keep for p in picked)
+            if rest and spare >= need - 1e-6:
+                # reste trop court: pris sur les clips pleins, en partant du dernier (chacun garde min_keep)
+                for p in reversed(picked):
+                    give = min(need, p[2] - min_keep)
+                    p[2] -= give
+                    need -= give
+                remain = min_keep
+            else:
+                # sinon un clip plein (le plus court possible) cède sa place à un clip restant
+                # qui couvre sa durée plus le reste
+                for p in sorted(picked, key=lambda p: p[2]):
+                    longer = [(c, d, k) for _, _, k, d, u, c in rest if u >= p[2] + remain - 1e-6]
+                    if longer:
+                        _, d, k = min(longer)
+                        picked.remove(p)
+                        picked.append([k, d, p[2] + remain])
+                        remain = 0.0
+                        break
+        # best fit: parmi les clips restants couvrant le reste, le moins coûteux
+        # (pour un clip jamais préparé, le coût = sa durée: le plus court gaspille le moins).
+        # Un clip resté de côté dépasse toujours le reste: il y en a un dès que rest n'est pas vide.
+        fits = [(c, d, k) for _, _, k, d, u, c in rest if u >= remain - 1e-6]
+        if remain > 0.05 and fits:
+            _, d, k = min(fits)
+            picked.append([k, d, remain])
+
+    out = []
+    for key, dur, use in picked:
+        out.append((key, start_offset(key, dur, use, history), round(use, 3)))
+    return out
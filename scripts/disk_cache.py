@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Utilitaires communs aux caches disque: LRU par mtime, hash de contenu mémorisé.
+
+Convention: le mtime d'une entrée = sa dernière utilisation (touch à chaque hit),
+l'éviction supprime les entrées les plus anciennes jusqu'à repasser sous le budget.
+Plusieurs processus peuvent partager un cache (batch, runs simultanés): fichiers
+temporaires propres à chaque processus/thread (part_path) et verrous inter-processus
+(locked) autour des constructions et des lecture-modification-écriture.
+"""
+import contextlib, hashlib, json, os, pathlib, threading
+
+try:
+    import fcntl
+except ImportError:  # pas de flock (Windows): verrous sans effet
+    fcntl = None
+
+_hash_lock = threading.Lock()
+
+def part_path(path: pathlib.Path) -> pathlib.Path:
+    """Fichier temporaire propre au processus et au thread, publié ensuite par os.replace."""
+    return path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.part")
+
+@contextlib.contextmanager
+def locked(path: pathlib.Path):
+    """Verrou exclusif inter-processus (et inter-threads) sur path, via flock sur <path>.lock."""
+    lock = path.with_name(path.name + ".lock")
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def touch(path: pathlib.Path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+def allocated(st: os.stat_result) -> int:
+    """Octets réellement occupés sur disque (fichiers creux), st_size à défaut."""
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+def entries(cache_dir: pathlib.Path, pattern: str = "*", sizeof=None):
+    out = []
+    for p in cache_dir.glob(pattern):
+        if p.is_file() and not p.name.endswith((".part", ".lock")):
+            st = p.stat()
+            out.append((st.st_mtime, sizeof(st) if sizeof else st.st_size, p))
+    return out
+
+def evict(cache_dir: pathlib.Path, budget_bytes: int, pattern: str = "*", keep=(), sizeof=None) -> int:
+    """Supprime les entrées les moins récemment utilisées au-delà du budget. Renvoie le nb supprimé.
+
+    sizeof(stat) -> taille comptée (défaut st_size; allocated pour des fichiers creux).
+    """
+    if budget_bytes <= 0 or not cache_dir.exists():
+        return 0
+    keep = {pathlib.Path(k).resolve() for k in keep}
+    items = sorted(entries(cache_dir, pattern, sizeof))
+    total = sum(size for _, size, _ in items)
+    removed = 0
+    for _, size, p in items:
+        if total <= budget_bytes:
+            break
+        if p.resolve() in keep:
+            continue
+        try:
+            p.unlink()
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def file_sha256(path: pathlib.Path, memo: pathlib.Path = None) -> str:
+    """sha256 du contenu; mémorisé dans `memo` (JSON) par (chemin, taille, mtime)."""
+    st = path.stat()
+    sig = f"{st.st_size}:{st.st_mtime_ns}"
+    key = str(path.resolve())
+    table = {}
+    if memo is not None:
+        with _hash_lock:
+            try:
+                table = json.loads(memo.read_text(encoding="utf-8"))
+            except Exception:
+                table = {}
+        hit = table.get(key)
+        if hit and hit.get("sig") == sig:
+            return hit["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if memo is not None:
+        with _hash_lock:
+            try:
+                table = json.loads(memo.read_text(encoding="utf-8"))
+            except Exception:
+                table = {}
+            table[key] = {"sig": sig, "sha256": digest}
+            memo.parent.mkdir(parents=True, exist_ok=True)
+            tmp = part_path(memo)
+            tmp.write_text(json.dumps(table), encoding="utf-8")
+            os.replace(tmp, memo)
+    return digest
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Téléchargement des clips du manifeste: concurrent, reprenable, adressé par contenu.
+
+- une seule requests.Session (keep-alive) partagée par un pool borné de workers;
+- écriture dans `<clé>.part`, reprise par HTTP Range si le fichier partiel existe;
+- renommage atomique (os.replace) une fois la taille attendue atteinte;
+- clé de cache = sha256(URL + ETag + Content-Length): réordonner le manifeste
+  ne change rien, et un fichier distant modifié donne une nouvelle entrée.
+"""
+import argparse, hashlib, os, pathlib, sys, threading, time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import disk_cache
+import log_context
+
+CHUNK = 1024 * 256
+
+def make_session(pool: int = 8) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+def cache_key(url: str, etag: str, length) -> str:
+    h = hashlib.sha256()
+    h.update(url.encode("utf-8"))
+    h.update(b"\0" + (etag or "").encode("utf-8"))
+    h.update(b"\0" + str(length if length is not None else "").encode("utf-8"))
+    return h.hexdigest()
+
+def remote_info(session: requests.Session, url: str):
+    """(ETag, Content-Length ou None) via HEAD (suit les redirections Dropbox)."""
+    try:
+        r = session.head(url, allow_redirects=True, timeout=30)
+        if r.status_code < 400:
+            length = r.headers.get("Content-Length")
+            return r.headers.get("ETag", ""), (int(length) if length and length.isdigit() else None)
+    except requests.RequestException:
+        pass
+    return "", None
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.downloads = 0
+        self.resumed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.t0 = time.perf_counter()
+
+    def add(self, **kw):
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def summary(self) -> str:
+        wall = max(time.perf_counter() - self.t0, 1e-6)
+        mb = self.bytes / (1024 * 1024)
+        return (f"{self.downloads} téléchargés ({self.resumed} repris), {self.hits} en cache, "
+                f"{self.failed} échecs — {mb:.1f} Mo en {wall:.2f}s ({mb / wall:.2f} Mo/s)")
+
+def fetch(session: requests.Session, url: str, cache_dir: pathlib.Path, stats: Stats,
+          suffix: str = ".mp4") -> pathlib.Path:
+    etag, length = remote_info(session, url)
+    key = cache_key(url, etag, length)
+    dst = cache_dir / f"{key[:32]}{suffix}"
+    if dst.exists() and (length is None or dst.stat().st_size == length):
+        stats.add(hits=1)
+        return dst
+    # un seul téléchargement par clé, même entre processus (le .part sert à la reprise)
+    with disk_cache.locked(dst):
+        if dst.exists() and (length is None or dst.stat().st_size == length):
+            stats.add(hits=1)
+            return dst
+        return _download(session, url, dst, etag, length, stats)
+
+def _download(session: requests.Session, url: str, dst: pathlib.Path, etag: str, length, stats: Stats) -> pathlib.Path:
+    part = dst.with_name(dst.name + ".part")
+    have = part.stat().st_size if part.exists() else 0
+    if have > 0 and length is not None and have > length:
+        part.unlink()  # partiel plus long que le fichier distant: périmé
+        have = 0
+    headers = {}
+    if have > 0:
+        if length is not None and have == length:
+            os.replace(part, dst)
+            stats.add(hits=1)
+            return dst
+        headers["Range"] = f"bytes={have}-"
+        if etag:
+            headers["If-Range"] = etag
+
+    with session.get(url, headers=headers, stream=True, timeout=60) as r:
+        if r.status_code == 416 and have > 0:
+            # le serveur considère le partiel complet: seulement s'il a bien la taille distante
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            expected = length if length is not None else (int(total) if total.isdigit() else None)
+            if expected == have:
+                os.replace(part, dst)
+                stats.add(downloads=1)
+                return dst
+            print(f"[download] partiel incohérent ({have}/{expected} octets), nouveau téléchargement: {url}",
+                  file=sys.stderr)
+            part.unlink()
+            return _download(session, url, dst, etag, length, stats)
+        r.raise_for_status()
+        resumed = have > 0 and r.status_code == 206
+        if not resumed:
+            have = 0
+        got = 0
+        with open(part, "ab" if resumed else "wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK):
+                if chunk:
+                    f.write(chunk)
+                    got += len(chunk)
+        stats.add(bytes=got, downloads=1, resumed=int(resumed))
+
+    size = part.stat().st_size
+    if length is not None and size != length:
+        raise IOError(f"téléchargement incomplet ({size}/{length} octets), reprise au prochain lancement")
+    os.replace(part, dst)
+    return dst
+
+def fetch_all(urls, cache_dir: pathlib.Path, workers: int = 4, session: requests.Session = None):
+    """Télécharge les URLs en parallèle. Renvoie ({url: chemin ou None}, Stats)."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    session = session or make_session(max(workers, 1))
+    stats = Stats()
+
+    def _one(url):
+        try:
+            return fetch(session, url, cache_dir, stats)
+        except Exception as e:
+            stats.add(failed=1)
+            print(f"[download] Échec ({url}): {e}", file=sys.stderr)
+            return None
+
+    uniq = list(dict.fromkeys(urls))
+    with log_context.Pool(max_workers=max(1, workers)) as ex:
+        paths = dict(zip(uniq, ex.map(_one, uniq)))
+    print(f"[download] {stats.summary()}")
+    return paths, stats
+
+def main():
+    ap = argparse.ArgumentParser(description="Télécharge (avec cache) les URLs d'un manifeste.")
+    ap.add_argument("--manifest",  required=True)
+    ap.add_argument("--cache-dir", default="cache/downloads")
+    ap.add_argument("--workers",   type=int, default=4)
+    args = ap.parse_args()
+
+    from select_and_merge import safe_lines, is_url
+    urls = [u for u in safe_lines(pathlib.Path(args.manifest).read_text(encoding="utf-8")) if is_url(u)]
+    paths, _ = fetch_all(urls, pathlib.Path(args.cache_dir), args.workers)
+    for u in urls:
+        print(f"{paths.get(u) or '-'}\t{u}")
+
+if __name__ == "__main__":
+    main()
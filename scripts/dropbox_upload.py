@@ -1,16 +1,37 @@
 #!/usr/bin/env python3
-import os, sys, json, pathlib, time, subprocess
+import os, sys, json, pathlib, time, subprocess, argparse
 import requests
 
 ROOT = pathlib.Path(__file__).resolve().parent.parent
 OUT_NAME = os.environ.get("OUT_NAME","final_horror.mp4")
-FILE = ROOT / "final_video" / OUT_NAME
-LINK_TXT = ROOT / "final_video" / "dropbox_link.txt"
+
+ap = argparse.ArgumentParser(description="Upload Dropbox de la vidéo finale + lien direct.")
+ap.add_argument("--file",       default=f"final_video/{OUT_NAME}")
+ap.add_argument("--remote-dir", default="/horror")
+ap.add_argument("--out-link",   default="final_video/dropbox_link.txt")
+args = ap.parse_args()
+FILE = pathlib.Path(args.file) if os.path.isabs(args.file) else ROOT / args.file
+LINK_TXT = pathlib.Path(args.out_link) if os.path.isabs(args.out_link) else ROOT / args.out_link
 LINK_TXT.parent.mkdir(parents=True, exist_ok=True)
 
 if not FILE.exists() or FILE.stat().st_size == 0:
     print(f"Fichier absent ou vide: {FILE}", file=sys.stderr); sys.exit(1)
 
+# Seul un rendu "final" est publié (brouillons/revues restent locaux)
+sys.path.insert(0, str(ROOT / "scripts"))
+import media_probe, render_profiles
+# Refus par défaut: fichier illisible ou sans tag de profil = pas publié
+_info = media_probe.probe(FILE)
+_prof = render_profiles.profile_of(_info)
+if _prof != "final":
+    if not _info:
+        why = "sonde ffprobe échouée, profil inconnu"
+    elif not _prof:
+        why = f"tag de profil absent (attendu: {render_profiles.TAG_PREFIX}final)"
+    else:
+        why = f"rendu '{_prof}', pas 'final'"
+    print(f"Upload refusé ({why}): {FILE}", file=sys.stderr); sys.exit(1)
+
 # Auth: priorité au flux Refresh Token
 ACCESS_TOKEN = os.environ.get("DROPBOX_ACCESS_TOKEN","").strip()
 APP_KEY = os.environ.get("DROPBOX_APP_KEY","").strip()
@@ -125,7 +146,7 @@ if not token:
     print("Pas de token Dropbox disponible, upload ignoré.", file=sys.stderr)
     sys.exit(0)  # on ne bloque pas le job
 
-remote_dir = "/horror"
+remote_dir = args.remote_dir.rstrip("/") or "/horror"
 ts = time.strftime("%Y%m%d_%H%M%S")
 remote_path = f"{remote_dir}/{ts}_{FILE.name}"
 
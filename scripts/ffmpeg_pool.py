@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Pool de workers pour lancer plusieurs ffmpeg en parallèle sans surcharger le CPU.
+
+Les cœurs disponibles sont partagés entre les workers: chaque ffmpeg reçoit
+`-threads <cœurs/workers>`, si bien que workers x threads ~= nombre de cœurs.
+"""
+import os
+
+import log_context
+
+def available_cores() -> int:
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+def split_cores(tasks: int, jobs: int = 0):
+    """Retourne (workers, threads_par_worker). jobs=0 -> automatique."""
+    cores = available_cores()
+    workers = jobs if jobs > 0 else cores
+    workers = max(1, min(workers, max(1, tasks), cores))
+    threads = max(1, cores // workers)
+    return workers, threads
+
+def run_ordered(fn, items, workers: int):
+    """Applique fn(item) en parallèle; renvoie [(item, résultat, exception|None)] dans l'ordre d'entrée."""
+    def _safe(item):
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, e
+    if workers <= 1:
+        return [(it, *_safe(it)) for it in items]
+    with log_context.Pool(max_workers=workers) as ex:
+        return [(it, *res) for it, res in zip(items, ex.map(_safe, items))]
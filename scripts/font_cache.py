@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Répertoire de polices (fontsdir) en cache pour l'incrustation des sous-titres ASS.
+
+Les polices citées par le fichier .ass (Fontname des styles, \\fn dans le texte) sont
+résolues une seule fois par fc-match, puis copiées dans cache/fonts/<clé>/ avec un
+manifest.json et un fonts.conf minimal qui ne déclare que ce répertoire (et son propre
+cache fontconfig). Les runs suivants ne relancent pas fc-match. ffmpeg est lancé avec
+FONTCONFIG_FILE=<clé>/fonts.conf (env()): libass, via fontconfig et fontsdir, ne voit
+alors que ces quelques fichiers au lieu de scanner les polices du système.
+"""
+import argparse, hashlib, json, os, pathlib, re, shutil, subprocess, sys, time
+
+import disk_cache
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+CACHE_DIR = pathlib.Path(os.environ.get("FONT_CACHE_DIR", ROOT / "cache" / "fonts"))
+FONT_EXT = {".ttf", ".otf", ".ttc", ".pfb", ".pfa", ".woff", ".woff2"}
+
+def ass_fonts(ass: pathlib.Path) -> list:
+    """Noms de polices utilisés par un fichier ASS (styles + surcharges \\fn), triés."""
+    names, fields, section = set(), None, ""
+    for line in ass.read_text(encoding="utf-8-sig", errors="ignore").splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            section = line.lower()
+            continue
+        if "styles" not in section:
+            names.update(m.strip() for m in re.findall(r"\\fn([^\\}]+)", line))
+            continue
+        key, _, value = line.partition(":")
+        if key == "Format":
+            fields = [f.strip().lower() for f in value.split(",")]
+        elif key == "Style" and fields and "fontname" in fields:
+            parts = [v.strip() for v in value.split(",")]
+            if len(parts) > fields.index("fontname"):
+                names.add(parts[fields.index("fontname")].lstrip("@"))
+    return sorted(n for n in names if n)
+
+def resolve(name: str):
+    """Fichier de police choisi par fontconfig pour name, ou None (fc-match absent)."""
+    try:
+        r = subprocess.run(["fc-match", "-f", "%{file}", name], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    path = pathlib.Path(r.stdout.strip())
+    return path if r.stdout.strip() and path.is_file() else None
+
+FONTS_CONF = """<?xml version="1.0"?>
+<!DOCTYPE fontconfig SYSTEM "fonts.dtd">
+<fontconfig>
+  <dir>{dir}</dir>
+  <cachedir>{dir}/fc-cache</cachedir>
+</fontconfig>
+"""
+
+def conf_path(d: pathlib.Path) -> pathlib.Path:
+    return d / "fonts.conf"
+
+def write_conf(d: pathlib.Path) -> pathlib.Path:
+    """fonts.conf limité au répertoire d (écrit une fois, atomiquement)."""
+    conf = conf_path(d)
+    if not conf.exists():
+        part = disk_cache.part_path(conf)
+        part.write_text(FONTS_CONF.format(dir=d.resolve().as_posix()), encoding="utf-8")
+        os.replace(part, conf)
+    return conf
+
+def env(d: pathlib.Path, base: dict = None) -> dict:
+    """Environnement d'un ffmpeg dont fontconfig ne charge que les polices de d."""
+    return dict(base if base is not None else os.environ, FONTCONFIG_FILE=str(write_conf(d)))
+
+def fontsdir(ass: pathlib.Path, cache_dir: pathlib.Path = None):
+    """Répertoire contenant les polices du fichier ASS (construit au premier appel).
+
+    Renvoie None si aucune police n'a pu être résolue: libass retombe alors sur sa
+    recherche habituelle dans les polices du système.
+    """
+    names = ass_fonts(ass)
+    if not names:
+        return None
+    d = pathlib.Path(cache_dir or CACHE_DIR) / hashlib.sha256("\n".join(names).encode("utf-8")).hexdigest()[:16]
+    manifest = d / "manifest.json"
+    try:
+        known = json.loads(manifest.read_text(encoding="utf-8"))
+        if known and all((d / f).is_file() for f in known.values()):
+            write_conf(d)  # entrées antérieures au fonts.conf
+            return d
+    except Exception:
+        pass
+
+    d.mkdir(parents=True, exist_ok=True)
+    found = {}
+    for name in names:
+        src = resolve(name)
+        if src is None:
+            print(f"[font_cache] police introuvable: {name}", file=sys.stderr)
+            continue
+        dst = d / src.name
+        if not dst.exists():
+            part = disk_cache.part_path(dst)
+            shutil.copyfile(src, part)
+            os.replace(part, dst)
+        found[name] = src.name
+        print(f"[font_cache] {name} -> {src}")
+    part = disk_cache.part_path(manifest)
+    part.write_text(json.dumps(found, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(part, manifest)
+    if not found:
+        return None
+    write_conf(d)
+    return d
+
+def main():
+    ap = argparse.ArgumentParser(description="Prépare (ou affiche) le fontsdir en cache d'un fichier ASS.")
+    ap.add_argument("--subs", default="subs/captions.ass")
+    ap.add_argument("--cache-dir", default=None, help="Défaut: $FONT_CACHE_DIR ou cache/fonts")
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    d = fontsdir(pathlib.Path(args.subs), pathlib.Path(args.cache_dir) if args.cache_dir else None)
+    ms = 1000 * (time.perf_counter() - t0)
+    if d is None:
+        print(f"[font_cache] aucune police en cache pour {args.subs} ({ms:.1f} ms)", file=sys.stderr); sys.exit(1)
+    print(f"[font_cache] {', '.join(sorted(p.name for p in d.iterdir() if p.suffix.lower() in FONT_EXT))} "
+          f"dans {d} ({ms:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,26 @@ Hard requirements:
 - No stage directions / no "SCÈNE", "NARRATEUR", etc. in story.
 - Title: short, punchy, summarizes the story.
 - CTA: 1–2 short lines (subscribe/share).
+
+Batch mode (--batch N): generates N stories concurrently (several per request with
+--per-request), validates them (JSON shape, word count, banned words) and stores the
+valid ones in the local story bank (story_bank.py). --from-bank then serves a story
+from the bank in milliseconds instead of calling the API.
+
+Streaming mode (--stream): reads the SSE token stream, parses the JSON incrementally
+and starts TTS (voice_elevenlabs.Prefetcher) for the title as soon as it closes and for
+each group of completed story sentences, so synthesis overlaps generation. The voice
+stage then finds every segment in the TTS cache.
 """
 
-import os, sys, json, pathlib, textwrap, re
+import os, sys, json, pathlib, textwrap, re, time, argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY".lower())
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")  # tu as demandé gpt-4o
 TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "1"))
+API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com").rstrip("/")
 
 OUT_DIR = pathlib.Path("story")
 TITLE_FILE = OUT_DIR / "title.txt"
@@ -44,6 +56,20 @@ USER_PROMPT = (
 
 DEFAULT_CTA = "Abonne-toi pour d'autres frissons.\nPartage si tu as osé regarder jusqu'au bout."
 
+# Plusieurs histoires par requête (mode batch)
+def batch_prompt(k: int) -> str:
+    return (
+        f"Écris {k} histoires d'horreur atmosphériques DIFFÉRENTES (lieux, personnages, chutes), "
+        "chacune en 180 à 200 mots, sans didascalies (pas d'« intro », « scène », « narrateur »). "
+        "Pour chacune: un TITRE bref qui la résume (6–10 mots max) et un CTA de 1 à 2 lignes. "
+        "Réponds STRICTEMENT en JSON UTF-8: "
+        '{"stories": [{"title": "...", "story": "...", "cta": "..."}, ...]}'
+    )
+
+# Didascalies retirées de l'histoire; grossièretés -> histoire refusée en batch
+STAGE_WORDS = re.compile(r"\b(intro|scène|narrateur|hook|cta)\b", re.I)
+BANNED_WORDS = re.compile(r"\b(putain|merde|connard|connasse|salope|encul\w*|bordel|niqu\w*|batard|bâtard)\b", re.I)
+
 def _clean_text(s: str) -> str:
     """Supprime crochets/parenthèses et espaces multiples."""
     s = s.replace("\r", "")
@@ -53,8 +79,8 @@ def _clean_text(s: str) -> str:
     s = re.sub(r"\n{3,}", "\n\n", s)
     return s.strip()
 
-def call_openai(system_prompt: str, user_prompt: str) -> dict:
-    url = "https://api.openai.com/v1/chat/completions"
+def call_openai(system_prompt: str, user_prompt: str, session: requests.Session = None) -> dict:
+    url = f"{API_BASE}/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json",
@@ -68,7 +94,7 @@ def call_openai(system_prompt: str, user_prompt: str) -> dict:
         ],
         "response_format": {"type": "json_object"},
     }
-    r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=90)
+    r = (session or requests).post(url, headers=headers, data=json.dumps(payload), timeout=90)
     r.raise_for_status()
     data = r.json()
     raw = data["choices"][0]["message"]["content"]
@@ -81,24 +107,367 @@ def call_openai(system_prompt: str, user_prompt: str) -> dict:
             return json.loads(m.group(0))
         raise
 
+def stream_openai(system_prompt: str, user_prompt: str, session: requests.Session = None):
+    """Générateur des morceaux de texte d'une réponse chat-completion en streaming (SSE)."""
+    url = f"{API_BASE}/v1/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    payload = {
+        "model": MODEL,
+        "temperature": TEMPERATURE,
+        "messages": [
+            {"role":"system", "content": system_prompt},
+            {"role":"user",   "content": user_prompt},
+        ],
+        "response_format": {"type": "json_object"},
+        "stream": True,
+    }
+    with (session or requests).post(url, headers=headers, data=json.dumps(payload), timeout=90, stream=True) as r:
+        r.raise_for_status()
+        r.encoding = "utf-8"
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+class JsonFieldStream:
+    """Parse incrémental d'un objet JSON dont les valeurs utiles sont des chaînes.
+
+    feed(texte) renvoie des événements ("delta", clé, morceau décodé) pendant une valeur
+    chaîne et ("done", clé, valeur complète) à sa fermeture. Texte avant '{' ignoré,
+    valeurs non-chaînes sautées.
+    """
+    ESC = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.state = "start"   # start, key_wait, key, colon, value_wait, value, skip, after
+        self.key, self.buf = "", []
+        self.esc = None        # None, "\\", ou "u" + chiffres hexa reçus
+        self.high = None       # demi-substitut UTF-16 en attente
+        self.depth = 0         # imbrication dans une valeur sautée
+        self.skip_str = False
+
+    def _char(self, c, out):
+        if self.esc is not None:
+            if self.esc == "\\":
+                if c == "u":
+                    self.esc = "u"
+                    return
+                c, self.esc = self.ESC.get(c, c), None
+            else:
+                self.esc += c
+                if len(self.esc) < 5:
+                    return
+                code, self.esc = int(self.esc[1:], 16), None
+                if 0xD800 <= code < 0xDC00:
+                    self.high = code
+                    return
+                if 0xDC00 <= code < 0xE000 and self.high is not None:
+                    code = 0x10000 + ((self.high - 0xD800) << 10) + (code - 0xDC00)
+                self.high = None
+                c = chr(code)
+        elif c == "\\":
+            self.esc = "\\"
+            return
+        elif c == '"':
+            return True
+        self.buf.append(c)
+        out.append(c)
+
+    def feed(self, text: str):
+        events, out = [], []
+        for c in text:
+            st = self.state
+            if st == "start":
+                if c == "{":
+                    self.state = "key_wait"
+            elif st == "key_wait":
+                if c == '"':
+                    self.state, self.buf = "key", []
+            elif st == "key":
+                if self._char(c, []):
+                    self.key, self.state = "".join(self.buf), "colon"
+            elif st == "colon":
+                if c == ":":
+                    self.state = "value_wait"
+            elif st == "value_wait":
+                if c == '"':
+                    self.state, self.buf, out = "value", [], []
+                elif not c.isspace():
+                    self.state, self.depth, self.skip_str = "skip", 0, False
+                    self._skip(c)
+            elif st == "value":
+                if self._char(c, out):
+                    if out:
+                        events.append(("delta", self.key, "".join(out)))
+                    events.append(("done", self.key, "".join(self.buf)))
+                    self.state, out = "after", []
+            elif st == "skip":
+                self._skip(c)
+            elif st == "after":
+                if c == ",":
+                    self.state = "key_wait"
+        if self.state == "value" and out:
+            events.append(("delta", self.key, "".join(out)))
+        return events
+
+    def _skip(self, c):
+        if self.skip_str:
+            if self.esc:
+                self.esc = None
+            elif c == "\\":
+                self.esc = "\\"
+            elif c == '"':
+                self.skip_str = False
+        elif c == '"':
+            self.skip_str = True
+        elif c in "[{":
+            self.depth += 1
+        elif c in "]}":
+            self.depth -= 1
+            if self.depth < 0:
+                self.state = "start"
+        elif c == "," and self.depth == 0:
+            self.state = "key_wait"
+
+def tidy_story(story: str) -> str:
+    """Histoire nettoyée, sans didascalies (aussi appliqué au texte partiel en --stream)."""
+    story = STAGE_WORDS.sub("", _clean_text(story))
+    return re.sub(r"\s{2,}", " ", story).strip()
+
+def stream_story(chunk_chars: int = 200, prefetch: bool = True):
+    """Génère en streaming; lance la TTS au fil de l'eau. Renvoie (dict JSON, découpage de l'histoire)."""
+    from text_utils import split_sentences, chunk_sentences
+    pre = None
+    if prefetch:
+        import voice_elevenlabs
+        pre = voice_elevenlabs.Prefetcher()
+        if not pre.enabled:
+            print("[generate_story] ELEVENLABS_* manquants: pas de préchargement TTS", file=sys.stderr)
+    t0 = time.perf_counter()
+    parser = JsonFieldStream()
+    fields, story_raw = {}, ""
+    sent_chunks = 0
+    first = None
+
+    def flush(sentences, final=False):
+        nonlocal sent_chunks
+        chunks = chunk_sentences(sentences, chunk_chars)
+        ready = chunks if final else chunks[:-1]   # le dernier morceau peut encore grossir
+        for c in ready[sent_chunks:]:
+            if pre:
+                pre.submit(f"story_{sent_chunks:02d}", " ".join(c))
+            sent_chunks += 1
+        return chunks
+
+    try:
+        for delta in stream_openai(SYSTEM_PROMPT, USER_PROMPT):
+            if first is None:
+                first = time.perf_counter() - t0
+                print(f"[generate_story] premier token à {first:.2f}s")
+            for ev, key, val in parser.feed(delta):
+                if ev == "delta" and key == "story":
+                    story_raw += val
+                    sentences = split_sentences(tidy_story(story_raw))
+                    flush(sentences[:-1])  # la dernière phrase n'est pas forcément finie
+                elif ev == "done":
+                    fields[key] = val
+                    print(f"[generate_story] champ '{key}' reçu à {time.perf_counter() - t0:.2f}s")
+                    if pre and key == "title":
+                        pre.submit("title", _clean_text(val))
+                    elif pre and key == "cta":
+                        pre.submit("cta", _clean_text(val) or DEFAULT_CTA)
+        print(f"[generate_story] génération terminée à {time.perf_counter() - t0:.2f}s")
+
+        title, story, cta = tidy(fields)
+        chunks = flush(split_sentences(story), final=True)
+    except BaseException:
+        if pre:
+            pre.close()  # l'appelant repasse en requête classique: pas de threads ni de tempdir orphelins
+        raise
+    if pre:
+        if "cta" not in fields:
+            pre.submit("cta", DEFAULT_CTA)
+        if not fields.get("title"):
+            pre.submit("title", title)
+        pre.wait()
+    return {"title": title, "story": story, "cta": cta}, chunks
+
 def ensure_text_files(title: str, story: str, cta: str) -> None:
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    for f in (TITLE_FILE, STORY_FILE, CTA_FILE):
+        f.parent.mkdir(parents=True, exist_ok=True)
     TITLE_FILE.write_text(title.strip() + "\n", encoding="utf-8")
     STORY_FILE.write_text(story.strip() + "\n", encoding="utf-8")
     # CTA toujours présent
     cta_final = (cta or "").strip() or DEFAULT_CTA
     CTA_FILE.write_text(cta_final + "\n", encoding="utf-8")
 
+def tidy(j: dict) -> tuple:
+    """(titre, histoire, cta) nettoyés depuis la réponse JSON du modèle."""
+    title = _clean_text(str(j.get("title", "") or ""))
+    story = tidy_story(str(j.get("story", "") or ""))
+    cta   = _clean_text(str(j.get("cta", "") or ""))
+
+    # Sécurités supplémentaires
+    if not title:
+        # fabriquer un titre court depuis la 1re phrase de l’histoire
+        head = story.split(".")[0]
+        words = head.split()
+        title = " ".join(words[:10]) if words else "Nuit de Chaînes"
+    return title, story, cta
+
+def validate(j, min_words: int = 150, max_words: int = 240) -> tuple:
+    """((titre, histoire, cta), None) si l'histoire est utilisable, sinon (None, raison)."""
+    if not isinstance(j, dict) or not isinstance(j.get("story"), str) or not isinstance(j.get("title"), str):
+        return None, "JSON invalide (title/story attendus)"
+    title, story, cta = tidy(j)
+    n = len(story.split())
+    if not (min_words <= n <= max_words):
+        return None, f"{n} mots (attendu {min_words}–{max_words})"
+    m = BANNED_WORDS.search(" ".join((title, story, cta)))
+    if m:
+        return None, f"mot interdit: {m.group(0)}"
+    return (title, story, cta), None
+
+def stories_of(j) -> list:
+    """Liste d'histoires d'une réponse: {"stories": [...]} ou une seule {"title", "story", "cta"}."""
+    if isinstance(j, dict) and isinstance(j.get("stories"), list):
+        return j["stories"]
+    return [j]
+
+def generate_batch(n: int, per_request: int = 1, concurrency: int = 4, bank_path=None,
+                   min_words: int = 150, max_words: int = 240) -> dict:
+    """Génère n histoires (requêtes concurrentes), valide et remplit la banque. Renvoie les compteurs."""
+    import downloader, story_bank
+    per_request = max(1, per_request)
+    requests_n = -(-n // per_request)
+    session = downloader.make_session(max(1, concurrency))
+    db = story_bank.connect(bank_path)
+    stats = {"requests": requests_n, "failed": 0, "received": 0, "added": 0, "invalid": 0, "duplicates": 0}
+    t0 = time.perf_counter()
+
+    def _one(k):
+        user = USER_PROMPT if per_request == 1 else batch_prompt(per_request)
+        return call_openai(SYSTEM_PROMPT, user, session)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futures = [ex.submit(_one, k) for k in range(requests_n)]
+        for fut in as_completed(futures):
+            try:
+                j = fut.result()
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"[generate_story] requête échouée: {e}", file=sys.stderr)
+                continue
+            # insertions dans le thread principal (une seule connexion SQLite)
+            for item in stories_of(j):
+                stats["received"] += 1
+                ok, why = validate(item, min_words, max_words)
+                if ok is None:
+                    stats["invalid"] += 1
+                    print(f"[generate_story] refusée: {why}", file=sys.stderr)
+                    continue
+                sid, why = story_bank.add(db, *ok)
+                if sid is None:
+                    stats["duplicates"] += 1
+                    print(f"[generate_story] refusée: {why} ({ok[0]})", file=sys.stderr)
+                else:
+                    stats["added"] += 1
+    c = story_bank.counts(db)
+    print(f"[generate_story] batch: {stats['added']}/{stats['received']} ajoutées "
+          f"({stats['invalid']} invalides, {stats['duplicates']} doublons, {stats['failed']} requêtes échouées) "
+          f"en {time.perf_counter() - t0:.2f}s — banque: {c['unused']} disponibles / {c['total']}")
+    return stats
+
+def take_from_bank(bank_path=None):
+    import story_bank
+    t0 = time.perf_counter()
+    try:
+        row = story_bank.take(story_bank.connect(bank_path))
+    except Exception as e:
+        print(f"[generate_story] banque illisible: {e}", file=sys.stderr)
+        return None
+    if row:
+        print(f"[generate_story] histoire #{row['id']} prise dans la banque ({1000 * (time.perf_counter() - t0):.1f} ms)")
+    return row
+
 def main():
+    global TITLE_FILE, STORY_FILE, CTA_FILE
+    ap = argparse.ArgumentParser(description="Génère titre + histoire + CTA (OpenAI), ou remplit/consomme la banque d'histoires.")
+    ap.add_argument("--system", default=None, help="(accepté pour compatibilité; prompt système intégré utilisé)")
+    ap.add_argument("--user",   default=None, help="(accepté pour compatibilité; prompt utilisateur intégré utilisé)")
+    ap.add_argument("--title-out", default=str(TITLE_FILE))
+    ap.add_argument("--story-out", default=str(STORY_FILE))
+    ap.add_argument("--cta-out",   default=str(CTA_FILE))
+    ap.add_argument("--batch", type=int, default=0, help="Génère N histoires dans la banque (n'écrit pas story/)")
+    ap.add_argument("--per-request", type=int, default=1, help="Histoires demandées par requête en batch")
+    ap.add_argument("--concurrency", type=int, default=4, help="Requêtes simultanées en batch")
+    ap.add_argument("--min-words", type=int, default=150)
+    ap.add_argument("--max-words", type=int, default=240)
+    ap.add_argument("--bank", default=None, help="Banque SQLite (défaut: $STORY_BANK ou cache/story_bank.sqlite)")
+    ap.add_argument("--stream", action="store_true",
+                    help="Réponse en streaming; la TTS (cache voix) démarre dès le titre et chaque groupe de phrases")
+    ap.add_argument("--no-tts-prefetch", action="store_true", help="--stream sans préchargement TTS")
+    ap.add_argument("--tts-chunk-chars", type=int, default=200,
+                    help="Taille max. (caractères) des groupes de phrases envoyés à la TTS en --stream")
+    ap.add_argument("--from-bank", action="store_true",
+                    help="Prend une histoire non utilisée dans la banque; appel API seulement si elle est vide")
+    args = ap.parse_args()
+    TITLE_FILE, STORY_FILE, CTA_FILE = pathlib.Path(args.title_out), pathlib.Path(args.story_out), pathlib.Path(args.cta_out)
+    ignored = [f"--{n}" for n in ("system", "user") if getattr(args, n)]
+    if ignored:
+        # le prompt intégré exige un CTA séparé (narré à part): celui du workflow le mettrait aussi dans l'histoire
+        print(f"[generate_story] {'/'.join(ignored)} ignoré(s): prompts intégrés utilisés", file=sys.stderr)
+
+    if args.from_bank:
+        row = take_from_bank(args.bank)
+        if row:
+            ensure_text_files(row["title"], row["story"], row["cta"])
+            print("[generate_story] titre -> story/title.txt | histoire -> story/story.txt | cta -> story/cta.txt")
+            return
+        print("[generate_story] banque vide -> appel API", file=sys.stderr)
+
     if not OPENAI_API_KEY:
         print("OPENAI_API_KEY manquant", file=sys.stderr)
         sys.exit(1)
 
+    if args.batch > 0:
+        stats = generate_batch(args.batch, args.per_request, args.concurrency, args.bank,
+                               args.min_words, args.max_words)
+        sys.exit(1 if stats["failed"] == stats["requests"] else 0)
+
+    hint = STORY_FILE.with_name(STORY_FILE.stem + ".chunks.json")
+    hint.unlink(missing_ok=True)
+    if args.stream:
+        try:
+            j, chunks = stream_story(args.tts_chunk_chars, not args.no_tts_prefetch)
+            ensure_text_files(j["title"], j["story"], j["cta"])
+            # découpage repris par voice_elevenlabs pour retrouver les synthèses en cache
+            hint.write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+            print("[generate_story] titre -> story/title.txt | histoire -> story/story.txt | cta -> story/cta.txt")
+            return
+        except Exception as e:
+            print(f"[generate_story] streaming échoué ({e}) -> requête classique", file=sys.stderr)
+
     try:
         j = call_openai(SYSTEM_PROMPT, USER_PROMPT)
     except Exception as e:
         # fallback ultra-robuste : on fabrique au moins des fichiers pour ne pas bloquer la pipeline
         print(f"[generate_story] Avertissement: API failure -> {e}", file=sys.stderr)
+        row = take_from_bank(args.bank)
+        if row:
+            ensure_text_files(row["title"], row["story"], row["cta"])
+            print("[generate_story] titre -> story/title.txt | histoire -> story/story.txt | cta -> story/cta.txt")
+            return
         title = "La Chaîne Dans Le Noir"
         story = (
             "La pluie bat le toit. Le manoir respire. Un couloir luisant, des portraits sans pupilles. "
@@ -115,21 +484,7 @@ def main():
         return
 
     # Normal path
-    title = _clean_text(j.get("title", ""))
-    story = _clean_text(j.get("story", ""))
-    cta   = _clean_text(j.get("cta", ""))
-
-    # Sécurités supplémentaires
-    if not title:
-        # fabriquer un titre court depuis la 1re phrase de l’histoire
-        head = story.split(".")[0]
-        words = head.split()
-        title = " ".join(words[:10]) if words else "Nuit de Chaînes"
-
-    # Interdiction de didascalies dans l'histoire
-    banned = re.compile(r"\b(intro|scène|narrateur|hook|cta)\b", re.I)
-    story = banned.sub("", story)
-    story = re.sub(r"\s{2,}", " ", story).strip()
+    title, story, cta = tidy(j)
 
     ensure_text_files(title, story, cta)
     print("[generate_story] titre -> story/title.txt | histoire -> story/story.txt | cta -> story/cta.txt")
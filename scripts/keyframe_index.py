@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Index des paquets vidéo / images clés d'un clip, construit une fois et stocké à côté.
+
+`<clip>.kfi.json` contient les pts des paquets et ceux des images clés; il est
+reconstruit si la taille ou le mtime du clip changent. Pour un fichier de cache
+adressé par contenu (mezzanine), la clé du cache remplace le mtime: le touch LRU
+d'un hit n'invalide pas l'index. Sert à couper sur des frontières de GOP (stream
+copy) sans ré-analyser le fichier à chaque run.
+"""
+import bisect, json, os, pathlib, subprocess
+
+import disk_cache
+
+def index_path(clip: pathlib.Path) -> pathlib.Path:
+    return clip.with_name(clip.name + ".kfi.json")
+
+def build(clip: pathlib.Path, key: str = None) -> dict:
+    out = subprocess.check_output([
+        "ffprobe","-v","error",
+        "-select_streams","v:0",
+        "-show_entries","packet=pts_time,flags",
+        "-of","csv=p=0",
+        str(clip)
+    ], stderr=subprocess.DEVNULL).decode("utf-8","ignore")
+    pts, keys = [], []
+    for ln in out.splitlines():
+        parts = ln.strip().split(",")
+        if len(parts) < 2 or parts[0] in ("", "N/A"):
+            continue
+        t = float(parts[0])
+        pts.append(t)
+        if "K" in parts[1]:
+            keys.append(t)
+    pts.sort(); keys.sort()
+    st = clip.stat()
+    idx = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "pts": pts, "keyframes": keys}
+    if key:
+        idx["key"] = key
+    tmp = disk_cache.part_path(index_path(clip))
+    tmp.write_text(json.dumps(idx), encoding="utf-8")
+    os.replace(tmp, index_path(clip))
+    return idx
+
+def load(clip: pathlib.Path, key: str = None) -> dict:
+    """Index de clip. key: clé de cache du fichier (contenu), validée à la place du mtime."""
+    ip = index_path(clip)
+    st = clip.stat()
+    if ip.exists():
+        try:
+            idx = json.loads(ip.read_text(encoding="utf-8"))
+            fresh = idx.get("key") == key if key else idx.get("mtime_ns") == st.st_mtime_ns
+            if idx.get("size") == st.st_size and fresh:
+                return idx
+        except Exception:
+            pass
+    return build(clip, key)
+
+def keyframe_at_or_after(idx: dict, t: float):
+    keys = idx["keyframes"]
+    i = bisect.bisect_left(keys, t - 1e-6)
+    return keys[i] if i < len(keys) else None
+
+def keyframe_at_or_before(idx: dict, t: float):
+    keys = idx["keyframes"]
+    i = bisect.bisect_right(keys, t + 1e-6)
+    return keys[i - 1] if i > 0 else None
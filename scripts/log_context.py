@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Journal courant d'une tâche, suivi dans ses pools de threads et ses sous-processus ffmpeg.
+
+batch.py fait tourner plusieurs vidéos dans un même processus, chacune avec son log.
+Le log courant est une ContextVar: Pool (ThreadPoolExecutor) la transmet à ses workers
+et stdio() renvoie les stdout/stderr à passer à subprocess. Hors batch, aucun log n'est
+fixé: sorties console comme avant.
+"""
+import contextlib, contextvars, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+current = contextvars.ContextVar("log_file", default=None)
+
+@contextlib.contextmanager
+def redirect(f):
+    """Fixe le log courant (fichier texte ouvert) le temps du bloc."""
+    token = current.set(f)
+    try:
+        yield f
+    finally:
+        current.reset(token)
+
+class Pool(ThreadPoolExecutor):
+    """ThreadPoolExecutor dont chaque tâche s'exécute dans le contexte (log) de l'appelant de submit/map."""
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def stdio() -> dict:
+    """Arguments stdout/stderr de subprocess.run vers le log courant ({} sans log)."""
+    f = current.get()
+    if f is None:
+        return {}
+    f.flush()  # ce qui est déjà écrit passe avant la sortie du processus
+    return {"stdout": f, "stderr": subprocess.STDOUT}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Sonde média partagée par les scripts, avec index persistant.
+
+- WAV: en-tête lu directement (module wave), aucun sous-processus;
+- autres fichiers: un ffprobe -show_format -show_streams -of json (tous les flux), puis
+  pour une vidéo un scan des drapeaux de paquets du flux v:0 (nb d'images clés);
+- résultat complet (durée, fps, résolution, codec, nb d'images clés, fréquence et
+  canaux du flux audio) mis en cache
+  dans cache/probe_index.json, clé = chemin + taille + mtime (URL: revalidée par ETag + taille);
+- probe_many() sonde tout un manifeste en parallèle (chemins locaux ou URLs).
+
+Re-sonder une banque de clips inchangée ne lance donc aucun ffprobe.
+"""
+import atexit, json, os, pathlib, subprocess, sys, threading, wave
+
+import disk_cache
+import log_context
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+INDEX_PATH = pathlib.Path(os.environ.get("PROBE_INDEX", ROOT / "cache" / "probe_index.json"))
+
+_lock = threading.Lock()
+_index = None   # chemin -> {"size", "mtime_ns", "v", "info"}
+_dirty = False
+
+INDEX_VERSION = 2  # 2: flux audio des fichiers vidéo (sample_rate, channels) conservés
+AUDIO_EXT = {".wav", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus"}
+
+def _load_index() -> dict:
+    global _index
+    if _index is None:
+        try:
+            _index = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            _index = {}
+    return _index
+
+def save_index():
+    """Écrit l'index (fusionné avec la version disque) de façon atomique."""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        with disk_cache.locked(INDEX_PATH):
+            try:
+                on_disk = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+            except Exception:
+                on_disk = {}
+            on_disk.update(_index)
+            tmp = disk_cache.part_path(INDEX_PATH)
+            tmp.write_text(json.dumps(on_disk), encoding="utf-8")
+            os.replace(tmp, INDEX_PATH)
+        _dirty = False
+
+atexit.register(save_index)
+
+def _rate(s: str) -> float:
+    try:
+        num, den = s.split("/")
+        return float(num) / float(den) if float(den) else 0.0
+    except Exception:
+        return 0.0
+
+def probe_wav(path: pathlib.Path) -> dict:
+    with wave.open(str(path), "rb") as w:
+        frames, rate = w.getnframes(), w.getframerate()
+        return {
+            "duration": frames / rate if rate else 0.0,
+            "codec": f"pcm_s{8 * w.getsampwidth()}le",
+            "sample_rate": rate,
+            "channels": w.getnchannels(),
+            "frames": frames,
+        }
+
+def is_url(s) -> bool:
+    return str(s).startswith(("http://", "https://"))
+
+def count_keyframes(path) -> int:
+    """Images clés du premier flux vidéo (scan des paquets, sans décodage)."""
+    out = subprocess.check_output([
+        "ffprobe","-v","error","-select_streams","v:0",
+        "-show_entries","packet=flags","-of","csv=p=0", str(path)
+    ], stderr=subprocess.DEVNULL).decode("utf-8","ignore")
+    return sum(1 for ln in out.splitlines() if "K" in ln)
+
+def probe_ffprobe(path, packets: bool = True) -> dict:
+    # -select_streams filtrerait aussi -show_streams: les paquets vidéo sont comptés à part
+    cmd = ["ffprobe","-v","error","-show_format","-show_streams","-of","json", str(path)]
+    data = json.loads(subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode("utf-8","ignore") or "{}")
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    v = next((s for s in streams if s.get("codec_type") == "video"), None)
+    a = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    info = {"duration": max(0.0, float(fmt.get("duration") or 0.0)), "format": fmt.get("format_name", "")}
+    if fmt.get("tags"):
+        info["tags"] = {k.lower(): v for k, v in fmt["tags"].items()}
+    if v:
+        info.update({
+            "codec": v.get("codec_name", ""),
+            "width": v.get("width", 0),
+            "height": v.get("height", 0),
+            "fps": _rate(v.get("avg_frame_rate") or v.get("r_frame_rate") or "0/1"),
+        })
+        if packets and pathlib.Path(str(path)).suffix.lower() not in AUDIO_EXT:
+            info["keyframes"] = count_keyframes(path)
+    elif a:
+        info["codec"] = a.get("codec_name", "")
+    if a:
+        info["sample_rate"] = int(a.get("sample_rate") or 0)
+        info["channels"] = a.get("channels", 0)
+    return info
+
+def probe(path, session=None) -> dict:
+    """Infos média de path (dict vide si illisible). Index consulté puis mis à jour.
+
+    Une URL est sondée à distance (seul le moov est lu, sur session si fournie) et indexée par URL.
+    """
+    global _dirty
+    if is_url(path):
+        return probe_url(str(path), session)
+    p = pathlib.Path(path)
+    try:
+        st = p.stat()
+    except OSError:
+        return {}
+    if p.suffix.lower() == ".wav":
+        # en-tête WAV: lecture directe, pas d'indexation (fichiers régénérés à chaque run)
+        try:
+            return probe_wav(p)
+        except (wave.Error, EOFError):
+            pass
+    key = str(p.resolve())
+    with _lock:
+        hit = _load_index().get(key)
+    if (hit and hit.get("size") == st.st_size and hit.get("mtime_ns") == st.st_mtime_ns
+            and hit.get("v") == INDEX_VERSION):
+        return hit["info"]
+    try:
+        info = probe_ffprobe(p)
+    except Exception as e:
+        print(f"[media_probe] ffprobe échoué ({p}): {e}", file=sys.stderr)
+        return {}
+    with _lock:
+        _load_index()[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "v": INDEX_VERSION, "info": info}
+        _dirty = True
+    return info
+
+def probe_url(url: str, session=None) -> dict:
+    """Sonde distante, indexée par URL et revalidée à chaque appel par HEAD (ETag + taille):
+    un fichier remplacé derrière la même URL est ressondé. Sans réponse du serveur,
+    l'entrée connue est gardée."""
+    global _dirty
+    import downloader
+    key = "url:" + url
+    session = session or downloader.make_session(1)
+    etag, size = downloader.remote_info(session, url)
+    with _lock:
+        hit = _load_index().get(key)
+    if hit and (etag or size is not None) and hit.get("etag") == etag and hit.get("size") == size:
+        return hit["info"]
+    try:
+        # moov lu par requêtes Range (quelques Ko), ffprobe distant en secours
+        import mp4_remote
+        info = mp4_remote.probe(url, session)
+    except Exception:
+        try:
+            info = probe_ffprobe(url, packets=False)
+        except Exception as e:
+            if hit:
+                return hit["info"]
+            print(f"[media_probe] sonde distante échouée ({url}): {e}", file=sys.stderr)
+            return {}
+    with _lock:
+        _load_index()[key] = {"etag": etag, "size": size, "info": info}
+        _dirty = True
+    return info
+
+def duration(path) -> float:
+    return float(probe(path).get("duration", 0.0))
+
+def probe_many(paths, workers: int = 8, session=None) -> dict:
+    """Sonde une liste de fichiers en parallèle; renvoie {chemin: infos} et sauve l'index."""
+    paths = list(paths)
+    with log_context.Pool(max_workers=max(1, workers)) as ex:
+        out = dict(zip(paths, ex.map(lambda p: probe(p, session), paths)))
+    save_index()
+    return out
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Cache persistant de clips normalisés ("mezzanine") pour le fond vidéo.
+
+Chaque entrée est déjà mise à l'échelle + recadrée en 1080x1920, à 30 fps constant,
+en GOP fermé fixe (1 image clé / seconde), sans audio. La clé combine le hash du
+contenu source et les paramètres de normalisation. Budget disque configurable,
+éviction LRU (voir disk_cache).
+"""
+import hashlib, json, os, pathlib, subprocess
+
+import disk_cache
+import log_context
+
+DEFAULT_PARAMS = {
+    "width": 1080, "height": 1920, "fps": 30,
+    "gop": 30, "crf": 16, "preset": "medium",
+}
+
+def params_for(profile: dict) -> dict:
+    """Paramètres de normalisation pour un profil de rendu (final -> DEFAULT_PARAMS)."""
+    return {
+        "width": profile["width"], "height": profile["height"], "fps": profile["fps"],
+        "gop": profile["fps"], "crf": max(0, profile["crf"] - 2), "preset": profile["preset"],
+    }
+
+def mezzanine_key(content_sha: str, params: dict) -> str:
+    blob = content_sha + json.dumps(params, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def normalize_vf(params: dict) -> str:
+    w, h = params["width"], params["height"]
+    # même sur-échelle que le chemin historique (1200x2133 pour 1080x1920)
+    ow, oh = round(w * 10 / 9), round(h * 10 / 9)
+    return (
+        f"scale={ow}:{oh}:force_original_aspect_ratio=increase,"
+        f"crop={w}:{h},setsar=1,fps={params['fps']}"
+    )
+
+def x264_args(params: dict) -> list:
+    """Réglages d'encodage du mezzanine. Tout morceau ré-encodé destiné à être concaténé
+    en stream copy avec un mezzanine doit utiliser exactement les mêmes (SPS/PPS identiques)."""
+    gop = str(params["gop"])
+    return [
+        "-c:v","libx264","-preset",params["preset"],"-crf",str(params["crf"]),"-pix_fmt","yuv420p",
+        "-g", gop, "-keyint_min", gop, "-sc_threshold","0", "-flags","+cgop",
+    ]
+
+def encode_mezzanine(src: pathlib.Path, dst: pathlib.Path, params: dict, threads: int = 0):
+    part = disk_cache.part_path(dst)
+    cmd = [
+        "ffmpeg","-nostdin","-y",
+        "-i", str(src),
+        "-an",
+        "-vf", normalize_vf(params),
+        *x264_args(params),
+        *(["-threads", str(threads)] if threads > 0 else []),
+        "-movflags","+faststart",
+        "-f","mp4", str(part)
+    ]
+    subprocess.run(cmd, check=True, **log_context.stdio())
+    os.replace(part, dst)
+
+def ensure(src: pathlib.Path, cache_dir: pathlib.Path, params: dict = None, threads: int = 0) -> pathlib.Path:
+    """Renvoie le mezzanine de src (construit si absent), et le marque comme récemment utilisé."""
+    params = params or DEFAULT_PARAMS
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    sha = disk_cache.file_sha256(src, memo=cache_dir / "hashes.json")
+    dst = cache_dir / f"{mezzanine_key(sha, params)[:32]}.mp4"
+    if dst.exists() and dst.stat().st_size > 0:
+        disk_cache.touch(dst)
+        print(f"[mezzanine] hit {src.name} -> {dst.name}")
+        return dst
+    with disk_cache.locked(dst):  # un autre processus peut être en train de le construire
+        if dst.exists() and dst.stat().st_size > 0:
+            print(f"[mezzanine] hit {src.name} -> {dst.name} (construit par un autre processus)")
+            return dst
+        print(f"[mezzanine] build {src.name} -> {dst.name}")
+        encode_mezzanine(src, dst, params, threads)
+    return dst
+
+def evict(cache_dir: pathlib.Path, budget_mb: float, keep=()) -> int:
+    n = disk_cache.evict(cache_dir, int(budget_mb * 1024 * 1024), "*.mp4", keep)
+    # index d'images clés orphelins (voir keyframe_index)
+    for side in cache_dir.glob("*.mp4.kfi.json"):
+        if not side.with_name(side.name[:-len(".kfi.json")]).exists():
+            side.unlink(missing_ok=True)
+    if n:
+        print(f"[mezzanine] éviction LRU: {n} entrée(s) supprimée(s)")
+    return n
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""Lecture partielle d'un MP4 distant par requêtes HTTP Range.
+
+1) repère les boîtes de premier niveau (quelques octets par boîte) et lit `moov`:
+   durée, résolution, codec et table des échantillons (stts/stss/stsc/stsz/stco);
+   les instants de présentation tiennent compte des décalages ctts (images B) et de
+   la liste d'éditions (elst: éditions vides en tête + une édition). Une liste
+   d'éditions plus complexe lève Unsupported: le clip est alors téléchargé en entier;
+2) pour une sous-plage [début, début+durée), ne télécharge que les octets des
+   échantillons vidéo nécessaires (depuis l'image clé précédente jusqu'à l'image
+   clé suivant la fin) et les écrit à leur offset d'origine dans un fichier local
+   creux: en-têtes + moov présents, le reste à zéro. ffmpeg y lit la sous-plage
+   avec -ss/-t comme dans le fichier complet.
+
+Fonctionne avec tout serveur HTTP qui gère Range (Dropbox dl=1 compris).
+"""
+import hashlib, json, os, pathlib, struct, sys, threading
+
+import requests
+
+import disk_cache
+import downloader
+
+class Unsupported(IOError):
+    """Fichier lisible, mais dont les coupes ne peuvent pas être calculées depuis le moov."""
+
+class RangeReader:
+    def __init__(self, url: str, session: requests.Session = None):
+        self.session = session or downloader.make_session()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # résout les redirections une fois, et récupère la taille totale
+        r = self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, allow_redirects=True, timeout=30)
+        r.raise_for_status()
+        if r.status_code != 206:
+            r.close()
+            raise IOError("le serveur ne gère pas les requêtes Range")
+        self.url = r.url
+        self.size = int(r.headers["Content-Range"].rsplit("/", 1)[1])
+        self.etag = r.headers.get("ETag", "")
+        r.close()
+
+    def read(self, off: int, n: int) -> bytes:
+        if n <= 0 or off >= self.size:
+            return b""
+        end = min(self.size, off + n) - 1
+        r = self.session.get(self.url, headers={"Range": f"bytes={off}-{end}"}, timeout=60)
+        r.raise_for_status()
+        data = r.content[:end + 1 - off] if r.status_code == 206 else r.content[off:end + 1]
+        with self._lock:
+            self.bytes += len(data)
+        return data
+
+def top_level_boxes(reader: RangeReader):
+    """[(type, offset, taille totale, octets d'en-tête)] du fichier distant."""
+    out, off = [], 0
+    while off + 8 <= reader.size:
+        hdr = reader.read(off, 16)
+        size, typ = struct.unpack(">I4s", hdr[:8])
+        hlen = 8
+        if size == 1:
+            size, hlen = struct.unpack(">Q", hdr[8:16])[0], 16
+        elif size == 0:
+            size = reader.size - off
+        if size < hlen:
+            break
+        out.append((typ.decode("latin-1"), off, size, hdr[:hlen]))
+        off += size
+    return out
+
+def _children(buf: bytes, start: int, end: int):
+    i = start
+    while i + 8 <= end:
+        size, typ = struct.unpack(">I4s", buf[i:i + 8])
+        hlen = 8
+        if size == 1:
+            size, hlen = struct.unpack(">Q", buf[i + 8:i + 16])[0], 16
+        elif size == 0:
+            size = end - i
+        if size < hlen:
+            break
+        yield typ.decode("latin-1"), i + hlen, i + size
+        i += size
+
+def _find(buf, start, end, path):
+    for typ, s, e in _children(buf, start, end):
+        if typ == path[0]:
+            return (s, e) if len(path) == 1 else _find(buf, s, e, path[1:])
+    return None
+
+def _timescale_duration(buf, s):
+    if buf[s] == 1:
+        return struct.unpack(">IQ", buf[s + 20:s + 32])
+    return struct.unpack(">II", buf[s + 12:s + 20])
+
+def _edit(buf: bytes, s: int, e: int, movie_timescale: int):
+    """(décalage de présentation en s, media_time en unités de la piste) d'après edts/elst."""
+    el = _find(buf, s, e, ["edts", "elst"])
+    if el is None:
+        return 0.0, 0
+    ver = buf[el[0]]
+    n = struct.unpack(">I", buf[el[0] + 4:el[0] + 8])[0]
+    fmt = ">Qqi" if ver == 1 else ">Iii"
+    w = struct.calcsize(fmt)
+    edits = [struct.unpack(fmt, buf[el[0] + 8 + k * w:el[0] + 8 + (k + 1) * w]) for k in range(n)]
+    empty = 0
+    while edits and edits[0][1] == -1:
+        empty += edits.pop(0)[0]
+    if len(edits) > 1:
+        raise Unsupported(f"liste d'éditions à {len(edits)} segments")
+    return (empty / movie_timescale if movie_timescale else 0.0), (edits[0][1] if edits else 0)
+
+def parse_track(buf: bytes, s: int, e: int, movie_timescale: int = 0) -> dict:
+    hd = _find(buf, s, e, ["mdia", "hdlr"])
+    handler = buf[hd[0] + 8:hd[0] + 12].decode("latin-1") if hd else ""
+    md = _find(buf, s, e, ["mdia", "mdhd"])
+    timescale, duration = _timescale_duration(buf, md[0])
+    tk = _find(buf, s, e, ["tkhd"])
+    width, height = struct.unpack(">II", buf[tk[1] - 8:tk[1]])
+    stbl = _find(buf, s, e, ["mdia", "minf", "stbl"])
+    tables = {typ: (ts, te) for typ, ts, te in _children(buf, *stbl)}
+
+    codec = ""
+    if "stsd" in tables:
+        codec = buf[tables["stsd"][0] + 12:tables["stsd"][0] + 16].decode("latin-1")
+
+    def entries(typ, fmt):
+        ts, _ = tables[typ]
+        n = struct.unpack(">I", buf[ts + 4:ts + 8])[0]
+        w = struct.calcsize(">" + fmt)
+        return [struct.unpack(">" + fmt, buf[ts + 8 + k * w:ts + 8 + (k + 1) * w]) for k in range(n)]
+
+    # tailles
+    ts, _ = tables["stsz"]
+    fixed, count = struct.unpack(">II", buf[ts + 4:ts + 12])
+    sizes = [fixed] * count if fixed else list(struct.unpack(f">{count}I", buf[ts + 12:ts + 12 + 4 * count]))
+    # offsets des chunks
+    if "co64" in tables:
+        chunk_off = [c[0] for c in entries("co64", "Q")]
+    else:
+        chunk_off = [c[0] for c in entries("stco", "I")]
+    # offsets des échantillons (stsc)
+    stsc = entries("stsc", "III")
+    offsets = []
+    for k, (first, per_chunk, _) in enumerate(stsc):
+        last = stsc[k + 1][0] - 1 if k + 1 < len(stsc) else len(chunk_off)
+        for c in range(first - 1, last):
+            o = chunk_off[c]
+            for _ in range(per_chunk):
+                if len(offsets) >= count:
+                    break
+                offsets.append(o)
+                o += sizes[len(offsets) - 1]
+    # temps de décodage (stts), puis de présentation: + ctts, - media_time de l'édition, + éditions vides
+    ticks, t = [], 0
+    for n, delta in entries("stts", "II"):
+        for _ in range(n):
+            ticks.append(t)
+            t += delta
+    ticks = ticks[:count]
+    if "ctts" in tables:
+        k = 0
+        for n, off in entries("ctts", "Ii"):  # version 1: décalages signés; version 0: < 2^31 en pratique
+            for _ in range(n):
+                if k < len(ticks):
+                    ticks[k] += off
+                k += 1
+    shift, media_time = _edit(buf, s, e, movie_timescale)
+    pts = [(x - media_time) / timescale + shift for x in ticks]
+    sync = [x[0] - 1 for x in entries("stss", "I")] if "stss" in tables else list(range(count))
+
+    return {
+        "handler": handler, "codec": codec, "timescale": timescale,
+        "duration": duration / timescale if timescale else 0.0,
+        "width": width >> 16, "height": height >> 16,
+        "offsets": offsets, "sizes": sizes, "pts": pts, "sync": sync,
+    }
+
+def read_moov(reader: RangeReader):
+    boxes = top_level_boxes(reader)
+    moov = next((b for b in boxes if b[0] == "moov"), None)
+    if moov is None:
+        raise IOError("boîte moov introuvable")
+    buf = reader.read(moov[1], moov[2])
+    hlen = len(moov[3])
+    mv = _find(buf, hlen, len(buf), ["mvhd"])
+    timescale, duration = _timescale_duration(buf, mv[0])
+    tracks = [parse_track(buf, s, e, timescale) for typ, s, e in _children(buf, hlen, len(buf)) if typ == "trak"]
+    return boxes, buf, tracks, (duration / timescale if timescale else 0.0)
+
+def probe(url: str, session: requests.Session = None) -> dict:
+    """Infos au format media_probe, à partir du seul moov distant."""
+    reader = RangeReader(url, session)
+    _, _, tracks, duration = read_moov(reader)
+    info = {"duration": duration, "format": "mov,mp4,m4a,3gp,3g2,mj2", "remote_bytes": reader.bytes}
+    v = next((t for t in tracks if t["handler"] == "vide"), None)
+    if v:
+        info.update({
+            "codec": {"avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc"}.get(v["codec"], v["codec"]),
+            "width": v["width"], "height": v["height"],
+            "fps": len(v["pts"]) / v["duration"] if v["duration"] else 0.0,
+            "keyframes": len(v["sync"]),
+        })
+    return info
+
+def _merge(ranges):
+    out = []
+    for a, b in sorted(ranges):
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+def sparse_path(url: str, cache_dir: pathlib.Path) -> pathlib.Path:
+    return cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}.partial.mp4"
+
+def fetch_range(url: str, start: float, dur: float, cache_dir: pathlib.Path,
+                session: requests.Session = None) -> tuple:
+    """Fichier local creux contenant [start, start+dur) de url. Renvoie (chemin, octets transférés).
+
+    Les plages déjà présentes (fichier .ranges.json à côté) ne sont pas retéléchargées,
+    tant que la taille et l'ETag du fichier distant sont ceux de ces plages (comme
+    downloader.cache_key); sinon le fichier creux est repris de zéro.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    dst = sparse_path(url, cache_dir)
+    side = dst.with_name(dst.name + ".ranges.json")
+    reader = RangeReader(url, session)
+    boxes, moov, tracks, _ = read_moov(reader)
+    v = next((t for t in tracks if t["handler"] == "vide"), None)
+    if v is None or not v["pts"]:
+        raise IOError("aucune piste vidéo")
+    pts, sync = v["pts"], v["sync"]
+    # ordre de décodage: image clé présentée au plus tard à start, puis jusqu'au dernier
+    # échantillon présenté avant la fin (images B comprises) et l'image clé qui suit
+    first = max([k for k in sync if pts[k] <= start + 1e-6] or [0])
+    last = max([k for k in range(first, len(pts)) if pts[k] < start + dur - 1e-6] or [first])
+    nxt = [k for k in sync if k > last]
+    last = nxt[0] if nxt else len(pts) - 1
+    lo = min(v["offsets"][first:last + 1])
+    hi = max(o + n for o, n in zip(v["offsets"][first:last + 1], v["sizes"][first:last + 1]))
+
+    # fichier creux + plages: lecture-modification-écriture sous verrou (batch, prefetch --overlap)
+    with disk_cache.locked(dst):
+        try:
+            meta = json.loads(side.read_text(encoding="utf-8"))
+            fresh = meta["size"] == reader.size and meta["etag"] == reader.etag and dst.exists()
+            have = meta["ranges"] if fresh else []
+        except Exception:
+            fresh, have = False, []
+        if not fresh and dst.exists():
+            print(f"[mp4_remote] fichier distant modifié ou plages inconnues, fichier creux réinitialisé: {dst.name}",
+                  file=sys.stderr)
+            dst.unlink()
+
+        need, cur = [], lo
+        for a, b in _merge(have):
+            if b <= cur or a >= hi:
+                continue
+            if a > cur:
+                need.append((cur, a))
+            cur = max(cur, b)
+        if cur < hi:
+            need.append((cur, hi))
+
+        mode = "r+b" if dst.exists() else "wb"
+        with open(dst, mode) as f:
+            f.truncate(reader.size)
+            for typ, off, size, hdr in boxes:
+                f.seek(off); f.write(hdr)
+                if typ == "moov":
+                    f.seek(off); f.write(moov)
+                elif typ not in ("mdat", "free", "skip") and size <= 1024 * 1024:
+                    f.seek(off); f.write(reader.read(off, size))
+            for a, b in need:
+                f.seek(a); f.write(reader.read(a, b - a))
+        tmp = disk_cache.part_path(side)
+        tmp.write_text(json.dumps({"size": reader.size, "etag": reader.etag,
+                                   "ranges": _merge(have + [[lo, hi]])}), encoding="utf-8")
+        os.replace(tmp, side)
+    return dst, reader.bytes
+
+def evict(cache_dir: pathlib.Path, budget_mb: float, keep=()) -> int:
+    """LRU des fichiers creux, comptés à leur taille allouée; plages orphelines supprimées."""
+    n = disk_cache.evict(cache_dir, int(budget_mb * 1024 * 1024), "*.partial.mp4", keep, disk_cache.allocated)
+    for side in cache_dir.glob("*.partial.mp4.ranges.json"):
+        if not side.with_name(side.name[:-len(".ranges.json")]).exists():
+            side.unlink(missing_ok=True)
+    if n:
+        print(f"[mp4_remote] éviction LRU: {n} fichier(s) creux supprimé(s)")
+    return n
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Sonde/extrait une sous-plage d'un MP4 distant via HTTP Range.")
+    ap.add_argument("url")
+    ap.add_argument("--start", type=float, default=0.0)
+    ap.add_argument("--dur",   type=float, default=0.0, help="0 = sonde seulement")
+    ap.add_argument("--cache-dir", default="cache/partial")
+    args = ap.parse_args()
+    info = probe(args.url)
+    print(json.dumps(info, indent=2))
+    if args.dur > 0:
+        path, nbytes = fetch_range(args.url, args.start, args.dur, pathlib.Path(args.cache_dir))
+        print(f"[mp4_remote] {path} — {nbytes / 1e6:.2f} Mo transférés sur {path.stat().st_size / 1e6:.2f} Mo", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Enchaîne les étapes du pipeline façon make: une étape à jour n'est pas relancée.
+
+Chaque étape déclare ses entrées, ses sorties et ses paramètres (arguments, variables
+d'environnement utiles, source du script et des modules de scripts/ qu'il importe). La clé d'une étape = sha256 de tout cela +
+contenu des entrées (hash mémorisé par taille/mtime, cf. disk_cache.file_sha256).
+L'état (cache/pipeline_state.json) garde, par étape, la clé du dernier succès: même
+clé + sorties présentes = skip. Une sortie retouchée à la main est conservée; ce sont
+les étapes suivantes, dont elle est une entrée, qui seront relancées.
+
+Les étapes tournent dans le même processus (runpy, sys.argv remplacé), ce qui évite
+un démarrage d'interpréteur et les imports à chaque étape; --subprocess revient à un
+processus par étape comme le workflow. Relancer après un échec d'upload ne refait
+donc que l'upload.
+
+--overlap lance dès le départ, dans un processus à part, la préparation des clips de
+fond (select_and_merge --prefetch: sonde, téléchargement, mezzanine) pendant que
+l'histoire et la voix attendent le réseau; l'étape merge n'attend plus que sa fin et
+ne fait que la sélection finale. Le chemin critique est affiché en fin de run.
+"""
+import argparse, ast, contextlib, hashlib, json, os, pathlib, runpy, shlex, subprocess, sys, threading, time, traceback
+
+import disk_cache
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+STATE_PATH = ROOT / "cache" / "pipeline_state.json"
+HASH_MEMO = ROOT / "cache" / "pipeline_hashes.json"
+
+OUT_NAME = os.environ.get("OUT_NAME", "final_horror.mp4")
+
+# (nom, script, arguments, entrées (globs), sorties, variables d'environnement prises en compte)
+STAGES = [
+    ("story", "generate_story.py",
+     ["--title-out", "story/title.txt", "--story-out", "story/story.txt", "--cta-out", "story/cta.txt"],
+     [], ["story/title.txt", "story/story.txt", "story/cta.txt"],
+     ["OPENAI_API_BASE"]),
+    ("voice", "voice_elevenlabs.py",
+     ["--title-file", "story/title.txt", "--story-file", "story/story.txt", "--cta-file", "story/cta.txt",
+      "--gap-title", "1.0", "--gap-cta", "1.0", "--out", "audio/voice.wav", "--list-file", "audio/voice.txt"],
+     ["story/*.txt", "story/story.chunks.json"], ["audio/voice.wav", "audio/timeline.json"],
+     ["ELEVENLABS_VOICE_ID", "ELEVENLABS_MODEL_ID", "ELEVENLABS_API_BASE", "ELEVENLABS_PCM_RATE"]),
+    ("captions", "build_ass.py",
+     ["--transcript", "story/story.txt", "--audio", "audio/voice.wav", "--out", "subs/captions.ass"],
+     ["story/*.txt", "audio/voice.wav", "audio/timeline.json"], ["subs/captions.ass"],
+     []),
+    ("merge", "select_and_merge.py",
+     ["--manifest", "manifests/horreur.txt", "--audio", "audio/voice.wav", "--out", "selected_media/merged.mp4"],
+     ["manifests/horreur.txt", "audio/voice.wav"], ["selected_media/merged.mp4"],
+     ["RENDER_PROFILE"]),
+    ("render", "render_final.py",
+     ["--video", "selected_media/merged.mp4", "--audio", "audio/voice.wav", "--subs", "subs/captions.ass",
+      "--output", f"final_video/{OUT_NAME}"],
+     ["selected_media/merged.mp4", "audio/voice.wav", "subs/captions.ass"], [f"final_video/{OUT_NAME}"],
+     ["RENDER_PROFILE"]),
+    ("upload", "dropbox_upload.py",
+     ["--file", f"final_video/{OUT_NAME}", "--remote-dir", "/horror", "--out-link", "final_video/dropbox_link.txt"],
+     [f"final_video/{OUT_NAME}"], ["final_video/dropbox_link.txt"],
+     ["OUT_NAME"]),
+]
+NAMES = [s[0] for s in STAGES]
+
+def load_state(path: pathlib.Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def save_state(path: pathlib.Path, state: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+def expand(patterns):
+    out = []
+    for pat in patterns:
+        out += sorted(p for p in ROOT.glob(pat) if p.is_file())
+    return out
+
+def _imports(tree, skip_main: bool):
+    """Noms des modules importés dans tree; skip_main: ignore le corps de main() (CLI d'un
+    module importé, jamais exécuté par l'étape)."""
+    todo = list(ast.iter_child_nodes(tree))
+    while todo:
+        node = todo.pop()
+        if skip_main and isinstance(node, ast.FunctionDef) and node.name == "main":
+            continue
+        if isinstance(node, ast.Import):
+            yield from (a.name.split(".")[0] for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            yield node.module.split(".")[0]
+        todo += ast.iter_child_nodes(node)
+
+def local_modules(script: str) -> list:
+    """Le script et les modules de scripts/ qu'il importe, directement ou non (imports
+    paresseux dans les fonctions compris): un CRF changé dans render_profiles relance le rendu."""
+    seen, todo = set(), [script]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            tree = ast.parse((SCRIPTS / name).read_text(encoding="utf-8"))
+        except (OSError, SyntaxError):
+            continue
+        todo += [f"{m}.py" for m in _imports(tree, name != script) if (SCRIPTS / f"{m}.py").is_file()]
+    return sorted(seen)
+
+def stage_key(script: str, args, inputs, env) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        "args": list(args),
+        "env": {k: os.environ.get(k, "") for k in env},
+        "scripts": {m: disk_cache.file_sha256(SCRIPTS / m, HASH_MEMO) for m in local_modules(script)},
+    }, sort_keys=True).encode("utf-8"))
+    for p in expand(inputs):
+        h.update(f"\n{p.relative_to(ROOT)}:{disk_cache.file_sha256(p, HASH_MEMO)}".encode("utf-8"))
+    return h.hexdigest()
+
+def fingerprint(outputs) -> dict:
+    """{sortie: [taille, mtime_ns]}; None si une sortie manque ou est vide."""
+    fp = {}
+    for o in outputs:
+        p = ROOT / o
+        if not p.is_file() or p.stat().st_size == 0:
+            return None
+        st = p.stat()
+        fp[o] = [st.st_size, st.st_mtime_ns]
+    return fp
+
+def up_to_date(entry: dict, key: str, outputs) -> bool:
+    return bool(entry) and entry.get("key") == key and fingerprint(outputs) is not None
+
+def will_run(selected, force, state: dict, extra: dict) -> set:
+    """Étapes sélectionnées qui seront relancées: forcées, pas à jour, ou dont une entrée est
+    la sortie d'une étape relancée avant elle (la clé actuelle ne le voit pas encore)."""
+    dirty, produced = set(), []
+    for name, script, stage_args, inputs, outputs, env in STAGES:
+        if name not in selected:
+            continue
+        fed = any(pathlib.PurePath(o).match(pat) for o in produced for pat in inputs)
+        key = stage_key(script, stage_args + extra.get(name, []), inputs, env)
+        if name in force or fed or not up_to_date(state.get(name), key, outputs):
+            dirty.add(name)
+            produced += outputs
+    return dirty
+
+@contextlib.contextmanager
+def _argv(argv):
+    saved_argv, saved_path, saved_cwd = sys.argv, list(sys.path), os.getcwd()
+    sys.argv = argv
+    sys.path.insert(0, str(SCRIPTS))
+    os.chdir(ROOT)
+    try:
+        yield
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+        os.chdir(saved_cwd)
+
+def run_inprocess(script: str, args) -> int:
+    path = SCRIPTS / script
+    with _argv([str(path)] + list(args)):
+        try:
+            runpy.run_path(str(path), run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                return e.code if isinstance(e.code, int) else 1
+        except Exception:
+            # même issue qu'un processus mort sur une exception: code 1, trace dans le log
+            traceback.print_exc()
+            return 1
+    return 0
+
+def run_subprocess(script: str, args) -> int:
+    return subprocess.run([sys.executable, str(SCRIPTS / script)] + list(args), cwd=ROOT).returncode
+
+class Prefetch:
+    """select_and_merge --prefetch en arrière-plan; temps relevés par rapport à t_ref."""
+    def __init__(self, args, t_ref: float):
+        self.t_ref = t_ref
+        self.start = time.perf_counter() - t_ref
+        self.end = None
+        self.proc = subprocess.Popen([sys.executable, str(SCRIPTS / "select_and_merge.py")] + list(args), cwd=ROOT)
+        self.thread = threading.Thread(target=self._wait, daemon=True)
+        self.thread.start()
+
+    def _wait(self):
+        self.proc.wait()
+        self.end = time.perf_counter() - self.t_ref
+
+    def join(self) -> int:
+        self.thread.join()
+        return self.proc.returncode
+
+def critical_path(spans, pre: Prefetch = None, waited: float = 0.0):
+    """Lignes de rapport: chronologie des étapes, recouvrement du prefetch, chemin critique."""
+    lines = ["chronologie: " + " | ".join(f"{n} {a:.1f}→{b:.1f}s" for n, a, b in spans)]
+    path = [n for n, _, _ in spans]
+    if pre is not None and pre.end is not None:
+        merge_at = next((a for n, a, _ in spans if n == "merge"), pre.end)
+        fg = [(a, b) for n, a, b in spans if a < merge_at]
+        overlap = sum(max(0.0, min(b, pre.end) - max(a, pre.start)) for a, b in fg)
+        lines.append(f"prefetch clips {pre.start:.1f}→{pre.end:.1f}s, recouvert à {overlap:.1f}s par "
+                     f"{'/'.join(n for n, a, _ in spans if a < merge_at) or 'rien'}; attente avant merge {waited:.1f}s")
+        if waited > 0.05:
+            path = ["prefetch clips"] + [n for n, a, _ in spans if a >= merge_at]
+    lines.append("chemin critique: " + " → ".join(path))
+    return lines
+
+def main():
+    ap = argparse.ArgumentParser(description="Pipeline complet avec saut des étapes déjà à jour.")
+    ap.add_argument("--only", nargs="+", choices=NAMES, help="N'évaluer que ces étapes")
+    ap.add_argument("--from", dest="start", choices=NAMES, help="Commencer à cette étape")
+    ap.add_argument("--force", nargs="*", choices=NAMES,
+                    help="Relancer ces étapes même à jour (sans nom: toutes)")
+    ap.add_argument("--stage-args", action="append", default=[], metavar="ETAPE=ARGS",
+                    help='Arguments ajoutés à une étape, e.g. story="--stream" (pris en compte dans la clé)')
+    ap.add_argument("--dry-run", action="store_true", help="Affiche ce qui serait lancé, sans rien exécuter")
+    ap.add_argument("--subprocess", action="store_true", help="Un processus Python par étape (comme le workflow)")
+    ap.add_argument("--state", default=str(STATE_PATH), help="Fichier d'état du pipeline")
+    ap.add_argument("--overlap", action="store_true",
+                    help="Prépare les clips de fond (téléchargement, mezzanine) pendant l'histoire et la voix")
+    ap.add_argument("--expect-dur", type=float, default=80.0,
+                    help="Durée de voix estimée (s) pour choisir les clips à préparer avec --overlap")
+    args = ap.parse_args()
+
+    extra = {}
+    for item in args.stage_args:
+        name, _, rest = item.partition("=")
+        if name not in NAMES:
+            ap.error(f"étape inconnue dans --stage-args: {name}")
+        extra[name] = extra.get(name, []) + shlex.split(rest)
+    force = set(NAMES) if args.force == [] else set(args.force or ())
+    selected = NAMES[NAMES.index(args.start):] if args.start else NAMES
+    if args.only:
+        selected = [n for n in selected if n in args.only]
+
+    state_path = pathlib.Path(args.state)
+    state = load_state(state_path)
+    run = run_subprocess if args.subprocess else run_inprocess
+    t_all = time.perf_counter()
+    report, spans = [], []
+    pre, waited = None, 0.0
+    if args.overlap and "merge" in selected and not args.dry_run and "merge" not in will_run(selected, force, state, extra):
+        print("[pipeline] merge à jour: pas de prefetch des clips")
+    elif args.overlap and "merge" in selected and not args.dry_run:
+        merge_args = next(a for n, _, a, *_ in STAGES if n == "merge") + extra.get("merge", [])
+        pre = Prefetch(merge_args + ["--prefetch", str(args.expect_dur)], t_all)
+        print(f"[pipeline] prefetch des clips lancé (voix estimée ~{args.expect_dur:.0f}s)")
+    for name, script, stage_args, inputs, outputs, env in STAGES:
+        if name not in selected:
+            continue
+        stage_args = stage_args + extra.get(name, [])
+        if name == "merge" and pre is not None:
+            t0 = time.perf_counter()
+            if pre.join() != 0:
+                print("[pipeline] prefetch des clips en échec: merge complet", file=sys.stderr)
+            waited = time.perf_counter() - t0
+        key = stage_key(script, stage_args, inputs, env)
+        if name not in force and up_to_date(state.get(name), key, outputs):
+            print(f"[pipeline] {name}: à jour, ignorée")
+            report.append((name, "à jour", 0.0))
+            continue
+        if args.dry_run:
+            print(f"[pipeline] {name}: à relancer -> {script} {' '.join(shlex.quote(a) for a in stage_args)}")
+            report.append((name, "à relancer", 0.0))
+            continue
+        print(f"[pipeline] {name}: lancement de {script}")
+        t0 = time.perf_counter()
+        code = run(script, stage_args)
+        dt = time.perf_counter() - t0
+        spans.append((name, t0 - t_all, t0 - t_all + dt))
+        fp = fingerprint(outputs)
+        if code != 0 or fp is None:
+            state.pop(name, None)
+            save_state(state_path, state)
+            why = f"code {code}" if code != 0 else "sortie manquante/vide"
+            print(f"[pipeline] {name}: ÉCHEC ({why}) après {dt:.2f}s", file=sys.stderr)
+            if pre is not None:
+                pre.join()
+            sys.exit(1)
+        # la clé est recalculée: une étape peut réécrire ses propres entrées (story.chunks.json)
+        state[name] = {"key": stage_key(script, stage_args, inputs, env), "outputs": fp, "at": time.time(), "wall": round(dt, 3)}
+        save_state(state_path, state)
+        report.append((name, "exécutée", dt))
+
+    if pre is not None:
+        pre.join()
+    if spans:
+        for ln in critical_path(spans, pre, waited):
+            print(f"[pipeline] {ln}")
+    done = sum(1 for _, what, _ in report if what == "exécutée")
+    print(f"[pipeline] {done}/{len(report)} étapes exécutées en {time.perf_counter() - t_all:.2f}s "
+          + " | ".join(f"{n}: {w}" + (f" {dt:.1f}s" if dt else "") for n, w, dt in report))
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,391 @@
 #!/usr/bin/env python3
-import argparse, pathlib, subprocess, sys, shlex
+import argparse, json, os, pathlib, subprocess, sys, shlex, time
 
-def main():
-    ap = argparse.ArgumentParser(description="Finalize TikTok video (no subtitles).")
-    ap.add_argument("--video",  required=True, help="Vidéo fusionnée (depuis select_and_merge)")
-    ap.add_argument("--audio",  required=True, help="Audio narratif (voice.wav)")
-    ap.add_argument("--output", required=True, help="Chemin de sortie final")
-    args = ap.parse_args()
+import render_profiles
 
-    v = pathlib.Path(args.video)
-    a = pathlib.Path(args.audio)
-    o = pathlib.Path(args.output)
-    o.parent.mkdir(parents=True, exist_ok=True)
+MIN_CHUNK = 2.0  # s, durée minimale d'un morceau en rendu parallèle
 
-    if not v.exists() or v.stat().st_size == 0:
-        print(f"[render_final] ERREUR: vidéo manquante -> {v}", file=sys.stderr); sys.exit(1)
-    if not a.exists() or a.stat().st_size == 0:
-        print(f"[render_final] ERREUR: audio manquant -> {a}", file=sys.stderr); sys.exit(1)
+def _escape(s: str, chars: str) -> str:
+    return "".join("\\" + c if c in chars else c for c in s)
 
-    # Filtres finaux (pas de sous-titres ici)
-    vf = (
-        "setpts=PTS-STARTPTS,"
-        "scale=1200:2133:force_original_aspect_ratio=increase,"
+def subtitles_vf(ass: pathlib.Path, fonts: pathlib.Path = None) -> str:
+    """Filtre libass incrustant ass; chemins échappés pour l'option puis pour le filtergraph."""
+    def _path(x):
+        return _escape(_escape(pathlib.Path(x).resolve().as_posix(), "\\:'"), "\\'[],;")
+    vf = f"subtitles=filename={_path(ass)}"
+    return vf + (f":fontsdir={_path(fonts)}" if fonts else "")
+
+def finish_vf(profile: dict = None, subs: str = "") -> str:
+    """Wobble + recadrage + netteté + étalonnage (+ sous-titres), sur une image déjà sur-échelonnée (10/9).
+
+    subs: filtre de subtitles_vf(), placé après le recadrage et l'étalonnage (ni tourné
+    ni retouché) et avant fps, dans le même encodage que l'image.
+    """
+    p = profile or render_profiles.get()
+    return (
         "rotate=0.005*sin(2*PI*t):fillcolor=black,"
-        "crop=1080:1920,"
+        f"crop={p['width']}:{p['height']},"
         "unsharp=5:5:0.5:5:5:0.0,"
         "eq=contrast=1.05:brightness=0.02,"
-        "fps=30"
+        + (f"{subs}," if subs else "")
+        + f"fps={p['fps']}"
     )
 
-    cmd = [
+def final_vf(profile: dict = None, t0: float = 0.0, subs: str = "") -> str:
+    """Chaîne complète appliquée au fond fusionné (merged.mp4).
+
+    t0: instant absolu du début de l'entrée (rendu par morceaux), pour que le
+    wobble (fonction de t) et les sous-titres restent calés d'un morceau à l'autre.
+    """
+    p = profile or render_profiles.get()
+    ow, oh = render_profiles.overscan(p["width"], p["height"])
+    setpts = f"setpts=PTS-STARTPTS+{t0:.6f}/TB" if t0 > 0 else "setpts=PTS-STARTPTS"
+    return (
+        f"{setpts},"
+        f"scale={ow}:{oh}:force_original_aspect_ratio=increase,"
+        + finish_vf(p, subs)
+    )
+
+def build_cmd(v: pathlib.Path, a: pathlib.Path, o: pathlib.Path, profile: dict = None, subs: str = "") -> list:
+    p = profile or render_profiles.get()
+    # Filtres finaux, sous-titres incrustés dans la même passe
+    vf = final_vf(p, subs=subs)
+    return [
         "ffmpeg","-nostdin","-y",
         "-i", str(v),
         "-i", str(a),
         "-filter_complex", f"[0:v]{vf}[v0];[1:a]asetpts=PTS-STARTPTS[a0]",
         "-map","[v0]","-map","[a0]",
-        "-c:v","libx264","-preset","medium","-crf","18","-pix_fmt","yuv420p",
-        "-c:a","aac","-b:a","192k",
+        *render_profiles.x264_args(p),
+        *render_profiles.audio_args(p),
+        *render_profiles.metadata_args(p),
         "-movflags","+faststart",
         "-shortest",
         str(o)
     ]
 
-    print("[render_final] Exécution FFmpeg…")
+def poster_time(timeline: pathlib.Path, default: float = 1.0) -> float:
+    """Milieu du carton titre d'après timeline.json (voice_elevenlabs), sinon default."""
+    try:
+        t = json.loads(timeline.read_text(encoding="utf-8"))["title"]
+        st, en = float(t["start"]), float(t["end"])
+        if en > st:
+            return (st + en) / 2
+    except Exception:
+        pass
+    return default
+
+def ladder_outputs(o: pathlib.Path, names) -> dict:
+    return {n: o.with_name(o.stem + render_profiles.RENDITIONS[n]["suffix"]) for n in names}
+
+def rendition_vf(r: dict, p: dict, poster_t: float, total: float) -> str:
+    """Filtre appliqué à l'image déjà finie (sortie de final_vf) pour une sortie dérivée."""
+    if r["kind"] == "video":
+        return f"scale={r['width']}:{r['height']}"
+    if r["kind"] == "image":
+        return f"trim=start={poster_t:.6f}:end={poster_t + 1.5 / p['fps']:.6f},setpts=PTS-STARTPTS"
+    n = r["cols"] * r["rows"]
+    return f"fps={n / max(total, 1e-3):.6f},scale={r['width']}:{r['height']},tile={r['cols']}x{r['rows']}"
+
+def rendition_args(r: dict) -> list:
+    if r["kind"] == "video":
+        # tag propre (render_profile=preview): dropbox_upload ne la prendra pas pour un rendu final
+        return [*render_profiles.x264_args(r), *render_profiles.audio_args(r), *render_profiles.metadata_args(r),
+                "-movflags","+faststart","-shortest"]
+    return ["-frames:v","1","-q:v",str(r["quality"]),"-update","1"]
+
+def ladder_cmd(v: pathlib.Path, a: pathlib.Path, o: pathlib.Path, names, profile: dict = None,
+               poster_t: float = 1.0, total: float = 0.0, subs: str = "") -> list:
+    """Un seul décodage + une seule chaîne de filtres, puis split vers la vidéo finale et
+    chaque sortie dérivée (render_profiles.RENDITIONS)."""
+    p = profile or render_profiles.get()
+    rs = [render_profiles.rendition(n) for n in names]
+    outs = ladder_outputs(o, names)
+    videos = [r for r in rs if r["kind"] == "video"]
+    chains = [f"[0:v]{final_vf(p, subs=subs)},split={1 + len(rs)}[vmain]" + "".join(f"[v{i}]" for i in range(len(rs))),
+              f"[1:a]asetpts=PTS-STARTPTS,asplit={1 + len(videos)}[amain]" + "".join(f"[a{j}]" for j in range(len(videos)))]
+    maps = ["-map","[vmain]","-map","[amain]",
+            *render_profiles.x264_args(p), *render_profiles.audio_args(p), *render_profiles.metadata_args(p),
+            "-movflags","+faststart","-shortest", str(o)]
+    j = 0
+    for i, r in enumerate(rs):
+        chains.append(f"[v{i}]{rendition_vf(r, p, poster_t, total)}[o{i}]")
+        maps += ["-map", f"[o{i}]"]
+        if r["kind"] == "video":
+            maps += ["-map", f"[a{j}]"]
+            j += 1
+        maps += [*rendition_args(r), str(outs[r["name"]])]
+    return ["ffmpeg","-nostdin","-y","-i", str(v),"-i", str(a),"-filter_complex", ";".join(chains), *maps]
+
+def separate_cmd(final: pathlib.Path, r: dict, dst: pathlib.Path, p: dict, poster_t: float, total: float) -> list:
+    """Ancienne méthode: une passe ffmpeg par sortie dérivée, relisant la vidéo finale."""
+    if r["kind"] == "image":
+        return ["ffmpeg","-nostdin","-y","-v","error","-ss", f"{poster_t:.3f}","-i", str(final),
+                *rendition_args(r), str(dst)]
+    return ["ffmpeg","-nostdin","-y","-v","error","-i", str(final),
+            "-vf", rendition_vf(r, p, poster_t, total), *(["-map","0:v","-map","0:a"] if r["kind"] == "video" else []),
+            *rendition_args(r), str(dst)]
+
+def render_ladder(v: pathlib.Path, a: pathlib.Path, o: pathlib.Path, names, profile: dict,
+                  timeline: pathlib.Path, bench: bool = False, subs: str = "") -> float:
+    """Vidéo finale + sorties dérivées en une passe. Avec bench, refait le tout en passes séparées."""
+    import media_probe
+    p = profile
+    vd, ad = media_probe.duration(v), media_probe.duration(a)
+    total = min(vd, ad) if vd > 0 and ad > 0 else max(vd, ad)
+    poster_t = min(poster_time(timeline), max(0.0, total - 1.0 / p["fps"]))
+    cmd = ladder_cmd(v, a, o, names, p, poster_t, total, subs)
+    print(f"[render_final] Exécution FFmpeg… (profil {p['name']}, sorties: final, {', '.join(names)})")
+    print(" ".join(shlex.quote(c) for c in cmd))
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    wall = time.perf_counter() - t0
+    print(f"[render_final] OK -> {o} [{p['name']}] + {', '.join(str(x) for x in ladder_outputs(o, names).values())} "
+          f"(une passe, wall {wall:.2f}s; poster à {poster_t:.2f}s)")
+    if not bench:
+        return wall
+
+    so = o.with_name(o.stem + "_separate" + o.suffix)
+    t0 = time.perf_counter()
+    subprocess.run(build_cmd(v, a, so, p, subs), check=True)
+    times = [("final", time.perf_counter() - t0)]
+    for n, dst in ladder_outputs(so, names).items():
+        t0 = time.perf_counter()
+        subprocess.run(separate_cmd(so, render_profiles.rendition(n), dst, p, poster_t, total), check=True)
+        times.append((n, time.perf_counter() - t0))
+    sep = sum(dt for _, dt in times)
+    print(f"[render_final] bench: une passe {wall:.2f}s | passes séparées {sep:.2f}s "
+          f"({' + '.join(f'{n} {dt:.2f}s' for n, dt in times)}) -> {sep - wall:.2f}s gagnées (x{sep / max(wall, 1e-6):.2f})")
+    return wall
+
+def segments_path(v: pathlib.Path) -> pathlib.Path:
+    """Débuts des clips dans merged.mp4, écrits par select_and_merge à côté de la vidéo."""
+    return v.with_name(v.name + ".segments.json")
+
+def write_segments(v: pathlib.Path, starts):
+    st = v.stat()
+    segments_path(v).write_text(json.dumps({"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                            "starts": [round(t, 6) for t in starts]}), encoding="utf-8")
+
+def clip_starts(v: pathlib.Path):
+    """Débuts de clips de v (s), ou None si le fichier des segments manque ou ne correspond plus à v."""
+    try:
+        meta = json.loads(segments_path(v).read_text(encoding="utf-8"))
+        st = v.stat()
+        if meta["size"] == st.st_size and meta["mtime_ns"] == st.st_mtime_ns:
+            return [float(t) for t in meta["starts"]]
+    except Exception:
+        pass
+    return None
+
+def chunk_bounds(v: pathlib.Path, total: float, parts: int, fps: int) -> list:
+    """Découpe [0, total) en ~parts morceaux, coupés aux changements de clip de v et
+    alignés sur la grille d'images de sortie.
+
+    Les débuts de clips viennent de select_and_merge (segments_path); chacun est recalé
+    sur l'image clé de v la plus proche (un segment commence par une image clé). Sans ce
+    fichier, les coupes se font sur les images clés de v — une par seconde dans un merge
+    issu des mezzanines, donc pas forcément sur un changement de plan.
+    """
+    import keyframe_index
+    keys = keyframe_index.load(v)["keyframes"]
+    starts = clip_starts(v)
+    if starts is not None:
+        def _snap(t):
+            k = min(keys, key=lambda x: abs(x - t), default=t)
+            return k if abs(k - t) <= 0.5 else t
+        keys = sorted({_snap(t) for t in starts})
+    keys = [k for k in keys if MIN_CHUNK <= k <= total - MIN_CHUNK]
+    cuts = []
+    for k in range(1, parts):
+        target = total * k / parts
+        if not keys:
+            break
+        t = min(keys, key=lambda x: abs(x - target))
+        t = round(t * fps) / fps
+        if t - (cuts[-1] if cuts else 0.0) >= MIN_CHUNK and total - t >= MIN_CHUNK:
+            cuts.append(t)
+    edges = [0.0] + cuts + [total]
+    return [(a, b - a) for a, b in zip(edges, edges[1:])]
+
+def chunk_cmd(v: pathlib.Path, dst: pathlib.Path, start: float, dur: float, profile: dict, threads: int = 0,
+              subs: str = "") -> list:
+    """Un morceau vidéo seul, GOP fermé commençant par une image clé: concaténable en -c copy."""
+    p = profile
+    fps = p["fps"]
+    return [
+        "ffmpeg","-nostdin","-y","-v","error",
+        "-ss", f"{start:.6f}", "-t", f"{dur + 1.0 / fps:.6f}",
+        "-i", str(v),
+        "-an",
+        "-vf", final_vf(p, start, subs) + ",setpts=PTS-STARTPTS",
+        "-frames:v", str(max(1, round(dur * fps))),
+        *render_profiles.x264_args(p),
+        "-g", str(fps), "-keyint_min", str(fps), "-sc_threshold", "0", "-flags", "+cgop",
+        *(["-threads", str(threads)] if threads > 0 else []),
+        str(dst)
+    ]
+
+def render_parallel(v: pathlib.Path, a: pathlib.Path, o: pathlib.Path, parts: int, profile: dict = None,
+                    subs: str = "") -> float:
+    """Rendu par morceaux en parallèle puis concat -c copy + mux de la voix. Renvoie le wall (s)."""
+    import ffmpeg_pool, media_probe
+    p = profile or render_profiles.get()
+    t0 = time.perf_counter()
+    vd, ad = media_probe.duration(v), media_probe.duration(a)
+    total = min(vd, ad) if vd > 0 and ad > 0 else max(vd, ad)
+    bounds = chunk_bounds(v, total, parts, p["fps"])
+    workers, threads = ffmpeg_pool.split_cores(len(bounds), parts)
+    tmp = o.parent / f"{o.stem}_chunks"
+    tmp.mkdir(parents=True, exist_ok=True)
+    print(f"[render_final] {len(bounds)} morceaux, {workers} workers x {threads} threads")
+
+    def _one(k):
+        start, dur = bounds[k]
+        dst = tmp / f"chunk_{k:02d}.mp4"
+        subprocess.run(chunk_cmd(v, dst, start, dur, p, threads, subs), check=True)
+        return dst
+
+    results = ffmpeg_pool.run_ordered(_one, list(range(len(bounds))), workers)
+    for k, _, exc in results:
+        if exc is not None:
+            raise RuntimeError(f"morceau {k} ({bounds[k][0]:.2f}s) échoué: {exc}")
+    lst = tmp / "list.txt"
+    lst.write_text("".join(f"file '{dst.resolve().as_posix()}'\n" for _, dst, _ in results), encoding="utf-8")
+    subprocess.run([
+        "ffmpeg","-nostdin","-y","-v","error",
+        "-f","concat","-safe","0","-i", str(lst),
+        "-i", str(a),
+        "-map","0:v","-map","1:a",
+        "-c:v","copy",
+        *render_profiles.audio_args(p),
+        *render_profiles.metadata_args(p),
+        "-movflags","+faststart",
+        "-shortest",
+        str(o)
+    ], check=True)
+    for _, dst, _ in results:
+        dst.unlink(missing_ok=True)
+    lst.unlink(missing_ok=True)
+    try:
+        tmp.rmdir()
+    except OSError:
+        pass
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="Finalize TikTok video (sous-titres ASS incrustés dans la même passe).")
+    ap.add_argument("--video",  required=True, help="Vidéo fusionnée (depuis select_and_merge)")
+    ap.add_argument("--audio",  required=True, help="Audio narratif (voice.wav)")
+    ap.add_argument("--output", required=True, help="Chemin de sortie final")
+    ap.add_argument("--profile", default=None, choices=sorted(render_profiles.PROFILES),
+                    help="Profil de rendu (défaut: $RENDER_PROFILE ou final)")
+    ap.add_argument("--parallel", type=int, default=0,
+                    help="Rendu en N morceaux parallèles (GOP fermés, concat -c copy); 0 = un seul ffmpeg")
+    ap.add_argument("--subs", default=None, help="Sous-titres ASS à incruster (e.g. subs/captions.ass)")
+    ap.add_argument("--no-font-cache", action="store_true",
+                    help="Laisse libass chercher les polices du système (pas de fontsdir en cache)")
+    ap.add_argument("--bench", action="store_true",
+                    help="Compare le wall du rendu parallèle (ou de --ladder) à celui de l'ancienne méthode; "
+                         "avec --subs seul, compare les fps de rendu avec et sans sous-titres, "
+                         "et avec le cache de polices ou les polices du système")
+    ap.add_argument("--ladder", default="",
+                    help="Sorties dérivées écrites dans la même passe, e.g. preview,poster,sprite "
+                         "(définies dans render_profiles.RENDITIONS)")
+    ap.add_argument("--timeline", default="audio/timeline.json", help="Timeline de la voix (instant du poster)")
+    args = ap.parse_args()
+    profile = render_profiles.get(args.profile)
+    ladder = [n.strip() for n in args.ladder.split(",") if n.strip()]
+    for n in ladder:
+        if n not in render_profiles.RENDITIONS:
+            ap.error(f"sortie inconnue dans --ladder: {n} (choix: {', '.join(render_profiles.RENDITIONS)})")
+
+    v = pathlib.Path(args.video)
+    a = pathlib.Path(args.audio)
+    o = pathlib.Path(args.output)
+    o.parent.mkdir(parents=True, exist_ok=True)
+
+    if not v.exists() or v.stat().st_size == 0:
+        print(f"[render_final] ERREUR: vidéo manquante -> {v}", file=sys.stderr); sys.exit(1)
+    if not a.exists() or a.stat().st_size == 0:
+        print(f"[render_final] ERREUR: audio manquant -> {a}", file=sys.stderr); sys.exit(1)
+
+    subs = ""
+    if args.subs:
+        ass = pathlib.Path(args.subs)
+        if not ass.exists() or ass.stat().st_size == 0:
+            print(f"[render_final] ERREUR: sous-titres manquants -> {ass}", file=sys.stderr); sys.exit(1)
+        fonts = None
+        if not args.no_font_cache:
+            import font_cache
+            fonts = font_cache.fontsdir(ass)
+        if fonts:
+            # hérité par tous les ffmpeg de ce rendu: fontconfig ne charge que le fontsdir en cache
+            sys_env = dict(os.environ)
+            os.environ["FONTCONFIG_FILE"] = str(font_cache.write_conf(fonts))
+        subs = subtitles_vf(ass, fonts)
+        print(f"[render_final] sous-titres: {ass}" + (f" (polices: {fonts})" if fonts else ""))
+
+    if ladder:
+        if args.parallel > 1:
+            print("[render_final] --ladder: rendu en une seule passe, --parallel ignoré", file=sys.stderr)
+        try:
+            render_ladder(v, a, o, ladder, profile, pathlib.Path(args.timeline), args.bench, subs)
+        except subprocess.CalledProcessError as e:
+            print(f"[render_final] ERREUR FFmpeg: {e}", file=sys.stderr); sys.exit(1)
+        return
+
+    if args.parallel > 1:
+        try:
+            wall_par = render_parallel(v, a, o, args.parallel, profile, subs)
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            print(f"[render_final] ERREUR rendu parallèle: {e}", file=sys.stderr); sys.exit(1)
+        print(f"[render_final] OK -> {o} [{profile['name']}] ({args.parallel} morceaux, wall {wall_par:.2f}s)")
+        if not args.bench:
+            return
+        o = o.with_name(o.stem + "_single" + o.suffix)
+
+    cmd = build_cmd(v, a, o, profile, subs)
+
+    print(f"[render_final] Exécution FFmpeg… (profil {profile['name']})")
     print(" ".join(shlex.quote(c) for c in cmd))
+    t0 = time.perf_counter()
     try:
         subprocess.run(cmd, check=True)
     except subprocess.CalledProcessError as e:
         print(f"[render_final] ERREUR FFmpeg: {e}", file=sys.stderr); sys.exit(1)
 
-    print(f"[render_final] OK -> {o}")
+    wall = time.perf_counter() - t0
+    print(f"[render_final] OK -> {o} [{profile['name']}] (wall {wall:.2f}s)")
+    if args.parallel > 1 and args.bench:
+        print(f"[render_final] bench: un seul ffmpeg {wall:.2f}s | {args.parallel} morceaux {wall_par:.2f}s "
+              f"(x{wall / max(wall_par, 1e-6):.2f})")
+    elif args.bench and subs:
+        import media_probe
+        frames = media_probe.duration(o) * profile["fps"]
+        bo = o.with_name(o.stem + "_nosubs" + o.suffix)
+        t0 = time.perf_counter()
+        try:
+            subprocess.run(build_cmd(v, a, bo, profile), check=True)
+        except subprocess.CalledProcessError as e:
+            print(f"[render_final] ERREUR FFmpeg (bench): {e}", file=sys.stderr); sys.exit(1)
+        bare = time.perf_counter() - t0
+        fs, fb = frames / max(wall, 1e-6), frames / max(bare, 1e-6)
+        print(f"[render_final] bench: {frames:.0f} images | sans sous-titres {fb:.1f} fps ({bare:.2f}s) | "
+              f"avec {fs:.1f} fps ({wall:.2f}s) -> coût des sous-titres {100 * (1 - fs / max(fb, 1e-6)):.1f} %")
+        if fonts:
+            # mêmes sous-titres, polices cherchées par fontconfig dans tout le système
+            so = o.with_name(o.stem + "_sysfonts" + o.suffix)
+            t0 = time.perf_counter()
+            try:
+                subprocess.run(build_cmd(v, a, so, profile, subtitles_vf(pathlib.Path(args.subs))), check=True,
+                               env=sys_env)
+            except subprocess.CalledProcessError as e:
+                print(f"[render_final] ERREUR FFmpeg (bench): {e}", file=sys.stderr); sys.exit(1)
+            sysw = time.perf_counter() - t0
+            fy = frames / max(sysw, 1e-6)
+            print(f"[render_final] bench: polices système {fy:.1f} fps ({sysw:.2f}s) | cache de polices {fs:.1f} fps "
+                  f"({wall:.2f}s) -> gain {sysw - wall:.2f}s ({100 * (fs / max(fy, 1e-6) - 1):.1f} %)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Profils de rendu partagés par toutes les étapes vidéo (draft / review / final).
+
+Le profil est choisi par --profile ou la variable RENDER_PROFILE (défaut: final) et
+inscrit dans les métadonnées de chaque vidéo produite (tag comment=render_profile=...),
+ce qui permet à dropbox_upload.py de refuser tout ce qui n'est pas un rendu final.
+"""
+import os
+
+PROFILES = {
+    "draft":  {"width": 540,  "height": 960,  "fps": 15, "preset": "ultrafast", "crf": 30, "audio_bitrate": "96k"},
+    "review": {"width": 720,  "height": 1280, "fps": 30, "preset": "veryfast",  "crf": 23, "audio_bitrate": "128k"},
+    "final":  {"width": 1080, "height": 1920, "fps": 30, "preset": "medium",    "crf": 18, "audio_bitrate": "192k"},
+}
+DEFAULT = "final"
+
+# Sorties dérivées écrites dans la même passe que la vidéo finale (render_final --ladder),
+# à côté d'elle: <sortie><suffix>
+RENDITIONS = {
+    "preview": {"kind": "video",  "suffix": "_preview.mp4", "width": 540, "height": 960,
+                "preset": "veryfast", "crf": 28, "audio_bitrate": "64k"},
+    "poster":  {"kind": "image",  "suffix": "_poster.jpg", "quality": 2},   # taille du profil, au carton titre
+    "sprite":  {"kind": "sprite", "suffix": "_sprite.jpg", "width": 180, "height": 320, "cols": 5, "rows": 5,
+                "quality": 4},
+}
+TAG_PREFIX = "render_profile="
+
+def get(name: str = None) -> dict:
+    name = (name or os.environ.get("RENDER_PROFILE") or DEFAULT).strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"profil de rendu inconnu: {name} (choix: {', '.join(PROFILES)})")
+    return dict(PROFILES[name], name=name)
+
+def rendition(name: str) -> dict:
+    if name not in RENDITIONS:
+        raise ValueError(f"sortie inconnue: {name} (choix: {', '.join(RENDITIONS)})")
+    return dict(RENDITIONS[name], name=name)
+
+def overscan(w: int, h: int):
+    """Sur-échelle de 10/9 utilisée avant rotation + recadrage (1080x1920 -> 1200x2133)."""
+    return round(w * 10 / 9), round(h * 10 / 9)
+
+def x264_args(p: dict) -> list:
+    return ["-c:v","libx264","-preset",p["preset"],"-crf",str(p["crf"]),"-pix_fmt","yuv420p"]
+
+def audio_args(p: dict) -> list:
+    return ["-c:a","aac","-b:a",p["audio_bitrate"]]
+
+def metadata_args(p: dict) -> list:
+    return ["-metadata", f"comment={TAG_PREFIX}{p['name']}"]
+
+def profile_of(info: dict) -> str:
+    """Nom du profil lu dans les tags d'un media_probe.probe(), '' si absent."""
+    comment = (info.get("tags") or {}).get("comment", "")
+    return comment[len(TAG_PREFIX):] if comment.startswith(TAG_PREFIX) else ""
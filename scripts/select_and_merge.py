@@ -1,21 +1,20 @@
 #!/usr/bin/env python3
-import argparse, pathlib, sys, subprocess, shlex, json, re, os, tempfile
+import argparse, pathlib, sys, subprocess, shlex, json, re, os, tempfile, time
 from urllib.parse import urlparse
-import requests
 
-ROOT = pathlib.Path(__file__).resolve().parent.parent
+import render_final
+import render_profiles
+from ffmpeg_pool import split_cores, run_ordered
+import downloader
+import mezzanine
+import keyframe_index
+import log_context
+import media_probe
+import clip_planner
+import mp4_remote
 
-def ffprobe_duration(p: pathlib.Path) -> float:
-    try:
-        out = subprocess.check_output([
-            "ffprobe","-v","error",
-            "-show_entries","format=duration",
-            "-of","default=nk=1:nw=1",
-            str(p)
-        ]).decode("utf-8","ignore").strip()
-        return float(out)
-    except Exception:
-        return 0.0
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+PREFETCH_MARGIN = 1.25  # --prefetch: marge sur la durée estimée de la voix
 
 def is_url(s: str) -> bool:
     try:
@@ -31,139 +30,344 @@ def safe_lines(txt: str):
             continue
         yield ln
 
-def download(url: str, out: pathlib.Path):
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with open(out, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024*256):
-                if chunk:
-                    f.write(chunk)
+def fade_times(keep_dur: float, fade_d: float):
+    """(fade_in, fade_out, début du fade out), ajustés si le segment est court."""
+    fin = min(fade_d, max(0.05, keep_dur * 0.25))
+    fout = min(fade_d, max(0.05, keep_dur * 0.25))
+    st_out = max(0.0, keep_dur - fout)
+    return fin, fout, st_out
+
+def fetch_partial(plan, partial_dir: pathlib.Path, workers: int, session=None):
+    """Sous-plages distantes du plan -> fichiers locaux creux (mp4_remote).
+
+    Renvoie ({(url, début, durée): chemin}, URLs à télécharger en entier (mp4_remote.Unsupported)).
+    """
+    session = session or downloader.make_session(max(workers, 1))
+    items = [(k, st, d) for k, st, d in plan if is_url(k)]
+
+    def _one(item):
+        url, st, d = item
+        return mp4_remote.fetch_range(url, st, d, partial_dir, session)
+
+    out, full, total = {}, set(), 0
+    for item, res, err in run_ordered(_one, items, workers):
+        if err is None:
+            out[item] = res[0]
+            total += res[1]
+        elif isinstance(err, mp4_remote.Unsupported):
+            print(f"[select_and_merge] Lecture partielle impossible ({item[0]}): {err} -> téléchargement complet")
+            full.add(item[0])
+        else:
+            print(f"[select_and_merge] Lecture partielle échouée ({item[0]}): {err}", file=sys.stderr)
+    if items:
+        print(f"[select_and_merge] lecture partielle: {len(out)}/{len(items)} clips, "
+              f"{total / (1024 * 1024):.2f} Mo transférés")
+    return out, full
+
+def make_planner(clips, audio_dur: float, min_keep: float, history: dict, max_use: float,
+                 cache_dir: pathlib.Path, download_workers: int, partial_dir: pathlib.Path = None, session=None):
+    """Renvoie plan_fn(exclus) -> [(chemin local, début, durée)].
+
+    clips: [(clé, durée)], clé = URL ou chemin local. Seules les URLs retenues par le
+    plan sont téléchargées; un téléchargement raté écarte le clip et relance le plan.
+    Avec partial_dir, seules les sous-plages retenues sont lues (HTTP Range) dans des
+    fichiers creux au lieu de télécharger les clips entiers.
+    plan_fn.keys contient les clés du dernier plan (pour l'historique d'usage).
+    session: session HTTP partagée (batch), sinon une par appel.
+    """
+    local_of = {k: pathlib.Path(k) for k, _ in clips if not is_url(k)}
+    sparse_of = {}  # fichier creux -> URL (lecture partielle)
+    excluded_keys = set()
+
+    def plan_fn(excluded=()):
+        excluded_keys.update(k for k, lp in local_of.items() if lp in excluded)
+        excluded_keys.update(sparse_of[lp] for lp in excluded if lp in sparse_of)
+        while True:
+            avail = [(k, d) for k, d in clips if k not in excluded_keys]
+            t0 = time.perf_counter()
+            plan = clip_planner.plan(avail, audio_dur, min_keep, history, max_use)
+            print(f"[select_and_merge] plan: {len(plan)} clips parmi {len(avail)} "
+                  f"en {(time.perf_counter() - t0) * 1000:.1f} ms")
+            if partial_dir is not None:
+                parts, full = fetch_partial([x for x in plan if x[0] not in local_of], partial_dir,
+                                            download_workers, session)
+                if full:
+                    got, _ = downloader.fetch_all(sorted(full), cache_dir, download_workers, session)
+                    local_of.update({u: lp for u, lp in got.items() if lp})
+                missing = [k for k, st, d in plan if is_url(k) and (k, st, d) not in parts and k not in local_of]
+                if missing:
+                    excluded_keys.update(missing)
+                    continue
+                sparse_of.update({lp: k for (k, _, _), lp in parts.items()})
+                plan_fn.keys = [k for k, _, _ in plan]
+                return [(parts.get((k, st, d)) or local_of[k], st, d) for k, st, d in plan]
+            urls = [k for k, _, _ in plan if is_url(k) and k not in local_of]
+            if urls:
+                got, _ = downloader.fetch_all(urls, cache_dir, download_workers, session)
+                local_of.update({u: lp for u, lp in got.items() if lp})
+                missing = [u for u in urls if not got.get(u)]
+                if missing:
+                    excluded_keys.update(missing)
+                    continue
+            plan_fn.keys = [k for k, _, _ in plan]
+            return [(local_of[k], st, d) for k, st, d in plan]
+
+    plan_fn.keys = []
+    return plan_fn
+
+def load_clips(sources, cache_dir: pathlib.Path, download_workers: int, session=None):
+    """[(clé, durée)] des sources exploitables (index media_probe; les URLs sont sondées à distance)."""
+    keys = []
+    for src in sources:
+        if is_url(src):
+            keys.append(src)
+        else:
+            p = (ROOT / src).resolve() if not os.path.isabs(src) else pathlib.Path(src).resolve()
+            if p.exists() and p.stat().st_size > 0:
+                keys.append(str(p))
+    keys = list(dict.fromkeys(keys))
+    infos = media_probe.probe_many(keys, session=session)
+
+    unknown = [k for k in keys if is_url(k) and not infos[k].get("duration")]
+    if unknown:
+        # durée distante illisible: on télécharge pour sonder en local
+        got, _ = downloader.fetch_all(unknown, cache_dir, download_workers, session)
+        for u in unknown:
+            if got.get(u):
+                infos[u] = media_probe.probe(got[u])
+        media_probe.save_index()
+    clips = [(k, float(infos[k].get("duration") or 0.0)) for k in keys]
+    return [(k, d) for k, d in clips if d > 0]
+
+def prefetch_clips(clips, expect_dur: float, min_keep: float, history: dict, max_use: float,
+                   cache_dir: pathlib.Path, download_workers: int, mezz_dir: pathlib.Path = None,
+                   profile: dict = None, jobs: int = 0, session=None, mezz_used: set = None) -> int:
+    """Prépare, avant que la voix existe, les clips que le plan retiendra probablement.
+
+    Le plan est calculé pour expect_dur x PREFETCH_MARGIN avec le même historique (donc
+    le même ordre) que le vrai plan, qui en est en pratique un préfixe. Ces clips sont
+    téléchargés puis normalisés (mezzanine): le vrai run ne trouve plus que des hits.
+    Les mezzanines prêts sont ajoutés à mezz_used. Renvoie le nombre de clips prêts.
+    """
+    plan = clip_planner.plan(clips, expect_dur * PREFETCH_MARGIN, min_keep, history, max_use)
+    keys = [k for k, _, _ in plan]
+    urls = [k for k in keys if is_url(k)]
+    local = {k: pathlib.Path(k) for k in keys if not is_url(k)}
+    if urls:
+        got, _ = downloader.fetch_all(urls, cache_dir, download_workers, session)
+        local.update({u: lp for u, lp in got.items() if lp})
+    srcs = [local[k] for k in keys if k in local]
+    if mezz_dir is None:
+        return len(srcs)
+    params = mezzanine.params_for(profile or render_profiles.get())
+    workers, threads = split_cores(len(srcs), jobs)
+    done = run_ordered(lambda src: mezzanine.ensure(src, mezz_dir, params, threads=threads), srcs, workers)
+    for src, mz, err in done:
+        if err is not None:
+            print(f"[select_and_merge] prefetch: mezzanine échoué ({src.name}): {err}", file=sys.stderr)
+        elif mezz_used is not None:
+            mezz_used.add(mz)
+    return sum(1 for _, _, err in done if err is None)
+
+def single_pass_cmd(plan, audio: pathlib.Path, out: pathlib.Path, fade_d: float, profile: dict = None) -> list:
+    """Un seul filter_complex: trim + fades + scale/crop par clip, concat, finition, mux audio.
+
+    Le recadrage 1080x1920 puis le ré-agrandissement en 1200x2133 du chemin en deux
+    étapes sont fusionnés en un seul scale (facteur 10/9) suivi d'un crop 1200x2133.
+    """
+    pr = profile or render_profiles.get()
+    ow, oh = render_profiles.overscan(pr["width"], pr["height"])
+    sw, sh = render_profiles.overscan(ow, oh)
+    inputs, chains = [], []
+    for i, (src, start, keep) in enumerate(plan):
+        inputs += ["-ss", f"{start:.3f}", "-t", f"{keep:.3f}", "-i", str(src)]
+        fin, fout, st_out = fade_times(keep, fade_d)
+        chains.append(
+            f"[{i}:v]trim=duration={keep:.3f},setpts=PTS-STARTPTS,"
+            f"scale={sw}:{sh}:force_original_aspect_ratio=increase,"
+            f"crop={ow}:{oh},setsar=1,fps={pr['fps']},"
+            f"fade=t=in:st=0:d={fin:.3f},"
+            f"fade=t=out:st={st_out:.3f}:d={fout:.3f}[s{i}]"
+        )
+    n = len(plan)
+    chains.append("".join(f"[s{i}]" for i in range(n)) + f"concat=n={n}:v=1:a=0[bg]")
+    chains.append(f"[bg]{render_final.finish_vf(pr)}[v0]")
+    chains.append(f"[{n}:a]asetpts=PTS-STARTPTS[a0]")
+    return [
+        "ffmpeg","-nostdin","-y",
+        *inputs,
+        "-i", str(audio),
+        "-filter_complex", ";".join(chains),
+        "-map","[v0]","-map","[a0]",
+        *render_profiles.x264_args(pr),
+        *render_profiles.audio_args(pr),
+        *render_profiles.metadata_args(pr),
+        "-movflags","+faststart",
+        "-shortest",
+        str(out)
+    ]
 
-def build_faded_clip(src: pathlib.Path, dst: pathlib.Path, keep_dur: float, fade_d: float):
-    """Recadre 1080x1920 @30fps + fade in/out noir puis encode H.264.
+def build_faded_clip(src: pathlib.Path, dst: pathlib.Path, keep_dur: float, fade_d: float, threads: int = 0,
+                     normalized: bool = False, start: float = 0.0, profile: dict = None):
+    """Recadre à la taille du profil (1080x1920 @30fps en final) + fade in/out noir puis encode H.264.
        keep_dur: durée désirée de ce segment (en s) après tronquage.
+       start: début de la sous-plage dans la source (s).
        fade_d: durée du fade in et du fade out (s), ajustée si segment court.
+       threads: threads alloués à ce ffmpeg (0 = laisse ffmpeg décider).
+       normalized: src est un mezzanine déjà à la taille du profil -> coupe + fades seulement.
+       profile: profil de rendu (render_profiles), défaut $RENDER_PROFILE ou final.
     """
+    pr = profile or render_profiles.get()
+    ow, oh = render_profiles.overscan(pr["width"], pr["height"])
     if keep_dur <= 0.05:
         raise ValueError("keep_dur trop court")
 
-    # Ajuste fade si segment trop court
-    fin = min(fade_d, max(0.05, keep_dur * 0.25))
-    fout = min(fade_d, max(0.05, keep_dur * 0.25))
-    st_out = max(0.0, keep_dur - fout)
+    fin, fout, st_out = fade_times(keep_dur, fade_d)
 
     vf = (
-        "scale=1200:2133:force_original_aspect_ratio=increase,"
-        "crop=1080:1920,"
-        f"fade=t=in:st=0:d={fin:.3f},"
+        ("" if normalized else
+         f"scale={ow}:{oh}:force_original_aspect_ratio=increase,"
+         f"crop={pr['width']}:{pr['height']},")
+        + f"fade=t=in:st=0:d={fin:.3f},"
         f"fade=t=out:st={st_out:.3f}:d={fout:.3f}"
     )
     cmd = [
         "ffmpeg","-nostdin","-y",
+        *(["-ss", f"{start:.3f}"] if start > 0 else []),
         "-i", str(src),
         "-t", f"{keep_dur:.3f}",
         "-an",
         "-vf", vf,
-        "-r","30",
-        "-c:v","libx264","-preset","medium","-crf","18","-pix_fmt","yuv420p",
+        "-r", str(pr["fps"]),
+        *render_profiles.x264_args(pr),
+        *(["-threads", str(threads)] if threads > 0 else []),
         str(dst)
     ]
-    subprocess.run(cmd, check=True)
+    subprocess.run(cmd, check=True, **log_context.stdio())
 
-def main():
-    ap = argparse.ArgumentParser(description="Select clips to match audio length, add fade-to-black between clips, and merge.")
-    ap.add_argument("--manifest", required=True, help="Fichier manifeste (chemins locaux ou URLs, 1 par ligne)")
-    ap.add_argument("--audio",    required=True, help="Audio narratif (voice.wav)")
-    ap.add_argument("--out",      required=True, help="Vidéo fusionnée de sortie (e.g., selected_media/merged.mp4)")
-    ap.add_argument("--fade",     type=float, default=0.30, help="Durée fade in/out par segment (s)")
-    ap.add_argument("--min-keep", type=float, default=1.00, help="Durée minimale utile d’un segment (s)")
-    args = ap.parse_args()
+def gop_cuts(idx: dict, start: float, keep_dur: float, fade_d: float, min_copy: float = 1.0):
+    """Frontières de GOP (k1, k2) encadrant la partie sans fondu d'un segment, ou None.
 
-    mpath = (ROOT / args.manifest).resolve() if not os.path.isabs(args.manifest) else pathlib.Path(args.manifest).resolve()
-    apath = (ROOT / args.audio).resolve()    if not os.path.isabs(args.audio)    else pathlib.Path(args.audio).resolve()
-    outp  = (ROOT / args.out).resolve()      if not os.path.isabs(args.out)      else pathlib.Path(args.out).resolve()
-
-    smdir = (ROOT / "selected_media").resolve()
-    smdir.mkdir(parents=True, exist_ok=True)
-    outp.parent.mkdir(parents=True, exist_ok=True)
-
-    if not mpath.exists() or mpath.stat().st_size == 0:
-        print(f"[select_and_merge] Manifeste introuvable/vide: {mpath}", file=sys.stderr); sys.exit(1)
-    if not apath.exists() or apath.stat().st_size == 0:
-        print(f"[select_and_merge] Audio introuvable/vide: {apath}", file=sys.stderr); sys.exit(1)
-
-    # Durée cible = durée audio
-    audio_dur = ffprobe_duration(apath)
-    if audio_dur <= 0.1:
-        print("[select_and_merge] Durée audio invalide.", file=sys.stderr); sys.exit(1)
+    [start, k1) porte le fade in et [k2, start+keep_dur) le fade out: seules ces fenêtres
+    sont ré-encodées, [k1, k2) est copié tel quel depuis le mezzanine.
+    """
+    fin, fout, st_out = fade_times(keep_dur, fade_d)
+    k1 = keyframe_index.keyframe_at_or_after(idx, start + fin)
+    k2 = keyframe_index.keyframe_at_or_before(idx, start + st_out)
+    if k1 is None or k2 is None or k2 - k1 < min_copy:
+        return None
+    return k1, k2
 
-    # Récupère les sources (locales ou URLs)
-    sources = list(safe_lines(mpath.read_text(encoding="utf-8")))
-    if not sources:
-        print("[select_and_merge] Aucune entrée valide dans le manifeste.", file=sys.stderr); sys.exit(1)
+def build_part(src: pathlib.Path, dst: pathlib.Path, start: float, dur: float, vf: str,
+               params: dict, threads: int = 0):
+    """Ré-encode [start, start+dur) d'un mezzanine avec ses propres réglages x264 (concat en copy possible)."""
+    cmd = [
+        "ffmpeg","-nostdin","-y",
+        "-ss", f"{start:.3f}",
+        "-i", str(src),
+        "-t", f"{dur:.3f}",
+        "-an",
+        "-vf", vf,
+        "-r", str(params["fps"]),
+        *mezzanine.x264_args(params),
+        *(["-threads", str(threads)] if threads > 0 else []),
+        str(dst)
+    ]
+    subprocess.run(cmd, check=True, **log_context.stdio())
 
-    # Prépare des chemins locaux pour chaque entrée
-    local_entries = []
-    for idx, src in enumerate(sources, start=1):
-        if is_url(src):
-            dst = smdir / f"src_{idx:02d}.mp4"
-            if not dst.exists() or dst.stat().st_size == 0:
-                try:
-                    download(src, dst)
-                except Exception as e:
-                    print(f"[select_and_merge] Téléchargement échoué ({src}): {e}", file=sys.stderr)
-                    continue
-            local_entries.append(dst)
-        else:
-            p = (ROOT / src).resolve() if not os.path.isabs(src) else pathlib.Path(src).resolve()
-            if p.exists() and p.stat().st_size > 0:
-                local_entries.append(p)
+def build_copy_segment(mz: pathlib.Path, smdir: pathlib.Path, i: int, start: float, keep: float, fade_d: float,
+                       threads: int = 0, params: dict = None) -> list:
+    """Segment en trois morceaux (fade in ré-encodé / milieu copié / fade out ré-encodé).
 
-    if not local_entries:
-        print("[select_and_merge] Aucun média local exploitable.", file=sys.stderr); sys.exit(1)
+    Renvoie les lignes du list.txt (directives inpoint/outpoint pour le milieu).
+    Sans GOP exploitable, tout le segment est ré-encodé (mêmes réglages que le mezzanine).
+    """
+    params = params or mezzanine.DEFAULT_PARAMS
+    fin, fout, st_out = fade_times(keep, fade_d)
+    cuts = gop_cuts(keyframe_index.load(mz, key=mz.stem), start, keep, fade_d)  # nom = clé du mezzanine
+    if cuts is None:
+        dst = (smdir / f"seg_{i:02d}_fx.mp4").resolve()
+        vf = f"fade=t=in:st=0:d={fin:.3f},fade=t=out:st={st_out:.3f}:d={fout:.3f}"
+        build_part(mz, dst, start, keep, vf, params, threads)
+        return [f"file '{dst.as_posix()}'"]
+    k1, k2 = cuts
+    end = start + keep
+    head = (smdir / f"seg_{i:02d}_in.mp4").resolve()
+    tail = (smdir / f"seg_{i:02d}_out.mp4").resolve()
+    build_part(mz, head, start, k1 - start, f"fade=t=in:st=0:d={fin:.3f}", params, threads)
+    build_part(mz, tail, k2, end - k2, f"fade=t=out:st={start + st_out - k2:.3f}:d={fout:.3f}", params, threads)
+    return [
+        f"file '{head.as_posix()}'",
+        f"file '{mz.resolve().as_posix()}'",
+        f"inpoint {k1:.6f}",
+        f"outpoint {k2:.6f}",
+        f"file '{tail.as_posix()}'",
+    ]
 
-    # Choisit et transforme les segments jusqu'à couvrir audio_dur
-    keep_paths = []
-    elapsed = 0.0
-    seg_idx = 0
+def merge_two_step(plan_fn, smdir: pathlib.Path, outp: pathlib.Path,
+                   fade_d: float, jobs: int = 0, mezz_dir: pathlib.Path = None,
+                   mezz_used: set = None, stream_copy: bool = False, profile: dict = None) -> bool:
+    """Chemin historique: un encode x264 par segment puis concat (remux) vers outp.
 
-    for p in local_entries:
-        src_d = ffprobe_duration(p)
-        if src_d < args.min_keep:
-            continue
-        remain = audio_dur - elapsed
-        if remain <= 0.05:
-            break
-        use_d = min(src_d, remain)
-        if use_d < args.min_keep:
-            # si dernier petit reste, on l’étire un chouïa plutôt que le zapper
-            if remain >= 0.5:
-                continue
-            use_d = max(0.5, remain)
-
-        seg_idx += 1
-        out_seg = smdir / f"seg_{seg_idx:02d}_fx.mp4"
-        try:
-            build_faded_clip(p, out_seg, keep_dur=use_d, fade_d=args.fade)
-        except Exception as e:
-            print(f"[select_and_merge] Échec build fade pour {p}: {e}", file=sys.stderr)
-            seg_idx -= 1
-            continue
+    Le plan complet est calculé d'abord (plan_fn, voir make_planner), puis les segments
+    sont encodés en parallèle.
+    Une source dont l'encode échoue est écartée et le plan est recalculé: les
+    segments déjà encodés à l'identique (même position, source et sous-plage) sont gardés.
+    Avec mezz_dir, chaque source passe par le cache mezzanine (normalisée une fois
+    pour toutes) et le segment n'est plus qu'une coupe + fades; les mezzanines
+    utilisés sont ajoutés à mezz_used. Avec stream_copy (mezzanine requis), seules les
+    fenêtres de fondu sont ré-encodées et le milieu de chaque clip est copié.
+    """
+    pr = profile or render_profiles.get()
+    mz_params = mezzanine.params_for(pr)
+    excluded = set()
+    built = {}    # seg_idx -> (source, début, durée) déjà encodé
+    entries = {}  # seg_idx -> lignes du list.txt
+    while True:
+        plan = plan_fn(excluded)
+        if not plan:
+            return False
+        todo = [(i, src, start, keep) for i, (src, start, keep) in enumerate(plan, start=1)
+                if built.get(i) != (src, start, round(keep, 3))]
+        workers, threads = split_cores(len(todo), jobs)
+        print(f"[select_and_merge] {len(plan)} segments ({len(todo)} à encoder) — "
+              f"{workers} workers x {threads} threads")
+        for i, *_ in todo:
+            built.pop(i, None)
 
-        keep_paths.append(out_seg.resolve())
-        elapsed += use_d
+        def _encode(task):
+            i, src, start, keep = task
+            dst = (smdir / f"seg_{i:02d}_fx.mp4").resolve()
+            if mezz_dir is None:
+                build_faded_clip(src, dst, keep_dur=keep, fade_d=fade_d, threads=threads, start=start, profile=pr)
+                return [f"file '{dst.as_posix()}'"]
+            mz = mezzanine.ensure(src, mezz_dir, mz_params, threads=threads)
+            if mezz_used is not None:
+                mezz_used.add(mz)
+            if stream_copy:
+                return build_copy_segment(mz, smdir, i, start, keep, fade_d, threads, mz_params)
+            build_faded_clip(mz, dst, keep_dur=keep, fade_d=fade_d, threads=threads, normalized=True, start=start,
+                             profile=pr)
+            return [f"file '{dst.as_posix()}'"]
 
-        if elapsed >= audio_dur - 0.05:
+        failed = False
+        for (i, src, start, keep), lines, err in run_ordered(_encode, todo, workers):
+            if err is None:
+                built[i] = (src, start, round(keep, 3))
+                entries[i] = lines
+            else:
+                print(f"[select_and_merge] Échec build fade pour {src}: {err} — replanification", file=sys.stderr)
+                excluded.add(src)
+                failed = True
+        if not failed:
             break
 
-    if not keep_paths:
-        print("[select_and_merge] Aucun segment retenu.", file=sys.stderr); sys.exit(1)
-
     # Écrit un list.txt avec chemins ABSOLUS (imparable)
     list_file = smdir / "list.txt"
     with list_file.open("w", encoding="utf-8") as f:
-        for kp in keep_paths:
-            f.write(f"file '{kp.as_posix()}'\n")
+        for i in range(1, len(plan) + 1):
+            for ln in entries[i]:
+                f.write(ln + "\n")
 
     # Concat demuxer (streams homogènes), remux direct
     cmd = [
@@ -171,23 +375,173 @@ def main():
         "-f","concat","-safe","0",
         "-i", str(list_file),
         "-c","copy",
+        *render_profiles.metadata_args(pr),
         str(outp)
     ]
     try:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, **log_context.stdio())
     except subprocess.CalledProcessError as e:
         # Si remux échoue (paramètres divergents), on réencode une dernière fois proprement
         print("[select_and_merge] Remux copy a échoué, réencodage global…", file=sys.stderr)
         cmd2 = [
             "ffmpeg","-nostdin","-y",
             "-f","concat","-safe","0","-i", str(list_file),
-            "-r","30",
-            "-c:v","libx264","-preset","medium","-crf","18","-pix_fmt","yuv420p",
+            "-r", str(pr["fps"]),
+            *render_profiles.x264_args(pr),
+            *render_profiles.metadata_args(pr),
             str(outp)
         ]
-        subprocess.run(cmd2, check=True)
+        subprocess.run(cmd2, check=True, **log_context.stdio())
+    # débuts de clips, pour que render_final --parallel coupe aux changements de plan
+    starts, t = [], 0.0
+    for _, _, keep in plan:
+        starts.append(t)
+        t += keep
+    render_final.write_segments(outp, starts)
+    return True
+
+def main(argv=None, session=None):
+    """argv: arguments (défaut sys.argv); session: session HTTP partagée par l'appelant (batch)."""
+    ap = argparse.ArgumentParser(description="Select clips to match audio length, add fade-to-black between clips, and merge.")
+    ap.add_argument("--manifest", required=True, help="Fichier manifeste (chemins locaux ou URLs, 1 par ligne)")
+    ap.add_argument("--audio",    required=True, help="Audio narratif (voice.wav)")
+    ap.add_argument("--out",      required=True, help="Vidéo fusionnée de sortie (e.g., selected_media/merged.mp4), "
+                                                     "ou vidéo finale avec --single-pass")
+    ap.add_argument("--fade",     type=float, default=0.30, help="Durée fade in/out par segment (s)")
+    ap.add_argument("--min-keep", type=float, default=1.00, help="Durée minimale utile d’un segment (s)")
+    ap.add_argument("--single-pass", action="store_true",
+                    help="Trim/fades/scale/finition/mux audio dans un seul filter_complex -> vidéo finale en un encode")
+    ap.add_argument("--compare", action="store_true",
+                    help="Avec --single-pass: exécute aussi le chemin en deux étapes et affiche les deux temps")
+    ap.add_argument("--jobs",     type=int, default=0, help="Encodes de segments en parallèle (0 = auto selon les cœurs)")
+    ap.add_argument("--cache-dir", default="cache/downloads", help="Cache des clips téléchargés (clé = hash URL+ETag+taille)")
+    ap.add_argument("--download-workers", type=int, default=4, help="Téléchargements simultanés")
+    ap.add_argument("--mezzanine-dir", default="cache/mezzanine", help="Cache des clips normalisés (taille/fps du profil)")
+    ap.add_argument("--mezzanine-budget-mb", type=float, default=4096, help="Budget disque du cache mezzanine (Mo, LRU)")
+    ap.add_argument("--no-mezzanine", action="store_true", help="Normalise depuis l'original à chaque run (ancien comportement)")
+    ap.add_argument("--no-stream-copy", action="store_true",
+                    help="Ré-encode chaque segment en entier au lieu de copier le milieu du mezzanine (GOP)")
+    ap.add_argument("--history", default="cache/clip_usage.json", help="Historique d'usage des clips (anti-répétition)")
+    ap.add_argument("--max-use", type=float, default=0.0, help="Durée max utilisée par clip (s, 0 = illimitée)")
+    ap.add_argument("--profile", default=None, choices=sorted(render_profiles.PROFILES),
+                    help="Profil de rendu (défaut: $RENDER_PROFILE ou final)")
+    ap.add_argument("--remote-partial", action="store_true",
+                    help="Ne lit que les sous-plages utiles des URLs (HTTP Range, moov) au lieu de les télécharger")
+    ap.add_argument("--partial-dir", default="cache/partial", help="Fichiers creux de --remote-partial")
+    ap.add_argument("--partial-budget-mb", type=float, default=2048,
+                    help="Budget disque des fichiers creux (Mo réellement alloués, LRU)")
+    ap.add_argument("--work-dir", default="selected_media", help="Segments intermédiaires et list.txt (un par vidéo en batch)")
+    ap.add_argument("--prefetch", type=float, default=0.0, metavar="SECONDES",
+                    help="Sans attendre la voix: télécharge et normalise les clips probables pour une voix "
+                         "d'environ SECONDES, puis s'arrête (--audio/--out ignorés)")
+    args = ap.parse_args(argv)
+    profile = render_profiles.get(args.profile)
+
+    mpath = (ROOT / args.manifest).resolve() if not os.path.isabs(args.manifest) else pathlib.Path(args.manifest).resolve()
+    apath = (ROOT / args.audio).resolve()    if not os.path.isabs(args.audio)    else pathlib.Path(args.audio).resolve()
+    outp  = (ROOT / args.out).resolve()      if not os.path.isabs(args.out)      else pathlib.Path(args.out).resolve()
+
+    smdir = (ROOT / args.work_dir).resolve() if not os.path.isabs(args.work_dir) else pathlib.Path(args.work_dir)
+    smdir.mkdir(parents=True, exist_ok=True)
+    outp.parent.mkdir(parents=True, exist_ok=True)
+
+    if not mpath.exists() or mpath.stat().st_size == 0:
+        print(f"[select_and_merge] Manifeste introuvable/vide: {mpath}", file=sys.stderr); sys.exit(1)
+    if args.prefetch <= 0 and (not apath.exists() or apath.stat().st_size == 0):
+        print(f"[select_and_merge] Audio introuvable/vide: {apath}", file=sys.stderr); sys.exit(1)
+
+    # Récupère les sources (locales ou URLs)
+    sources = list(safe_lines(mpath.read_text(encoding="utf-8")))
+    if not sources:
+        print("[select_and_merge] Aucune entrée valide dans le manifeste.", file=sys.stderr); sys.exit(1)
+
+    # Durées connues d'avance (index media_probe; les URLs sont sondées à distance)
+    cache_dir = (ROOT / args.cache_dir).resolve() if not os.path.isabs(args.cache_dir) else pathlib.Path(args.cache_dir)
+    clips = load_clips(sources, cache_dir, args.download_workers, session)
+    if not clips:
+        print("[select_and_merge] Aucun média exploitable.", file=sys.stderr); sys.exit(1)
+
+    hist_path = (ROOT / args.history).resolve() if not os.path.isabs(args.history) else pathlib.Path(args.history)
+    history = clip_planner.load_history(hist_path)
+    partial_dir = None
+    if args.remote_partial:
+        partial_dir = (ROOT / args.partial_dir).resolve() if not os.path.isabs(args.partial_dir) else pathlib.Path(args.partial_dir)
+
+    mezz_dir = None
+    # un fichier creux ne peut pas être normalisé en entier: pas de mezzanine en lecture partielle
+    if not args.no_mezzanine and not args.remote_partial:
+        mezz_dir = (ROOT / args.mezzanine_dir).resolve() if not os.path.isabs(args.mezzanine_dir) else pathlib.Path(args.mezzanine_dir)
+    mezz_used = set()
+
+    def evict_mezzanine():
+        """Budget disque du cache mezzanine, à chaque sortie qui l'a rempli (mezzanines du run conservés)."""
+        if mezz_dir is not None:
+            mezzanine.evict(mezz_dir, args.mezzanine_budget_mb, keep=mezz_used)
+
+    def evict_partial(keys):
+        """Budget disque des fichiers creux (--remote-partial), ceux des URLs du plan conservés."""
+        if partial_dir is not None:
+            keep = [mp4_remote.sparse_path(k, partial_dir) for k in keys if is_url(k)]
+            mp4_remote.evict(partial_dir, args.partial_budget_mb, keep=keep)
+
+    if args.prefetch > 0:
+        t0 = time.perf_counter()
+        if args.remote_partial:
+            # les sous-plages dépendent de la durée exacte: seule la sonde est faite d'avance
+            print(f"[select_and_merge] prefetch: {len(clips)} clips sondés (lecture partielle: rien d'autre à préparer)")
+            return
+        n = prefetch_clips(clips, args.prefetch, args.min_keep, history, args.max_use, cache_dir,
+                           args.download_workers, mezz_dir, profile, args.jobs, session, mezz_used)
+        evict_mezzanine()
+        print(f"[select_and_merge] prefetch: {n} clips prêts pour ~{args.prefetch:.0f}s de voix "
+              f"(wall {time.perf_counter() - t0:.2f}s)")
+        return
+
+    # Durée cible = durée audio
+    audio_dur = media_probe.duration(apath)
+    if audio_dur <= 0.1:
+        print("[select_and_merge] Durée audio invalide.", file=sys.stderr); sys.exit(1)
+    plan_fn = make_planner(clips, audio_dur, args.min_keep, history, args.max_use, cache_dir, args.download_workers,
+                           partial_dir, session)
+
+    if args.single_pass:
+        plan = plan_fn()
+        if not plan:
+            print("[select_and_merge] Aucun segment retenu.", file=sys.stderr); sys.exit(1)
+        t0 = time.perf_counter()
+        cmd = single_pass_cmd(plan, apath, outp, args.fade, profile)
+        subprocess.run(cmd, check=True, **log_context.stdio())
+        wall_single = time.perf_counter() - t0
+        print(f"[select_and_merge] single-pass OK -> {outp} [{profile['name']}] ({len(plan)} clips, wall {wall_single:.2f}s)")
+        if args.compare:
+            merged = smdir / "merged_compare.mp4"
+            final2 = outp.with_name(outp.stem + "_twostep" + outp.suffix)
+            t0 = time.perf_counter()
+            # même plan que le single-pass (pas de replanification: comparaison à l'identique)
+            if not merge_two_step(lambda excluded=(): [] if excluded else plan, smdir, merged, args.fade, args.jobs,
+                                  mezz_dir, mezz_used, not args.no_stream_copy, profile):
+                evict_mezzanine()
+            print("[select_and_merge] Aucun segment retenu (deux étapes).", file=sys.stderr); sys.exit(1)
+            t1 = time.perf_counter()
+            subprocess.run(render_final.build_cmd(merged, apath, final2, profile), check=True, **log_context.stdio())
+            t2 = time.perf_counter()
+            print(f"[select_and_merge] deux étapes: merge {t1 - t0:.2f}s + render {t2 - t1:.2f}s = {t2 - t0:.2f}s -> {final2}")
+            print(f"[select_and_merge] single-pass: {wall_single:.2f}s (gain x{(t2 - t0) / max(wall_single, 1e-6):.2f})")
+        clip_planner.record_usage(hist_path, history, plan_fn.keys)
+        evict_mezzanine()
+        evict_partial(plan_fn.keys)
+        return
+
+    t0 = time.perf_counter()
+    if not merge_two_step(plan_fn, smdir, outp, args.fade, args.jobs,
+                          mezz_dir, mezz_used, not args.no_stream_copy, profile):
+        evict_mezzanine()
+        print("[select_and_merge] Aucun segment retenu.", file=sys.stderr); sys.exit(1)
+    clip_planner.record_usage(hist_path, history, plan_fn.keys)
+    evict_mezzanine()
+    evict_partial(plan_fn.keys)
 
-    print(f"[select_and_merge] OK -> {outp}")
+    print(f"[select_and_merge] OK -> {outp} [{profile['name']}] (wall {time.perf_counter() - t0:.2f}s)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Banque locale d'histoires validées (SQLite), remplie par `generate_story.py --batch`.
+
+- une ligne par histoire: titre, texte, CTA, date d'ajout, date d'utilisation (NULL = disponible);
+- dédoublonnage à l'ajout: titre normalisé identique, ou histoire trop proche d'une
+  histoire existante (Jaccard sur les triplets de mots);
+- take() sert la plus ancienne histoire disponible et la marque utilisée (transaction).
+"""
+import os, pathlib, re, sqlite3, time, unicodedata
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+BANK_PATH = pathlib.Path(os.environ.get("STORY_BANK", ROOT / "cache" / "story_bank.sqlite"))
+DUP_SIMILARITY = 0.6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    title     TEXT NOT NULL,
+    story     TEXT NOT NULL,
+    cta       TEXT NOT NULL DEFAULT '',
+    title_key TEXT NOT NULL UNIQUE,
+    words     INTEGER NOT NULL,
+    added_at  REAL NOT NULL,
+    used_at   REAL
+);
+CREATE INDEX IF NOT EXISTS stories_unused ON stories(used_at, id);
+"""
+
+def connect(path: pathlib.Path = None) -> sqlite3.Connection:
+    path = pathlib.Path(path or BANK_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path), timeout=30)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+def _words(text: str):
+    t = unicodedata.normalize("NFKD", text.lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", t)
+
+def title_key(title: str) -> str:
+    return " ".join(_words(title))
+
+def shingles(text: str, n: int = 3) -> set:
+    w = _words(text)
+    return {" ".join(w[i:i + n]) for i in range(max(1, len(w) - n + 1))}
+
+def similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def find_duplicate(db: sqlite3.Connection, title: str, story: str, threshold: float = DUP_SIMILARITY):
+    """Id d'une histoire existante trop proche, ou None."""
+    row = db.execute("SELECT id FROM stories WHERE title_key = ?", (title_key(title),)).fetchone()
+    if row:
+        return row["id"]
+    sh = shingles(story)
+    for row in db.execute("SELECT id, story FROM stories"):
+        if similarity(sh, shingles(row["story"])) >= threshold:
+            return row["id"]
+    return None
+
+def add(db: sqlite3.Connection, title: str, story: str, cta: str = "") -> tuple:
+    """Ajoute une histoire. Renvoie (id, None) ou (None, raison du refus)."""
+    db.execute("BEGIN IMMEDIATE")  # contrôle des doublons et insertion atomiques entre générateurs
+    try:
+        dup = find_duplicate(db, title, story)
+        if dup is not None:
+            db.rollback()
+            return None, f"doublon de #{dup}"
+        cur = db.execute(
+            "INSERT INTO stories(title, story, cta, title_key, words, added_at) VALUES (?,?,?,?,?,?)",
+            (title, story, cta, title_key(title), len(story.split()), time.time()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return cur.lastrowid, None
+
+def take(db: sqlite3.Connection):
+    """Plus ancienne histoire disponible (dict), marquée utilisée; None si la banque est vide."""
+    db.execute("BEGIN IMMEDIATE")  # verrou d'écriture: deux runs ne prennent pas la même histoire
+    try:
+        row = db.execute("SELECT * FROM stories WHERE used_at IS NULL ORDER BY id LIMIT 1").fetchone()
+        if row is not None:
+            db.execute("UPDATE stories SET used_at = ? WHERE id = ?", (time.time(), row["id"]))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return dict(row) if row is not None else None
+
+def counts(db: sqlite3.Connection) -> dict:
+    row = db.execute("SELECT COUNT(*) AS total, SUM(used_at IS NULL) AS unused FROM stories").fetchone()
+    return {"total": row["total"] or 0, "unused": row["unused"] or 0}
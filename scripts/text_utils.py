@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Nettoyage et découpage du texte narratif, partagés par build_ass et voice_elevenlabs."""
+import re
+
+def clean_text(t: str) -> str:
+    t = re.sub(r"\[[^\]]+\]", " ", t)
+    t = re.sub(r"\([^)]+\)", " ", t)
+    t = re.sub(r"(?i)\b(voix\s*\d+|narrateur|narratrice)\s*:\s*", " ", t)
+    t = t.replace("{","(").replace("}",")")
+    t = re.sub(r"\s+"," ", t).strip()
+    return t
+
+def split_sentences(text: str):
+    txt = clean_text(text)
+    parts = re.split(r'(?<=[\.\!\?…])\s+', txt)
+    return [p.strip() for p in parts if p.strip()]
+
+def chunk_sentences(sentences, max_chars: int = 1500):
+    """Regroupe des phrases consécutives en morceaux de moins de max_chars caractères.
+
+    Renvoie [[phrase, ...], ...]; une phrase plus longue que la limite forme seule
+    un morceau (coupée aux espaces si besoin). max_chars <= 0: un seul morceau.
+    """
+    if max_chars <= 0:
+        return [list(sentences)] if sentences else []
+    chunks, cur, size = [], [], 0
+    for s in sentences:
+        pieces = [s]
+        if len(s) > max_chars:
+            pieces, buf = [], ""
+            for w in s.split():
+                if buf and len(buf) + 1 + len(w) > max_chars:
+                    pieces.append(buf); buf = w
+                else:
+                    buf = f"{buf} {w}".strip()
+            if buf:
+                pieces.append(buf)
+        for p in pieces:
+            if cur and size + 1 + len(p) > max_chars:
+                chunks.append(cur); cur, size = [], 0
+            cur.append(p)
+            size += len(p) + (1 if size else 0)
+    if cur:
+        chunks.append(cur)
+    return chunks
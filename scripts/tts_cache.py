@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Cache disque des synthèses vocales, adressé par contenu.
+
+Clé = sha256(texte normalisé + voice_id + model_id + voice_settings + format de sortie):
+relancer la pipeline sur les mêmes textes (ou le CTA par défaut) ne rappelle pas l'API.
+Écritures atomiques (.part + os.replace), éviction LRU (mtime) au-delà du budget.
+"""
+import hashlib, json, os, pathlib, re, shutil, threading, unicodedata
+
+import disk_cache
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+CACHE_DIR = pathlib.Path(os.environ.get("TTS_CACHE_DIR", ROOT / "cache" / "tts"))
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+def cache_key(text: str, voice_id: str, model_id: str, voice_settings: dict, output_format: str) -> str:
+    blob = json.dumps({
+        "text": normalize_text(text), "voice_id": voice_id, "model_id": model_id,
+        "voice_settings": voice_settings, "output_format": output_format,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def entry_path(cache_dir: pathlib.Path, key: str, suffix: str = ".mp3") -> pathlib.Path:
+    return cache_dir / f"{key[:32]}{suffix}"
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, **kw):
+        with self.lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def summary(self) -> str:
+        return f"cache TTS: {self.hits} hits, {self.misses} miss"
+
+def lookup(cache_dir: pathlib.Path, key: str, dst: pathlib.Path, stats: Stats = None, suffix: str = ".mp3") -> bool:
+    """Copie l'entrée en cache vers dst si elle existe (et la marque récemment utilisée)."""
+    src = entry_path(cache_dir, key, suffix)
+    if not src.exists() or src.stat().st_size == 0:
+        if stats:
+            stats.add(misses=1)
+        return False
+    disk_cache.touch(src)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".part")
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    if stats:
+        stats.add(hits=1)
+    return True
+
+def store(cache_dir: pathlib.Path, key: str, src: pathlib.Path, suffix: str = ".mp3") -> pathlib.Path:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    dst = entry_path(cache_dir, key, suffix)
+    tmp = disk_cache.part_path(dst)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+def evict(cache_dir: pathlib.Path, budget_mb: float, keep=()) -> int:
+    return disk_cache.evict(cache_dir, int(budget_mb * 1024 * 1024), "*", keep)
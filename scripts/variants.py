@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Un même fond vidéo, plusieurs narrations (voix, langues, CTA en test A/B).
+
+1) le fond est planifié (select_and_merge) et rendu une seule fois, vidéo seule, à la
+   durée de la plus longue variante: même chaîne de filtres que render_final, GOP
+   fermés d'une seconde. Il est réutilisé tant qu'il couvre la variante la plus longue
+   avec le même profil, le même manifeste et le même merged.mp4 (background.json);
+2) pour chaque variante de durée d: copie du fond jusqu'à la dernière image clé <= d
+   (concat -c copy), et ré-encodage de la seule fin [clé, d) — moins d'une seconde;
+3) seul l'audio de la variante (AAC) est encodé.
+
+Ajouter une variante coûte donc quelques secondes au lieu d'un rendu complet.
+
+Sous-titres: les plateformes visées (TikTok, Shorts, Reels) n'affichent pas de piste
+mov_text. Si tous les événements ASS tombent dans la fin ré-encodée (CTA seul...), ils y
+sont incrustés sans surcoût. Sinon la sortie par défaut n'a qu'une piste mov_text, sans
+sous-titres visibles (avertissement affiché). --burn-subs ré-encode depuis la dernière
+image clé précédant le premier événement, avec la chaîne de render_final (subtitles avant
+fps, comme le rendu final): le coût dépend de ce point, un rendu complet s'il est à 0.
+"""
+import argparse, json, os, pathlib, re, subprocess, sys, time
+
+import disk_cache
+import keyframe_index
+import media_probe
+import render_final
+import render_profiles
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+
+def resolve(p) -> pathlib.Path:
+    p = pathlib.Path(p)
+    return p if p.is_absolute() else (ROOT / p).resolve()
+
+def first_event(ass: pathlib.Path):
+    """Début (s) du premier événement Dialogue d'un fichier ASS, None s'il n'y en a pas."""
+    starts = [int(h) * 3600 + int(m) * 60 + float(sec)
+              for h, m, sec in re.findall(r"^Dialogue:\s*[^,]*,(\d+):(\d+):(\d+(?:\.\d+)?),",
+                                          ass.read_text(encoding="utf-8-sig", errors="replace"), re.M)]
+    return min(starts) if starts else None
+
+def ensure_background(work: pathlib.Path, manifest: pathlib.Path, voice: pathlib.Path, dur: float,
+                      profile: dict, force: bool = False) -> pathlib.Path:
+    """Fond rendu (vidéo seule) couvrant au moins dur secondes; reconstruit si besoin.
+
+    background.json garde le profil, la durée et les sha256 du manifeste et de merged.mp4:
+    un manifeste modifié ou un merged.mp4 refait reconstruit le fond.
+    """
+    bg, side, merged = work / "background.mp4", work / "background.json", work / "merged.mp4"
+    memo = work / "hashes.json"
+    try:
+        meta = json.loads(side.read_text(encoding="utf-8"))
+    except Exception:
+        meta = {}
+    manifest_sha = disk_cache.file_sha256(manifest, memo)
+    fresh = (not force and merged.exists() and meta.get("profile") == profile["name"]
+             and meta.get("duration", 0) >= dur - 1e-3 and meta.get("manifest") == manifest_sha
+             and meta.get("merged") == disk_cache.file_sha256(merged, memo))
+    if fresh and bg.exists():
+        print(f"[variants] fond réutilisé: {bg} ({meta['duration']:.2f}s)")
+        return bg
+    t0 = time.perf_counter()
+    if not fresh:
+        bg.unlink(missing_ok=True)  # rendu depuis l'ancien merged.mp4
+        subprocess.run([sys.executable, str(SCRIPTS / "select_and_merge.py"),
+                        "--manifest", str(manifest), "--audio", str(voice), "--out", str(merged),
+                        "--work-dir", str(work / "segments"), "--profile", profile["name"]], cwd=ROOT, check=True)
+        side.write_text(json.dumps({"profile": profile["name"], "duration": round(dur, 3), "manifest": manifest_sha,
+                                    "merged": disk_cache.file_sha256(merged, memo)}), encoding="utf-8")
+    t1 = time.perf_counter()
+    part = bg.with_name("background.part.mp4")
+    subprocess.run(render_final.chunk_cmd(merged, part, 0.0, meta["duration"] if fresh else dur, profile), check=True)
+    os.replace(part, bg)
+    print(f"[variants] fond {dur:.2f}s: merge {t1 - t0:.2f}s + rendu {time.perf_counter() - t1:.2f}s -> {bg}")
+    return bg
+
+def render_variant(work: pathlib.Path, bg: pathlib.Path, voice: pathlib.Path, subs: pathlib.Path,
+                   out: pathlib.Path, profile: dict, burn_subs: bool = False) -> float:
+    """Vidéo d'une variante + voix (+ sous-titres). Renvoie le wall (s).
+
+    Fond copié jusqu'à une image clé, fin ré-encodée depuis merged.mp4 (chunk_cmd). Les
+    sous-titres sont incrustés dans cette fin s'ils y tiennent tous; burn_subs avance la
+    coupe à l'image clé précédant le premier événement. Sinon: piste mov_text et avertissement.
+    """
+    t0 = time.perf_counter()
+    fps = profile["fps"]
+    dur = round(media_probe.duration(voice) * fps) / fps
+    first = first_event(subs) if subs is not None and subs.exists() and subs.stat().st_size > 0 else None
+    keys = keyframe_index.load(bg)
+    key = keyframe_index.keyframe_at_or_before(keys, dur) or 0.0
+    burn = first is not None and (burn_subs or first >= key)
+    if burn and first < key:
+        key = keyframe_index.keyframe_at_or_before(keys, first) or 0.0
+    elif first is not None and not burn:
+        print(f"[variants] {out.name}: sous-titres en piste mov_text seulement, invisibles sur TikTok/Shorts/Reels "
+              "(--burn-subs pour les incruster)", file=sys.stderr)
+    vf, env = "", None
+    if burn:
+        import font_cache
+        fonts = font_cache.fontsdir(subs)
+        vf = render_final.subtitles_vf(subs, fonts)
+        env = font_cache.env(fonts) if fonts else None
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = work / f"tail_{out.stem}"
+    tmp.mkdir(parents=True, exist_ok=True)
+    lines = []
+    if key > 0:
+        lines += [f"file '{bg.resolve().as_posix()}'", f"outpoint {key:.6f}"]
+    if dur - key >= 0.5 / fps:
+        tail = tmp / "tail.mp4"
+        subprocess.run(render_final.chunk_cmd(work / "merged.mp4", tail, key, dur - key, profile, subs=vf),
+                       check=True, env=env)
+        lines.append(f"file '{tail.resolve().as_posix()}'")
+    lst = tmp / "list.txt"
+    lst.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    subprocess.run([
+        "ffmpeg","-nostdin","-y","-v","error",
+        "-f","concat","-safe","0","-i", str(lst),
+        "-i", str(voice),
+        *(["-i", str(subs)] if first is not None and not burn else []),
+        "-map","0:v","-map","1:a",
+        *(["-map","2:s","-c:s","mov_text"] if first is not None and not burn else []),
+        "-c:v","copy",
+        *render_profiles.audio_args(profile),
+        *render_profiles.metadata_args(profile),
+        "-movflags","+faststart",
+        "-t", f"{dur:.6f}",
+        str(out)
+    ], check=True)
+    for f in tmp.iterdir():
+        f.unlink()
+    tmp.rmdir()
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="Rend le fond une fois puis une vidéo par narration (variante).")
+    ap.add_argument("--variants", nargs="+", required=True,
+                    help="Répertoires de variantes: audio/voice.wav (+ subs/captions.ass facultatif)")
+    ap.add_argument("--manifest", default="manifests/horreur.txt")
+    ap.add_argument("--work-dir", default="selected_media/variants", help="Fond partagé (merged.mp4, background.mp4)")
+    ap.add_argument("--name", default=None, help="Nom du fichier produit dans <variante>/final/ (défaut: $OUT_NAME)")
+    ap.add_argument("--profile", default=None, choices=sorted(render_profiles.PROFILES),
+                    help="Profil de rendu (défaut: $RENDER_PROFILE ou final)")
+    ap.add_argument("--rebuild", action="store_true", help="Refait le fond même s'il couvre toutes les variantes")
+    ap.add_argument("--burn-subs", action="store_true",
+                    help="Incruste les sous-titres (style ASS) au lieu d'une piste mov_text invisible sur les plateformes: "
+                         "ré-encode depuis l'image clé précédant le premier sous-titre")
+    args = ap.parse_args()
+    profile = render_profiles.get(args.profile)
+    name = args.name or os.environ.get("OUT_NAME", "final_horror.mp4")
+
+    variants = []
+    for d in map(resolve, args.variants):
+        voice = d / "audio" / "voice.wav"
+        if not voice.exists() or voice.stat().st_size == 0:
+            print(f"[variants] voix manquante, variante ignorée: {voice}", file=sys.stderr)
+            continue
+        variants.append((d, voice, d / "subs" / "captions.ass", media_probe.duration(voice)))
+    if not variants:
+        print("[variants] Aucune variante exploitable.", file=sys.stderr); sys.exit(1)
+
+    work = resolve(args.work_dir)
+    work.mkdir(parents=True, exist_ok=True)
+    longest = max(variants, key=lambda v: v[3])
+    t0 = time.perf_counter()
+    try:
+        bg = ensure_background(work, resolve(args.manifest), longest[1], longest[3], profile, args.rebuild)
+    except subprocess.CalledProcessError as e:
+        print(f"[variants] ERREUR fond: {e}", file=sys.stderr); sys.exit(1)
+
+    failed = 0
+    for d, voice, subs, dur in variants:
+        out = d / "final" / name
+        try:
+            wall = render_variant(work, bg, voice, subs, out, profile, args.burn_subs)
+        except subprocess.CalledProcessError as e:
+            print(f"[variants] ERREUR {d.name}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"[variants] {d.name}: {dur:.2f}s en {wall:.2f}s -> {out}")
+    print(f"[variants] {len(variants) - failed}/{len(variants)} variantes [{profile['name']}] "
+          f"en {time.perf_counter() - t0:.2f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
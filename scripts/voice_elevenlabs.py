@@ -1,6 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import os, sys, json, pathlib, subprocess, requests, shlex
+import os, sys, json, pathlib, subprocess, requests, shlex, random, time, wave, tempfile, shutil
+
+import numpy as np
+
+import downloader
+import log_context
+import media_probe
+import tts_cache
+from text_utils import split_sentences, chunk_sentences
+
+API_BASE = os.environ.get("ELEVENLABS_API_BASE", "https://api.elevenlabs.io").rstrip("/")
+RETRY_STATUS = {429, 500, 502, 503, 504}
+VOICE_SETTINGS = {"stability": 0.3, "similarity_boost": 0.7}
+OUTPUT_FORMAT = "mp3_44100_128"
+# pcm_44100 est réservé aux abonnements supérieurs; 16000/22050/24000 sont ouverts à tous
+SAMPLE_RATE = int(os.environ.get("ELEVENLABS_PCM_RATE", "24000"))
+PCM_FORMAT = f"pcm_{SAMPLE_RATE}"  # s16le mono brut, assemblé sans ffmpeg
 
 # -----------------------
 # Helpers
@@ -11,22 +27,20 @@ def ensure_dir(p: pathlib.Path):
     else:
         p.mkdir(parents=True, exist_ok=True)
 
-def ffprobe_duration(path: pathlib.Path) -> float:
-    try:
-        out = subprocess.check_output(
-            ["ffprobe","-v","error","-show_entries","format=duration","-of","default=nk=1:nw=1", str(path)],
-            stderr=subprocess.DEVNULL
-        ).decode("utf-8","ignore").strip()
-        return max(0.0, float(out))
-    except Exception:
-        return 0.0
-
 def to_wav(src_path: pathlib.Path, dst_path: pathlib.Path):
     ensure_dir(dst_path)
     subprocess.run([
         "ffmpeg","-nostdin","-y","-i",str(src_path),
         "-ar","44100","-ac","1","-c:a","pcm_s16le", str(dst_path)
-    ], check=True)
+    ], check=True, **log_context.stdio())
+
+def decode_pcm(src_path: pathlib.Path, dst_path: pathlib.Path, rate: int = SAMPLE_RATE):
+    """MP3 -> PCM s16le mono à rate, brut (.pcm) ou WAV selon dst_path: entrée de assemble_pcm."""
+    fmt = ["-f", "s16le"] if dst_path.suffix == ".pcm" else []
+    subprocess.run([
+        "ffmpeg","-nostdin","-y","-i",str(src_path),
+        "-ar",str(rate),"-ac","1","-c:a","pcm_s16le", *fmt, str(dst_path)
+    ], check=True, **log_context.stdio())
 
 def make_silence_wav(out_path: pathlib.Path, duration: float):
     if duration <= 0:
@@ -37,32 +51,294 @@ def make_silence_wav(out_path: pathlib.Path, duration: float):
         "-f","lavfi","-i","anullsrc=r=44100:cl=mono",
         "-t",str(duration),
         "-ar","44100","-ac","1","-c:a","pcm_s16le", str(out_path)
-    ], check=True)
+    ], check=True, **log_context.stdio())
+
+def format_refused(status: int, body: str, output_format: str) -> bool:
+    """Vrai si la réponse refuse le format de sortie demandé (pcm_* hors abonnement…),
+    et pas le texte, la clé ou la voix."""
+    body = body.lower()
+    return status in (400, 401, 403, 422) and ("output_format" in body or output_format.lower() in body)
 
-def eleven_tts(text: str, mp3_out: pathlib.Path, api_key: str, voice_id: str, model_id: str):
+def retry_delay(r, attempt: int) -> float:
+    """Retry-After du serveur s'il est donné, sinon backoff exponentiel avec gigue."""
+    ra = r.headers.get("Retry-After", "") if r is not None else ""
+    try:
+        return min(60.0, max(0.0, float(ra)))
+    except ValueError:
+        return min(30.0, 2.0 ** attempt) * (0.5 + random.random() / 2)
+
+class StreamWavWriter:
+    """Ajoute des morceaux PCM s16le mono à un WAV au fil de l'eau.
+
+    wave réécrit l'en-tête à chaque writeframes: le fichier est lisible à tout moment
+    (préfixe de durée connue). Un octet impair en fin de morceau est gardé pour le suivant.
+    """
+    def __init__(self, path: pathlib.Path, rate: int = SAMPLE_RATE):
+        self.f = open(path, "wb")
+        self.w = wave.open(self.f, "wb")
+        self.w.setnchannels(1)
+        self.w.setsampwidth(2)
+        self.w.setframerate(rate)
+        self.carry = b""
+        self.frames = 0
+
+    def write(self, chunk: bytes):
+        data = self.carry + chunk
+        cut = len(data) & ~1
+        self.carry = data[cut:]
+        if cut:
+            self.w.writeframes(data[:cut])
+            self.f.flush()  # en-tête et données visibles des lecteurs, pas seulement dans le tampon
+            self.frames += cut // 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.w.close()
+        self.f.close()
+
+def eleven_tts(text: str, mp3_out: pathlib.Path, api_key: str, voice_id: str, model_id: str,
+               session: requests.Session = None, retries: int = 4, label: str = "",
+               cache_dir: pathlib.Path = None, cache_stats: tts_cache.Stats = None,
+               output_format: str = OUTPUT_FORMAT, stream: bool = False, timings: dict = None,
+               rejected: dict = None):
+    """Synthèse vers mp3_out (MP3, ou PCM brut si output_format = pcm_*).
+
+    stream: endpoint /stream en PCM, écrit directement dans le WAV mp3_out au fil des morceaux
+    (mémoire bornée); timings[label] reçoit (premier audio, total) en secondes.
+    rejected[label] reçoit le code HTTP si l'API refuse output_format (cf. format_refused).
+    """
     if not text.strip():
         return False
     ensure_dir(mp3_out)
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    label = label or mp3_out.stem
+    if stream and not output_format.startswith("pcm_"):
+        raise ValueError("le mode stream attend un format pcm_*")
+    suffix = ".wav" if stream else ".pcm" if output_format.startswith("pcm_") else ".mp3"
+    key = tts_cache.cache_key(text, voice_id, model_id, VOICE_SETTINGS, output_format)
+    if cache_dir is not None and tts_cache.lookup(cache_dir, key, mp3_out, cache_stats, suffix):
+        print(f"[voice] {label}: cache hit ({key[:12]})")
+        return True
+    session = session or downloader.make_session(1)
+    url = f"{API_BASE}/v1/text-to-speech/{voice_id}{'/stream' if stream else ''}?output_format={output_format}"
     headers = {
         "xi-api-key": api_key,
-        "accept": "audio/mpeg",
+        "accept": "audio/mpeg" if suffix == ".mp3" else "*/*",
         "content-type": "application/json",
     }
     payload = {
         "text": text,
         "model_id": model_id,
-        "voice_settings": {
-            "stability": 0.3,
-            "similarity_boost": 0.7
-        }
+        "voice_settings": VOICE_SETTINGS
     }
-    r = requests.post(url, headers=headers, json=payload, timeout=120)
-    if r.status_code != 200:
-        print(f"[voice] ElevenLabs HTTP {r.status_code}: {r.text[:300]}", file=sys.stderr)
-        return False
-    mp3_out.write_bytes(r.content)
-    return True
+    for attempt in range(retries + 1):
+        t0 = time.perf_counter()
+        r = None
+        try:
+            r = session.post(url, headers=headers, json=payload, timeout=120, stream=True)
+            if r.status_code == 200:
+                ttfb, size = None, 0
+                # en stream, écriture en place: le WAV partiel est lisible pendant la synthèse
+                tmp = mp3_out if stream else mp3_out.with_name(mp3_out.name + ".part")
+                with (StreamWavWriter(tmp) if stream else open(tmp, "wb")) as f:
+                    for chunk in r.iter_content(chunk_size=4096 if stream else 16384):
+                        if chunk:
+                            if ttfb is None:
+                                ttfb = time.perf_counter() - t0
+                            f.write(chunk)
+                            size += len(chunk)
+                if not stream:
+                    os.replace(tmp, mp3_out)
+                if cache_dir is not None:
+                    tts_cache.store(cache_dir, key, mp3_out, suffix)
+                total = time.perf_counter() - t0
+                if timings is not None:
+                    timings[label] = (ttfb or total, total)
+                print(f"[voice] {label}: {'premier audio' if stream else 'TTFB'} {1000 * (ttfb or total):.0f} ms, "
+                      f"total {1000 * total:.0f} ms, {size / 1024:.0f} Ko"
+                      + (f" (tentative {attempt + 1})" if attempt else ""))
+                return True
+            body = r.text[:300]
+            if r.status_code not in RETRY_STATUS:
+                print(f"[voice] ElevenLabs HTTP {r.status_code}: {body}", file=sys.stderr)
+                if rejected is not None and format_refused(r.status_code, body, output_format):
+                    rejected[label] = r.status_code
+                return False
+            err = f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            err = str(e)
+            if stream:
+                mp3_out.unlink(missing_ok=True)
+        if attempt == retries:
+            print(f"[voice] {label}: abandon après {retries + 1} tentatives ({err})", file=sys.stderr)
+            return False
+        delay = retry_delay(r, attempt)
+        print(f"[voice] {label}: {err}, nouvel essai dans {delay:.1f}s", file=sys.stderr)
+        time.sleep(delay)
+    return False
+
+def synthesize_all(jobs, api_key: str, voice_id: str, model_id: str, concurrency: int = 3, retries: int = 4,
+                   cache_dir: pathlib.Path = None, cache_mb: float = 0.0, output_format: str = OUTPUT_FORMAT,
+                   stream: bool = False, rejected: dict = None, session: requests.Session = None) -> dict:
+    """jobs: [(nom, texte, mp3, wav)]. TTS + conversion WAV en parallèle (au plus `concurrency`
+    requêtes simultanées) sur une même session keep-alive. Renvoie {nom: ok}.
+    En PCM (output_format pcm_*), pas de conversion: le fichier brut est assemblé par assemble_pcm.
+    stream: chaque segment est écrit en WAV au fil de l'eau (voir eleven_tts).
+    rejected: reçoit {nom: code HTTP} des segments dont le format de sortie est refusé.
+
+    cache_dir: cache tts_cache consulté avant chaque appel (None = désactivé), borné à cache_mb.
+    session: session keep-alive partagée par l'appelant (batch), sinon une dédiée.
+    """
+    concurrency = max(1, concurrency)
+    session = session or downloader.make_session(concurrency)
+    stats = tts_cache.Stats()
+    timings = {}
+
+    def _one(job):
+        name, text, mp3, wav = job
+        if not text.strip():
+            return False
+        if not eleven_tts(text, mp3, api_key, voice_id, model_id, session, retries, name, cache_dir, stats,
+                          output_format, stream, timings, rejected):
+            return False
+        if wav is not None and not output_format.startswith("pcm_"):
+            to_wav(mp3, wav)
+        return True
+
+    t0 = time.perf_counter()
+    with log_context.Pool(max_workers=concurrency) as ex:
+        res = dict(zip([j[0] for j in jobs], ex.map(_one, jobs)))
+    print(f"[voice] TTS: {sum(res.values())}/{len(jobs)} segments en {time.perf_counter() - t0:.2f}s "
+          f"(concurrence {concurrency})")
+    if stream and timings:
+        first = jobs[0][0] if jobs[0][0] in timings else min(timings, key=lambda k: timings[k][0])
+        print(f"[voice] stream: premier audio ({first}) {1000 * timings[first][0]:.0f} ms, "
+              f"bout en bout {1000 * max(t for _, t in timings.values()):.0f} ms")
+    if cache_dir is not None:
+        suffix = ".wav" if stream else ".pcm" if output_format.startswith("pcm_") else ".mp3"
+        used = [tts_cache.entry_path(cache_dir, tts_cache.cache_key(j[1], voice_id, model_id, VOICE_SETTINGS, output_format),
+                                     suffix)
+                for j in jobs if j[1].strip()]
+        removed = tts_cache.evict(cache_dir, cache_mb, keep=used)
+        print(f"[voice] {stats.summary()}" + (f", {removed} entrées évincées" if removed else ""))
+    return res
+
+def chunks_hint_path(story_file: pathlib.Path) -> pathlib.Path:
+    """Découpage de l'histoire laissé par generate_story --stream (story/story.chunks.json)."""
+    return story_file.with_name(story_file.stem + ".chunks.json")
+
+def story_chunks(story_txt: str, max_chars: int, hint: pathlib.Path = None):
+    """Morceaux de phrases de l'histoire. Le découpage de generate_story --stream est repris
+    s'il correspond au texte: les synthèses préchargées dans le cache sont alors réutilisées."""
+    sentences = split_sentences(story_txt)
+    if hint is not None and hint.exists():
+        try:
+            chunks = json.loads(hint.read_text(encoding="utf-8"))
+            if [x for c in chunks for x in c] == sentences:
+                return chunks
+        except Exception:
+            pass
+    return chunk_sentences(sentences, max_chars)
+
+class Prefetcher:
+    """Synthèses lancées à l'avance (pendant la génération du texte) pour remplir le cache TTS.
+
+    Mêmes paramètres que l'étage voix par défaut (PCM, cache tts_cache): voice_elevenlabs
+    retrouve ensuite chaque segment en cache au lieu de le resynthétiser.
+    """
+    def __init__(self, concurrency: int = 3, cache_dir: pathlib.Path = None, output_format: str = PCM_FORMAT):
+        self.api_key  = os.environ.get("ELEVENLABS_API_KEY","").strip()
+        self.voice_id = os.environ.get("ELEVENLABS_VOICE_ID","").strip()
+        self.model_id = os.environ.get("ELEVENLABS_MODEL_ID","eleven_flash_v2_5").strip()
+        self.enabled = bool(self.api_key and self.voice_id)
+        self.cache_dir = cache_dir or tts_cache.CACHE_DIR
+        self.output_format = output_format
+        self.session = downloader.make_session(max(1, concurrency))
+        self.stats = tts_cache.Stats()
+        self.ex = log_context.Pool(max_workers=max(1, concurrency))
+        self.tmp = pathlib.Path(tempfile.mkdtemp(prefix="tts_prefetch_"))
+        self.futures = []
+        self.t0 = time.perf_counter()
+
+    def submit(self, name: str, text: str):
+        if not self.enabled or not text.strip():
+            return
+        at = time.perf_counter() - self.t0
+        print(f"[voice] préchargement {name} lancé à {at:.2f}s")
+        out = self.tmp / f"{name}.{len(self.futures)}.bin"
+        self.futures.append(self.ex.submit(
+            eleven_tts, text, out, self.api_key, self.voice_id, self.model_id, self.session, 4, name,
+            self.cache_dir, self.stats, self.output_format))
+
+    def wait(self) -> int:
+        """Attend les synthèses en cours; renvoie le nombre de réussites."""
+        ok = sum(1 for f in self.futures if f.result())
+        self.ex.shutdown()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        if self.futures:
+            print(f"[voice] préchargement: {ok}/{len(self.futures)} segments en cache "
+                  f"à {time.perf_counter() - self.t0:.2f}s")
+        return ok
+
+    def close(self):
+        """Abandon (texte en échec): annule les synthèses pas encore lancées, attend celles
+        en cours et supprime le répertoire temporaire."""
+        self.ex.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def _pcm_blocks(src, block: int = 1 << 20):
+    """Octets PCM d'une source: bytes, fichier .pcm brut ou WAV (lu par blocs)."""
+    if isinstance(src, (bytes, bytearray)):
+        yield bytes(src)
+    elif pathlib.Path(src).suffix.lower() == ".wav":
+        with wave.open(str(src), "rb") as w:
+            while True:
+                data = w.readframes(block // 2)
+                if not data:
+                    break
+                yield data
+    else:
+        with open(src, "rb") as f:
+            for data in iter(lambda: f.read(block), b""):
+                yield data
+
+def assemble_pcm(parts, out_path: pathlib.Path, rate: int = SAMPLE_RATE) -> tuple:
+    """Écrit out_path (WAV s16le mono) en une passe à partir de parts = [(nom|None, octets PCM ou chemin)].
+
+    Renvoie ({nom: (échantillon début, échantillon fin)}, nb total d'échantillons):
+    la timeline se déduit des comptes d'échantillons, sans arrondi de sonde.
+    """
+    ensure_dir(out_path)
+    spans, n = {}, 0
+    tmp = out_path.with_name(out_path.name + ".part")
+    with wave.open(str(tmp), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        for name, src in parts:
+            start = n
+            for data in _pcm_blocks(src):
+                data = data[:len(data) & ~1]  # échantillons entiers uniquement
+                w.writeframes(data)
+                n += len(data) // 2
+            if name:
+                spans[name] = (start, n)
+    os.replace(tmp, out_path)
+    return spans, n
+
+def trim_silence(src, rate: int = SAMPLE_RATE, threshold: int = 300, margin: float = 0.04) -> bytes:
+    """PCM de src sans les silences de début/fin (|échantillon| < threshold), en gardant margin s."""
+    data = b"".join(_pcm_blocks(src))
+    pcm = np.frombuffer(data, dtype="<i2", count=len(data) // 2)
+    loud = np.flatnonzero((pcm >= threshold) | (pcm <= -threshold))
+    if loud.size == 0:
+        return pcm.tobytes()  # rien au-dessus du seuil: inchangé
+    keep = round(margin * rate)
+    return pcm[max(0, loud[0] - keep):min(len(pcm), loud[-1] + 1 + keep)].tobytes()
+
+def silence_pcm(duration: float, rate: int = SAMPLE_RATE) -> bytes:
+    return bytes(2 * max(0, round(duration * rate)))
 
 def write_concat_list(order_paths, list_path: pathlib.Path):
     ensure_dir(list_path)
@@ -84,155 +360,240 @@ def concat_wavs(order, out_path: pathlib.Path, list_path: pathlib.Path|None):
         "ffmpeg","-nostdin","-y","-f","concat","-safe","0",
         "-i",str(internal_list),
         "-c","copy",str(out_path)
-    ], check=True)
+    ], check=True, **log_context.stdio())
 
 # -----------------------
 # CLI
 # -----------------------
-import argparse
-ap = argparse.ArgumentParser(description="Synthesize title/story/cta with ElevenLabs and write full timeline.")
-ap.add_argument("--title-file", default="story/title.txt")
-ap.add_argument("--story-file", default="story/story.txt")
-ap.add_argument("--cta-file",   default="story/cta.txt")
-
-ap.add_argument("--gap",        type=float, default=None, help="gap (s) after title and before CTA (overrides specific gaps)")
-ap.add_argument("--gap-title",  type=float, default=1.0,  help="gap (s) after title")
-ap.add_argument("--gap-cta",    type=float, default=1.0,  help="gap (s) before CTA")
-
-ap.add_argument("--out",        default="audio/voice.wav")
-ap.add_argument("--list-file",  default=None, help="(optionnel) Chemin où écrire la liste des segments WAV concaténés")
-
-args = ap.parse_args()
-
-# Harmonise gaps si --gap fourni
-if args.gap is not None:
-    args.gap_title = args.gap
-    args.gap_cta   = args.gap
-
-root = pathlib.Path(__file__).resolve().parent.parent
-t_title = root / args.title_file
-t_story = root / args.story_file
-t_cta   = root / args.cta_file
-
-out_wav = root / args.out
-audio_dir = out_wav.parent
-ensure_dir(out_wav)
-
-external_list = (root / args.list_file) if args.list_file else None
-
-title_mp3 = audio_dir / "title.mp3"
-story_mp3 = audio_dir / "story.mp3"
-cta_mp3   = audio_dir / "cta.mp3"
-title_wav = audio_dir / "title.wav"
-story_wav = audio_dir / "story.wav"
-cta_wav   = audio_dir / "cta.wav"
-gap1_wav  = audio_dir / "gap_after_title.wav"
-gap2_wav  = audio_dir / "gap_before_cta.wav"
-timeline  = audio_dir / "timeline.json"
-
-# -----------------------
-# Inputs
-# -----------------------
-title_txt = t_title.read_text(encoding="utf-8", errors="ignore") if t_title.exists() else ""
-story_txt = t_story.read_text(encoding="utf-8", errors="ignore") if t_story.exists() else ""
-cta_txt   = t_cta.read_text(encoding="utf-8", errors="ignore")   if t_cta.exists()   else ""
-
-if not story_txt.strip():
-    print("[voice] story/story.txt manquant ou vide.", file=sys.stderr)
-    sys.exit(1)
-
-# -----------------------
-# ElevenLabs creds
-# -----------------------
-api_key  = os.environ.get("ELEVENLABS_API_KEY","").strip()
-voice_id = os.environ.get("ELEVENLABS_VOICE_ID","").strip()
-model_id = os.environ.get("ELEVENLABS_MODEL_ID","eleven_flash_v2_5").strip()
-
-if not api_key or not voice_id:
-    print("[voice] ELEVENLABS_API_KEY et/ou ELEVENLABS_VOICE_ID manquants.", file=sys.stderr)
-    sys.exit(1)
-
-# -----------------------
-# TTS
-# -----------------------
-title_ok = False
-cta_ok   = False
-
-if title_txt.strip():
-    title_ok = eleven_tts(title_txt, title_mp3, api_key, voice_id, model_id)
-    if title_ok:
-        to_wav(title_mp3, title_wav)
-
-story_ok = eleven_tts(story_txt, story_mp3, api_key, voice_id, model_id)
-if not story_ok:
-    print("[voice] Échec TTS sur l'histoire.", file=sys.stderr)
-    sys.exit(1)
-to_wav(story_mp3, story_wav)
-
-if cta_txt.strip():
-    cta_ok = eleven_tts(cta_txt, cta_mp3, api_key, voice_id, model_id)
-    if cta_ok:
-        to_wav(cta_mp3, cta_wav)
-
-# Gaps
-gap_title = max(0.0, float(args.gap_title))
-gap_cta   = max(0.0, float(args.gap_cta))
-if title_ok and gap_title > 0:
-    make_silence_wav(gap1_wav, gap_title)
-if cta_ok and gap_cta > 0:
-    make_silence_wav(gap2_wav, gap_cta)
-
-# -----------------------
-# Concat order + timeline
-# -----------------------
-order = []
-segments = {}  # name -> (start,end)
-
-t = 0.0
-if title_ok:
-    order.append(title_wav)
-    d = ffprobe_duration(title_wav)
-    segments["title"] = (t, t+d)
-    t += d
-    if gap_title > 0:
-        order.append(gap1_wav); t += ffprobe_duration(gap1_wav)
-
-order.append(story_wav)
-d = ffprobe_duration(story_wav)
-segments["story"] = (t, t+d)
-t += d
-
-if cta_ok:
-    if gap_cta > 0:
-        order.append(gap2_wav); t += ffprobe_duration(gap2_wav)
-    order.append(cta_wav)
-    d = ffprobe_duration(cta_wav)
-    segments["cta"] = (t, t+d)
-    t += d
-
-# Concat + (optionnel) fichier liste externe
-concat_wavs(order, out_wav, external_list)
-total = ffprobe_duration(out_wav)
-
-# -----------------------
-# Write timeline.json
-# -----------------------
-tl = {}
-if "title" in segments:
-    s,e = segments["title"]; tl["title"] = {"start": round(s,3), "end": round(e,3)}
-if "story" in segments:
-    s,e = segments["story"]; tl["story"] = {"start": round(s,3), "end": round(e,3)}
-if "cta" in segments:
-    s,e = segments["cta"];   tl["cta"]   = {"start": round(s,3), "end": round(e,3)}
-tl["gaps"]  = {"title_after": round(gap_title,3), "cta_before": round(gap_cta,3)}
-tl["total"] = round(total,3)
-
-ensure_dir(timeline)
-timeline.write_text(json.dumps(tl, ensure_ascii=False, indent=2), encoding="utf-8")
-
-print(f"[voice] OK -> {out_wav} (total ~{total:.2f}s)")
-print(f"[voice] timeline -> {timeline}")
-for k in ("title","story","cta"):
-    if k in tl: print(f"[voice] {k}: {tl[k]['start']}→{tl[k]['end']}")
-if external_list:
-    print(f"[voice] list-file -> {external_list}")
+def main(argv=None, session: requests.Session = None):
+    """argv: arguments (défaut sys.argv); session: session HTTP partagée par l'appelant (batch)."""
+    import argparse
+    ap = argparse.ArgumentParser(description="Synthesize title/story/cta with ElevenLabs and write full timeline.")
+    ap.add_argument("--title-file", default="story/title.txt")
+    ap.add_argument("--story-file", default="story/story.txt")
+    ap.add_argument("--cta-file",   default="story/cta.txt")
+
+    ap.add_argument("--gap",        type=float, default=None, help="gap (s) after title and before CTA (overrides specific gaps)")
+    ap.add_argument("--gap-title",  type=float, default=1.0,  help="gap (s) after title")
+    ap.add_argument("--gap-cta",    type=float, default=1.0,  help="gap (s) before CTA")
+
+    ap.add_argument("--out",        default="audio/voice.wav")
+    ap.add_argument("--list-file",  default=None, help="(optionnel) Chemin où écrire la liste des segments WAV concaténés")
+    ap.add_argument("--tts-concurrency", type=int, default=int(os.environ.get("ELEVENLABS_CONCURRENCY", "3")),
+                    help="Requêtes TTS simultanées au plus")
+    ap.add_argument("--tts-retries", type=int, default=4, help="Nouveaux essais sur 429/5xx (backoff, Retry-After)")
+    ap.add_argument("--tts-cache-dir", default=str(tts_cache.CACHE_DIR), help="Cache des synthèses (par contenu)")
+    ap.add_argument("--tts-cache-mb", type=float, default=256.0, help="Budget disque du cache TTS (LRU)")
+    ap.add_argument("--no-tts-cache", action="store_true", help="Toujours appeler l'API")
+    ap.add_argument("--assembly", choices=["pcm", "ffmpeg"], default="pcm",
+                    help="pcm: PCM demandé à l'API et assemblé en Python (défaut); ffmpeg: MP3 + conversions + concat")
+    ap.add_argument("--chunk-chars", type=int, default=1500,
+                    help="Histoire découpée aux fins de phrase en morceaux < N caractères, synthétisés en parallèle "
+                         "(assemblage pcm; 0 = une seule requête)")
+    ap.add_argument("--sentence-gap", type=float, default=0.25,
+                    help="Silence (s) inséré entre deux morceaux de l'histoire, après rognage de leurs silences")
+    ap.add_argument("--stream", action="store_true",
+                    help="Endpoint /stream: chaque segment écrit en WAV au fil de l'eau (implique --assembly pcm)")
+
+    args = ap.parse_args(argv)
+
+    # Harmonise gaps si --gap fourni
+    if args.gap is not None:
+        args.gap_title = args.gap
+        args.gap_cta   = args.gap
+
+    root = pathlib.Path(__file__).resolve().parent.parent
+    t_title = root / args.title_file
+    t_story = root / args.story_file
+    t_cta   = root / args.cta_file
+
+    out_wav = root / args.out
+    audio_dir = out_wav.parent
+    ensure_dir(out_wav)
+
+    external_list = (root / args.list_file) if args.list_file else None
+
+    pcm = args.assembly == "pcm" or args.stream
+    stream = args.stream
+    title_wav = audio_dir / "title.wav"
+    story_wav = audio_dir / "story.wav"
+    cta_wav   = audio_dir / "cta.wav"
+    gap1_wav  = audio_dir / "gap_after_title.wav"
+    gap2_wav  = audio_dir / "gap_before_cta.wav"
+    timeline  = audio_dir / "timeline.json"
+
+    # -----------------------
+    # Inputs
+    # -----------------------
+    title_txt = t_title.read_text(encoding="utf-8", errors="ignore") if t_title.exists() else ""
+    story_txt = t_story.read_text(encoding="utf-8", errors="ignore") if t_story.exists() else ""
+    cta_txt   = t_cta.read_text(encoding="utf-8", errors="ignore")   if t_cta.exists()   else ""
+
+    if not story_txt.strip():
+        print("[voice] story/story.txt manquant ou vide.", file=sys.stderr)
+        sys.exit(1)
+
+    # -----------------------
+    # ElevenLabs creds
+    # -----------------------
+    api_key  = os.environ.get("ELEVENLABS_API_KEY","").strip()
+    voice_id = os.environ.get("ELEVENLABS_VOICE_ID","").strip()
+    model_id = os.environ.get("ELEVENLABS_MODEL_ID","eleven_flash_v2_5").strip()
+
+    if not api_key or not voice_id:
+        print("[voice] ELEVENLABS_API_KEY et/ou ELEVENLABS_VOICE_ID manquants.", file=sys.stderr)
+        sys.exit(1)
+
+    # -----------------------
+    # TTS
+    # -----------------------
+    # Titre, histoire et CTA sont indépendants: synthèse concurrente, ordre conservé ensuite.
+    # En pcm, l'histoire est découpée aux fins de phrase: chaque morceau est une requête.
+    # Format pcm_* refusé par l'API (abonnement): seuls les segments refusés sont
+    # resynthétisés en MP3 puis décodés en PCM; ceux déjà obtenus en PCM sont gardés.
+    ext = ".wav" if stream else ".pcm" if pcm else ".mp3"
+    title_mp3 = audio_dir / f"title{ext}"
+    story_mp3 = audio_dir / f"story{ext}"
+    cta_mp3   = audio_dir / f"cta{ext}"
+    chunks = story_chunks(story_txt, args.chunk_chars, chunks_hint_path(t_story)) if pcm else []
+    if len(chunks) > 1:
+        story_jobs = [(f"story_{k:02d}", " ".join(c), audio_dir / f"story_{k:02d}{ext}", None)
+                      for k, c in enumerate(chunks)]
+        print(f"[voice] histoire: {len(chunks)} morceaux (< {args.chunk_chars} caractères)")
+    else:
+        story_jobs = [("story", " ".join(chunks[0]) if chunks else story_txt, story_mp3, story_wav)]
+        chunks = chunks or [split_sentences(story_txt)]
+    jobs = [("title", title_txt, title_mp3, title_wav), *story_jobs, ("cta", cta_txt, cta_mp3, cta_wav)]
+    cache = None if args.no_tts_cache else pathlib.Path(args.tts_cache_dir)
+    rejected = {}
+    ok = synthesize_all(jobs, api_key, voice_id, model_id, args.tts_concurrency, args.tts_retries,
+                        cache, args.tts_cache_mb, PCM_FORMAT if pcm else OUTPUT_FORMAT, stream, rejected, session)
+    if pcm and rejected:
+        print(f"[voice] {PCM_FORMAT} refusé (HTTP {', '.join(sorted({str(c) for c in rejected.values()}))}) "
+              f"pour {', '.join(sorted(rejected))}: repli MP3 décodé en PCM", file=sys.stderr)
+        retry = [(n, txt, path.with_suffix(".fallback.mp3"), None) for n, txt, path, _ in jobs if n in rejected]
+        again = synthesize_all(retry, api_key, voice_id, model_id, args.tts_concurrency, args.tts_retries,
+                               cache, args.tts_cache_mb, OUTPUT_FORMAT, False, None, session)
+        for (n, _, mp3, _), (_, _, dst, _) in zip(retry, [j for j in jobs if j[0] in rejected]):
+            if again[n]:
+                decode_pcm(mp3, dst)
+            ok[n] = again[n]
+    title_ok, cta_ok = ok["title"], ok["cta"]
+    story_ok = all(ok[j[0]] for j in story_jobs)
+
+    if not story_ok:
+        print("[voice] Échec TTS sur l'histoire.", file=sys.stderr)
+        sys.exit(1)
+
+    gap_title = max(0.0, float(args.gap_title))
+    gap_cta   = max(0.0, float(args.gap_cta))
+    segments = {}  # name -> (start,end)
+    sentences = [] # phrases de l'histoire, assemblage pcm seulement
+    samples = {}   # name -> (échantillon début, fin), assemblage pcm seulement
+
+    if pcm:
+        # -----------------------
+        # Assemblage en Python: un seul WAV écrit par blocs, aucun sous-processus
+        # -----------------------
+        parts = []
+        if title_ok:
+            parts.append(("title", title_mp3))
+            if gap_title > 0:
+                parts.append((None, silence_pcm(gap_title)))
+        for k, (name, _, path, _) in enumerate(story_jobs):
+            if k:
+                parts.append((None, silence_pcm(args.sentence_gap)))
+            parts.append((name, trim_silence(path) if len(story_jobs) > 1 else path))
+        if cta_ok:
+            if gap_cta > 0:
+                parts.append((None, silence_pcm(gap_cta)))
+            parts.append(("cta", cta_mp3))
+        spans, n = assemble_pcm(parts, out_wav)
+        samples = {k: spans[k] for k in ("title", "cta") if k in spans}
+        samples["story"] = (spans[story_jobs[0][0]][0], spans[story_jobs[-1][0]][1])
+        segments = {k: (a / SAMPLE_RATE, b / SAMPLE_RATE) for k, (a, b) in samples.items()}
+        total = n / SAMPLE_RATE
+        # bornes par phrase: exactes aux frontières de morceaux; dedans, réparties au prorata
+        # des caractères et marquées "estimate" (build_ass ne garde que les bornes exactes)
+        sentences = []
+        for (name, _, _, _), chunk in zip(story_jobs, chunks):
+            a, b = spans[name]
+            weights = [max(1, len(x)) for x in chunk]
+            acc = 0
+            for k, (x, w) in enumerate(zip(chunk, weights)):
+                s0 = a + (b - a) * acc // sum(weights)
+                acc += w
+                s1 = a + (b - a) * acc // sum(weights)
+                sentences.append({"text": x, "start": round(s0 / SAMPLE_RATE, 3), "end": round(s1 / SAMPLE_RATE, 3),
+                                  "start_sample": s0, "end_sample": s1, "estimate": k > 0})
+        if external_list:
+            print("[voice] --list-file ignoré (assemblage pcm, pas de segments WAV)")
+            external_list = None
+    else:
+        # Gaps
+        if title_ok and gap_title > 0:
+            make_silence_wav(gap1_wav, gap_title)
+        if cta_ok and gap_cta > 0:
+            make_silence_wav(gap2_wav, gap_cta)
+
+        # -----------------------
+        # Concat order + timeline
+        # -----------------------
+        order = []
+        t = 0.0
+        if title_ok:
+            order.append(title_wav)
+            d = media_probe.duration(title_wav)
+            segments["title"] = (t, t+d)
+            t += d
+            if gap_title > 0:
+                order.append(gap1_wav); t += media_probe.duration(gap1_wav)
+
+        order.append(story_wav)
+        d = media_probe.duration(story_wav)
+        segments["story"] = (t, t+d)
+        t += d
+
+        if cta_ok:
+            if gap_cta > 0:
+                order.append(gap2_wav); t += media_probe.duration(gap2_wav)
+            order.append(cta_wav)
+            d = media_probe.duration(cta_wav)
+            segments["cta"] = (t, t+d)
+            t += d
+
+        # Concat + (optionnel) fichier liste externe
+        concat_wavs(order, out_wav, external_list)
+        total = media_probe.duration(out_wav)
+
+    # -----------------------
+    # Write timeline.json
+    # -----------------------
+    tl = {}
+    if "title" in segments:
+        s,e = segments["title"]; tl["title"] = {"start": round(s,3), "end": round(e,3)}
+    if "story" in segments:
+        s,e = segments["story"]; tl["story"] = {"start": round(s,3), "end": round(e,3)}
+    if "cta" in segments:
+        s,e = segments["cta"];   tl["cta"]   = {"start": round(s,3), "end": round(e,3)}
+    for k, (a, b) in samples.items():
+        tl[k].update({"start_sample": a, "end_sample": b})
+    if sentences:
+        tl["story"]["sentences"] = sentences
+    tl["gaps"]  = {"title_after": round(gap_title,3), "cta_before": round(gap_cta,3)}
+    tl["total"] = round(total,3)
+    if samples:
+        tl["sample_rate"] = SAMPLE_RATE
+
+    ensure_dir(timeline)
+    timeline.write_text(json.dumps(tl, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"[voice] OK -> {out_wav} (total ~{total:.2f}s)")
+    print(f"[voice] timeline -> {timeline}")
+    for k in ("title","story","cta"):
+        if k in tl: print(f"[voice] {k}: {tl[k]['start']}→{tl[k]['end']}")
+    if external_list:
+        print(f"[voice] list-file -> {external_list}")
+
+if __name__ == "__main__":
+    main()
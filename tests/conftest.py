@@ -0,0 +1,4 @@
+import pathlib, sys
+
+# les scripts s'importent entre eux par leur nom (python scripts/x.py)
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "scripts"))
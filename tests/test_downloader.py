@@ -0,0 +1,114 @@
+"""downloader.fetch contre un serveur HTTP local (http.server): reprise, If-Range, 416, clé ETag."""
+import http.server, threading
+
+import pytest
+
+import downloader
+
+BODY = bytes(range(256)) * 40  # 10 240 octets
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    body = BODY
+    etag = '"v1"'
+    head_length = True  # Content-Length dans la réponse au HEAD
+    requests = []
+
+    def log_message(self, *a):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        if self.head_length:
+            self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+
+    def do_GET(self):
+        rng = self.headers.get("Range")
+        Handler.requests.append((rng, self.headers.get("If-Range")))
+        if_range = self.headers.get("If-Range")
+        if rng and (if_range is None or if_range == self.etag):
+            start = int(rng.split("=")[1].rstrip("-"))
+            if start >= len(self.body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(self.body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = self.body[start:]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(self.body) - 1}/{len(self.body)}")
+        else:
+            data = self.body
+            self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+@pytest.fixture
+def server():
+    Handler.body, Handler.etag, Handler.head_length, Handler.requests = BODY, '"v1"', True, []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/clip.mp4"
+    httpd.shutdown()
+    httpd.server_close()
+
+def _part(tmp_path, url):
+    etag, length = downloader.remote_info(downloader.make_session(), url)
+    dst = tmp_path / f"{downloader.cache_key(url, etag, length)[:32]}.mp4"
+    return dst, dst.with_name(dst.name + ".part")
+
+def test_download_then_cache_hit(server, tmp_path):
+    s, stats = downloader.make_session(), downloader.Stats()
+    p = downloader.fetch(s, server, tmp_path, stats)
+    assert p.read_bytes() == BODY
+    assert downloader.fetch(s, server, tmp_path, stats) == p
+    assert (stats.downloads, stats.hits) == (1, 1)
+    assert len(Handler.requests) == 1
+    assert not list(tmp_path.glob("*.part"))
+
+def test_resume_with_range_and_if_range(server, tmp_path):
+    dst, part = _part(tmp_path, server)
+    part.write_bytes(BODY[:3000])
+    stats = downloader.Stats()
+    p = downloader.fetch(downloader.make_session(), server, tmp_path, stats)
+    assert p == dst and p.read_bytes() == BODY
+    assert Handler.requests == [("bytes=3000-", '"v1"')]
+    assert (stats.resumed, stats.bytes) == (1, len(BODY) - 3000)
+    assert not part.exists()
+
+def test_stale_partial_is_replaced_when_if_range_fails(server, tmp_path, monkeypatch):
+    dst, part = _part(tmp_path, server)
+    part.write_bytes(b"x" * 3000)
+    Handler.etag = '"v2"'  # changé entre le HEAD et le GET: le serveur renvoie le fichier entier
+    monkeypatch.setattr(downloader, "remote_info", lambda s, u: ('"v1"', len(BODY)))
+    stats = downloader.Stats()
+    p = downloader.fetch(downloader.make_session(), server, tmp_path, stats)
+    assert p == dst and p.read_bytes() == BODY
+    assert stats.resumed == 0
+
+def test_416_accepts_complete_partial(server, tmp_path):
+    Handler.head_length = False  # taille inconnue avant le GET: le partiel complet reçoit un 416
+    dst, part = _part(tmp_path, server)
+    part.write_bytes(BODY)
+    p = downloader.fetch(downloader.make_session(), server, tmp_path, downloader.Stats())
+    assert p == dst and p.read_bytes() == BODY
+    assert Handler.requests == [(f"bytes={len(BODY)}-", '"v1"')]
+
+def test_416_restarts_oversized_partial(server, tmp_path):
+    Handler.head_length = False
+    dst, part = _part(tmp_path, server)
+    part.write_bytes(BODY + b"trailing junk")
+    p = downloader.fetch(downloader.make_session(), server, tmp_path, downloader.Stats())
+    assert p.read_bytes() == BODY
+    assert Handler.requests[-1] == (None, None)
+
+def test_new_etag_gives_new_entry(server, tmp_path):
+    s = downloader.make_session()
+    first = downloader.fetch(s, server, tmp_path, downloader.Stats())
+    Handler.etag, Handler.body = '"v2"', BODY[::-1]
+    second = downloader.fetch(s, server, tmp_path, downloader.Stats())
+    assert first != second
+    assert first.read_bytes() == BODY and second.read_bytes() == BODY[::-1]
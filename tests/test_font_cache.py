@@ -0,0 +1,40 @@
+"""font_cache: polices du fichier ASS, copie unique et fonts.conf limité au répertoire en cache."""
+import xml.etree.ElementTree as ET
+
+import font_cache
+
+ASS = """[Script Info]
+ScriptType: v4.00+
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize
+Style: Default,DejaVu Sans,64
+Style: Title,@Creepster,80
+
+[Events]
+Format: Layer, Start, End, Style, Text
+Dialogue: 0,0:00:00.00,0:00:01.00,Default,{\\\\fnImpact}Bouh
+"""
+
+def test_fonts_conf_only_lists_cached_dir(tmp_path, monkeypatch):
+    ass = tmp_path / "captions.ass"
+    ass.write_text(ASS, encoding="utf-8")
+    fonts = tmp_path / "system"
+    fonts.mkdir()
+    for n in ("DejaVuSans.ttf", "Creepster.ttf", "Impact.ttf"):
+        (fonts / n).write_bytes(b"font")
+    calls = []
+    def resolve(name):
+        calls.append(name)
+        return fonts / (name.replace(" ", "") + ".ttf")
+    monkeypatch.setattr(font_cache, "resolve", resolve)
+
+    assert font_cache.ass_fonts(ass) == ["Creepster", "DejaVu Sans", "Impact"]
+    d = font_cache.fontsdir(ass, tmp_path / "cache")
+    assert sorted(p.name for p in d.iterdir() if p.suffix == ".ttf") == ["Creepster.ttf", "DejaVuSans.ttf", "Impact.ttf"]
+    root = ET.parse(font_cache.conf_path(d)).getroot()
+    assert [e.text for e in root.iter("dir")] == [d.resolve().as_posix()]
+    assert font_cache.env(d, {})["FONTCONFIG_FILE"] == str(font_cache.conf_path(d))
+
+    assert font_cache.fontsdir(ass, tmp_path / "cache") == d
+    assert len(calls) == 3  # deuxième appel: aucun fc-match
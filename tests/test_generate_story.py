@@ -0,0 +1,65 @@
+"""JsonFieldStream sur une réponse SSE découpée à des endroits arbitraires (serveur HTTP local)."""
+import http.server, json, threading
+
+import pytest
+
+import generate_story
+
+DOC = {"title": "La \"porte\" d'en bas", "count": [1, {"x": "}"}],
+       "story": "Elle grinçait.\nPuis plus rien… \U0001F47B \\ fin.", "cta": "Abonne-toi / partage"}
+RAW = json.dumps(DOC)  # échappements \" \n \\ et \uXXXX (ensure_ascii), paire de substituts comprise
+
+def _parse(pieces):
+    p = generate_story.JsonFieldStream()
+    events = [e for piece in pieces for e in p.feed(piece)]
+    done = {k: v for kind, k, v in events if kind == "done"}
+    deltas = {}
+    for kind, k, v in events:
+        if kind == "delta":
+            deltas[k] = deltas.get(k, "") + v
+    return done, deltas
+
+def _expected():
+    return {k: v for k, v in DOC.items() if isinstance(v, str)}
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_fields_survive_any_split(size):
+    done, deltas = _parse(RAW[i:i + size] for i in range(0, len(RAW), size))
+    assert done == _expected()
+    assert deltas == _expected()
+
+def test_surrogate_pair_split_between_chunks():
+    raw = json.dumps({"story": "\U0001F47B"})  # "👻"
+    cut = raw.index("\\udc")
+    done, _ = _parse([raw[:cut - 2], raw[cut - 2:cut + 3], raw[cut + 3:]])
+    assert done == {"story": "\U0001F47B"}
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *a):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        events = b"".join(
+            b"data: " + json.dumps({"choices": [{"delta": {"content": RAW[i:i + 3]}}]}).encode() + b"\n\n"
+            for i in range(0, len(RAW), 3)) + b"data: [DONE]\n\n"
+        for i in range(0, len(events), 11):  # lignes SSE coupées entre deux écritures réseau
+            self.wfile.write(events[i:i + 11])
+            self.wfile.flush()
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(generate_story, "API_BASE", f"http://127.0.0.1:{httpd.server_address[1]}")
+    yield
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_stream_openai_over_split_sse(server):
+    done, deltas = _parse(generate_story.stream_openai("sys", "user"))
+    assert done == _expected()
+    assert deltas == _expected()
@@ -0,0 +1,137 @@
+"""mp4_remote contre un serveur HTTP local gérant Range: plages lues, coupes (ctts, elst), éviction."""
+import http.server, struct, threading
+
+import pytest
+
+import disk_cache
+import mp4_remote
+
+N, DELTA, TIMESCALE, SIZE, GOP = 60, 100, 1000, 1000, 12  # 10 fps, 6 s, image clé toutes les 1,2 s
+
+def box(typ: str, *payload: bytes) -> bytes:
+    data = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(data), typ.encode("latin-1")) + data
+
+def full(typ: str, *payload: bytes, version: int = 0) -> bytes:
+    return box(typ, struct.pack(">I", version << 24), *payload)
+
+def make_mp4(ctts=None, edits=None) -> bytes:
+    """MP4 vidéo minimal: N échantillons de SIZE octets (contenu non nul), 10 par chunk."""
+    samples = [bytes([k % 250 + 1]) * SIZE for k in range(N)]
+    ftyp = box("ftyp", b"isom", struct.pack(">I", 512), b"isomavc1")
+    mdat_start = len(ftyp) + 8
+    chunks = [mdat_start + c * 10 * SIZE for c in range(N // 10)]
+    stbl = [
+        full("stsd", struct.pack(">I", 1), box("avc1")),
+        full("stts", struct.pack(">III", 1, N, DELTA)),
+        full("stss", struct.pack(">I", N // GOP), *(struct.pack(">I", k + 1) for k in range(0, N, GOP))),
+        full("stsc", struct.pack(">IIII", 1, 1, 10, 1)),
+        full("stsz", struct.pack(">II", 0, N), *(struct.pack(">I", SIZE) for _ in range(N))),
+        full("stco", struct.pack(">I", len(chunks)), *(struct.pack(">I", o) for o in chunks)),
+    ]
+    if ctts:
+        stbl.append(full("ctts", struct.pack(">I", len(ctts)), *(struct.pack(">Ii", 1, o) for o in ctts)))
+    trak = [full("tkhd", bytes(76), struct.pack(">II", 1080 << 16, 1920 << 16))]
+    if edits:
+        trak.append(box("edts", full("elst", struct.pack(">I", len(edits)),
+                                     *(struct.pack(">Iii", d, m, 1 << 16) for d, m in edits))))
+    trak.append(box("mdia",
+                    full("mdhd", bytes(8), struct.pack(">II", TIMESCALE, N * DELTA), bytes(4)),
+                    full("hdlr", bytes(4), b"vide", bytes(13)),
+                    box("minf", box("stbl", *stbl))))
+    moov = box("moov", full("mvhd", bytes(8), struct.pack(">II", TIMESCALE, N * DELTA), bytes(80)), box("trak", *trak))
+    return ftyp + box("mdat", *samples) + moov
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    body = b""
+    ranges = []
+
+    def log_message(self, *a):
+        pass
+
+    def do_GET(self):
+        a, _, b = self.headers["Range"].split("=")[1].partition("-")
+        a, b = int(a), min(int(b) if b else len(self.body) - 1, len(self.body) - 1)
+        Handler.ranges.append((a, b))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {a}-{b}/{len(self.body)}")
+        self.send_header("Content-Length", str(b + 1 - a))
+        self.send_header("ETag", '"clip"')
+        self.end_headers()
+        self.wfile.write(self.body[a:b + 1])
+
+@pytest.fixture
+def serve():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def _serve(body: bytes) -> str:
+        Handler.body, Handler.ranges = body, []
+        return f"http://127.0.0.1:{httpd.server_address[1]}/clip.mp4"
+    yield _serve
+    httpd.shutdown()
+    httpd.server_close()
+
+def _track(url):
+    return next(t for t in mp4_remote.read_moov(mp4_remote.RangeReader(url))[2] if t["handler"] == "vide")
+
+def _present(path, body, v):
+    """Indices des échantillons présents (octets identiques à l'original) dans le fichier creux."""
+    data = path.read_bytes()
+    return {k for k, (o, n) in enumerate(zip(v["offsets"], v["sizes"])) if data[o:o + n] == body[o:o + n]}
+
+def test_probe_reads_only_headers(serve):
+    body = make_mp4()
+    info = mp4_remote.probe(serve(body))
+    assert (info["duration"], info["fps"], info["keyframes"]) == (6.0, 10.0, N // GOP)
+    assert (info["width"], info["height"]) == (1080, 1920)
+    assert info["remote_bytes"] < len(body) - N * SIZE + 200
+
+def test_fetch_range_reads_covering_gops_only(serve, tmp_path):
+    body = make_mp4()
+    url = serve(body)
+    v = _track(url)
+    path, nbytes = mp4_remote.fetch_range(url, 2.5, 1.0, tmp_path)
+    # images clés 24 (2,4 s) et 36 (3,6 s): échantillons 24..36 inclus
+    lo, hi = v["offsets"][24], v["offsets"][36] + SIZE
+    assert (lo, hi - 1) in Handler.ranges
+    assert _present(path, body, v) == set(range(24, 37))
+    assert path.stat().st_size == len(body)
+    assert nbytes < len(body) / 3
+    # durée coupée: la sous-plage [2,5 s; 3,5 s) est entièrement couverte
+    assert v["pts"][24] <= 2.5 and v["pts"][36] >= 3.5
+    # second appel: plages déjà présentes, aucun octet d'échantillon retéléchargé
+    Handler.ranges = []
+    mp4_remote.fetch_range(url, 2.6, 0.5, tmp_path)
+    assert not any(a <= lo < b for a, b in Handler.ranges)
+
+def test_ctts_and_edit_list_give_presentation_times(serve, tmp_path):
+    # I P B B: présentation = décodage + [1, 3, 0, 0] images, édition à media_time = 1 image
+    body = make_mp4(ctts=[DELTA, 3 * DELTA, 0, 0] * (N // 4), edits=[(N * DELTA, DELTA)])
+    url = serve(body)
+    v = _track(url)
+    assert sorted(round(t, 6) for t in v["pts"]) == [round(k * 0.1, 6) for k in range(N)]
+    assert v["pts"][1] == pytest.approx(0.3) and v["pts"][2] == pytest.approx(0.1)
+    path, _ = mp4_remote.fetch_range(url, 2.45, 1.0, tmp_path)
+    needed = {k for k, t in enumerate(v["pts"]) if 2.4 - 1e-6 <= t < 3.45}
+    assert needed <= _present(path, body, v)
+
+def test_leading_empty_edit_shifts_presentation(serve):
+    v = _track(serve(make_mp4(edits=[(500, -1), (N * DELTA, 0)])))
+    assert v["pts"][0] == pytest.approx(0.5) and v["pts"][10] == pytest.approx(1.5)
+
+def test_multi_segment_edit_list_is_unsupported(serve, tmp_path):
+    url = serve(make_mp4(edits=[(1000, 0), (1000, 3000)]))
+    with pytest.raises(mp4_remote.Unsupported):
+        mp4_remote.fetch_range(url, 0.0, 1.0, tmp_path)
+
+def test_evict_counts_allocated_bytes_and_drops_ranges(serve, tmp_path):
+    url = serve(make_mp4())
+    a, _ = mp4_remote.fetch_range(url, 0.0, 1.0, tmp_path)
+    b, _ = mp4_remote.fetch_range(url + "?v=2", 3.0, 1.0, tmp_path)
+    assert a != b
+    budget = disk_cache.allocated(b.stat()) / (1024 * 1024) + 0.001
+    assert mp4_remote.evict(tmp_path, budget, keep=[b]) == 1
+    assert not a.exists() and b.exists()
+    assert not a.with_name(a.name + ".ranges.json").exists()
+    assert b.with_name(b.name + ".ranges.json").exists()
@@ -0,0 +1,119 @@
+"""StreamWavWriter avec des morceaux de taille impaire, directement et via eleven_tts --stream (serveur local);
+synthesize_all contre un serveur qui répond 429 puis 200 après des délais aléatoires."""
+import http.server, json, random, threading, time, wave
+
+import numpy as np
+import pytest
+
+import voice_elevenlabs
+
+PCM = np.arange(-3000, 3000, 3, dtype="<i2").tobytes()  # 2 000 échantillons s16le
+
+def _frames(path):
+    with wave.open(str(path), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, voice_elevenlabs.SAMPLE_RATE)
+        return w.readframes(w.getnframes())
+
+@pytest.mark.parametrize("size", [1, 3, 7, 333, 4095])
+def test_odd_chunks_keep_samples_aligned(tmp_path, size):
+    out = tmp_path / "seg.wav"
+    with voice_elevenlabs.StreamWavWriter(out) as w:
+        for i in range(0, len(PCM), size):
+            w.write(PCM[i:i + size])
+            assert w.frames == (i + len(PCM[i:i + size])) // 2
+    assert _frames(out) == PCM
+
+def test_header_readable_while_writing(tmp_path):
+    out = tmp_path / "seg.wav"
+    with voice_elevenlabs.StreamWavWriter(out) as w:
+        w.write(PCM[:1001])  # dernier octet reporté
+        assert _frames(out) == PCM[:1000]
+        w.write(PCM[1001:])
+    assert _frames(out) == PCM
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *a):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/pcm")
+        self.end_headers()
+        for i in range(0, len(PCM), 999):  # morceaux réseau impairs
+            self.wfile.write(PCM[i:i + 999])
+            self.wfile.flush()
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(voice_elevenlabs, "API_BASE", f"http://127.0.0.1:{httpd.server_address[1]}")
+    yield
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_eleven_tts_stream_writes_wav(server, tmp_path):
+    out = tmp_path / "story.wav"
+    fmt = f"pcm_{voice_elevenlabs.SAMPLE_RATE}"
+    assert voice_elevenlabs.eleven_tts("Bonsoir.", out, "key", "voice", "model", retries=0,
+                                       output_format=fmt, stream=True)
+    assert _frames(out) == PCM
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    """429 (Retry-After: 0) au premier appel de chaque texte, puis 200 après un délai aléatoire.
+    Le PCM renvoyé encode le texte: un segment écrit dans le mauvais fichier se voit."""
+    lock = threading.Lock()
+    calls, inflight, max_inflight = {}, 0, 0
+    rng = random.Random(11)
+
+    def log_message(self, *a):
+        pass
+
+    def do_POST(self):
+        text = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["text"]
+        cls = FlakyHandler
+        with cls.lock:
+            cls.calls[text] = cls.calls.get(text, 0) + 1
+            first = cls.calls[text] == 1
+            cls.inflight += 1
+            cls.max_inflight = max(cls.max_inflight, cls.inflight)
+            delay = cls.rng.uniform(0.0, 0.05)
+        try:
+            time.sleep(delay)
+            if first:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = text.encode("utf-8").ljust(64, b"\0")
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/pcm")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.inflight -= 1
+
+@pytest.fixture
+def flaky_server(monkeypatch):
+    FlakyHandler.calls, FlakyHandler.inflight, FlakyHandler.max_inflight = {}, 0, 0
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(voice_elevenlabs, "API_BASE", f"http://127.0.0.1:{httpd.server_address[1]}")
+    yield FlakyHandler
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_synthesize_all_retries_429_within_concurrency(flaky_server, tmp_path):
+    concurrency = 2
+    jobs = [(f"seg{i}", f"Phrase numéro {i}.", tmp_path / f"seg{i}.pcm", None) for i in range(7)]
+    res = voice_elevenlabs.synthesize_all(jobs, "key", "voice", "model", concurrency=concurrency, retries=2,
+                                          output_format=f"pcm_{voice_elevenlabs.SAMPLE_RATE}")
+    assert list(res.items()) == [(name, True) for name, *_ in jobs]
+    for _, text, out, _ in jobs:
+        assert out.read_bytes().rstrip(b"\0").decode("utf-8") == text
+    assert flaky_server.calls == {text: 2 for _, text, *_ in jobs}  # un seul nouvel essai par segment
+    assert 1 <= flaky_server.max_inflight <= concurrency